@@ -0,0 +1,377 @@
+"""Drive the app headlessly with concurrent sessions and measure it under load.
+
+    python -m benchmarks.load                                  # every scenario, 1 and 8 sessions
+    python -m benchmarks.load --sessions 4 16 32 --scenarios view
+    python -m benchmarks.load --size 5000 --workspaces 4 --json load.json
+
+Each simulated session is a Streamlit ``AppTest`` of ``main.py`` on its
+own thread, as browser tabs connected to one server would be: sessions
+share the process and its cached resources (the workspace pool with its
+entry writers, the render cache) but each has its own session state. A
+scenario is a mix of actions every session draws at random, with a fixed
+seed:
+
+    write   fill in and save a new entry on Write Entry
+    view    open, or reload, View Entries
+    stats   open, or reload, Statistics
+
+Every session makes one unmeasured first run, then ``--actions`` actions
+as fast as it can. Each scenario and session count runs in a fresh
+Python process on a fresh copy of a synthetic diary, so caches, memory
+and the store start out the same. The report gives the p50 and p99
+latency of an action, overall and by kind, the actions per second of all
+sessions together, and the process's resident memory before the
+sessions started, at its peak and at the end.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import BASE_TAGS, generate_entries, make_content
+
+APP_FILE = Path(__file__).resolve().parent.parent / "main.py"
+PASSKEY = "benchmark"
+DEFAULT_SESSIONS = [1, 8]
+
+# Share of each action in a scenario
+SCENARIOS = {
+    "write": {"write": 0.7, "view": 0.2, "stats": 0.1},
+    "view": {"write": 0.1, "view": 0.8, "stats": 0.1},
+    "stats": {"write": 0.1, "view": 0.2, "stats": 0.7},
+    "mixed": {"write": 0.34, "view": 0.33, "stats": 0.33},
+}
+
+ACTIONS = {}
+
+
+def action(name):
+    """Register ``run(session)``, which performs one user action on ``session.app``"""
+    def register(run):
+        ACTIONS[name] = run
+        return run
+    return register
+
+
+# --- Actions ---
+def _show_page(app, page):
+    """Rerun on ``page``, switching to it first if needed"""
+    radio = app.radio(key="page_radio")
+    if radio.value != page:
+        # The radio's index follows session_state['page'], which changes the
+        # widget and drops a plain click; set both, as redirect_to_view does
+        app.session_state['page'] = page
+        radio.set_value(page)
+    app.run()
+
+
+@action("write")
+def write_action(session):
+    app = session.app
+    if app.radio(key="page_radio").value != "Write Entry":
+        _show_page(app, "Write Entry")
+    app.text_input(key="write_title").input(f"Load test {session.index}-{len(session.timings) + 1}")
+    app.text_area(key="write_content").input(make_content(session.rng, session.content_words))
+    app.text_input(key="write_passkey").input(PASSKEY)
+    app.multiselect(key="write_tags").select(session.rng.choice(BASE_TAGS))
+    next(button for button in app.button if button.label == "Save Entry").click().run()
+
+
+@action("view")
+def view_action(session):
+    _show_page(session.app, "View Entries")
+
+
+@action("stats")
+def stats_action(session):
+    _show_page(session.app, "Statistics")
+
+
+# --- Sessions ---
+@contextlib.contextmanager
+def shared_app_runtime():
+    """Let ``AppTest`` runs overlap on several threads
+
+    ``AppTest`` installs a stand-in for Streamlit's process-wide runtime
+    and config around every run and removes them afterwards, which pulls
+    them from under any run still going on another thread. Here one
+    stand-in is installed for the whole load test instead.
+    """
+    from unittest import mock
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+    from streamlit.testing.v1.util import patch_config_options
+
+    runtime = mock.MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    with patch_config_options({"global.appTest": True}), \
+            mock.patch.object(Runtime, "_instance", runtime), \
+            mock.patch.object(app_test, "Runtime", types.SimpleNamespace()), \
+            mock.patch.object(app_test, "patch_config_options", lambda options: contextlib.nullcontext()):
+        yield
+
+
+class Session:
+    """One simulated user: an ``AppTest`` of the app and the timings of its actions"""
+
+    def __init__(self, index, workspace=None, seed=42, content_words=150, timeout=120):
+        from streamlit.testing.v1 import AppTest
+        self.index = index
+        self.rng = random.Random(f"{seed}-{index}")
+        self.content_words = content_words
+        self.app = AppTest.from_file(str(APP_FILE), default_timeout=timeout)
+        if workspace is not None:
+            # Signed in already, as after choose_workspace()
+            self.app.session_state['workspace'] = workspace
+        self.first_run = None
+        self.timings = []
+        self.errors = []
+
+    def start(self):
+        started = time.perf_counter()
+        self._attempt("start", self.app.run)
+        self.first_run = time.perf_counter() - started
+
+    def play(self, mix, actions):
+        """Perform ``actions`` actions drawn from ``mix``"""
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        for _ in range(actions):
+            name = self.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            if self._attempt(name, ACTIONS[name], self):
+                self.timings.append((name, time.perf_counter() - started))
+
+    def _attempt(self, name, run, *args):
+        """Run one step; a failure is recorded rather than ending the session"""
+        try:
+            run(*args)
+        except Exception as e:
+            self.errors.append(f"{name}: {type(e).__name__}: {e}")
+            return False
+        if self.app.exception:
+            self.errors.append(f"{name}: {self.app.exception[0].value}")
+            return False
+        return True
+
+
+# --- Memory ---
+def resident_bytes():
+    """Resident memory of this process, or its peak so far where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemorySampler:
+    """Peak resident memory, sampled on a background thread"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = resident_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="load-memory", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, resident_bytes())
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, resident_bytes())
+
+
+# --- Running a scenario ---
+def percentiles(seconds):
+    """p50 and p99 in milliseconds, and the count"""
+    if not seconds:
+        return {"p50": None, "p99": None, "count": 0}
+    p50, p99 = np.percentile(np.array(seconds) * 1000, [50, 99])
+    return {"p50": float(p50), "p99": float(p99), "count": len(seconds)}
+
+
+def run_scenario(scenario, sessions, workspaces, args):
+    """Run ``scenario`` with ``sessions`` concurrent sessions in this process"""
+    mix = SCENARIOS[scenario]
+    with shared_app_runtime():
+        # A running server has imported the app and opened a diary before the sessions connect
+        server = Session(sessions, workspaces[0], args.seed, args.content_words, args.timeout)
+        server.start()
+        start_rss = resident_bytes()
+        with MemorySampler() as memory:
+            users = [Session(i, workspaces[i % len(workspaces)], args.seed, args.content_words, args.timeout)
+                     for i in range(sessions)]
+            # Only what follows the first runs is measured
+            _in_threads([user.start for user in users])
+            warm_rss = resident_bytes()
+            started = time.perf_counter()
+            _in_threads([lambda user=user: user.play(mix, args.actions) for user in users])
+            elapsed = time.perf_counter() - started
+        end_rss = resident_bytes()
+
+    timings = [timing for user in users for timing in user.timings]
+    errors = server.errors + [error for user in users for error in user.errors]
+    mb = 2**20
+    return {
+        "scenario": scenario,
+        "sessions": sessions,
+        "actions": len(timings),
+        "seconds": elapsed,
+        "throughput": len(timings) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "all": percentiles([seconds for _, seconds in timings]),
+            **{name: percentiles([seconds for kind, seconds in timings if kind == name]) for name in mix},
+        },
+        "first_run_ms": percentiles([user.first_run for user in users if user.first_run is not None]),
+        "memory_mb": {
+            "start": start_rss / mb,
+            "warm": warm_rss / mb,
+            "peak": memory.peak / mb,
+            "end": end_rss / mb,
+            "per_session": (memory.peak - start_rss) / mb / sessions,
+        },
+        "errors": len(errors),
+        "error_samples": errors[:5],
+    }
+
+
+def _in_threads(calls):
+    threads = [threading.Thread(target=call, name=f"load-session-{i}") for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+# --- Orchestration ---
+def prepare_diaries(root, args):
+    """Synthetic diaries under ``root``: the default one, or ``--workspaces`` named ones"""
+    from diary.storage import DIARY_DIR, save_entries
+    from diary.workspaces import DEFAULT_WORKSPACE, Workspace, workspace_for
+
+    if args.workspaces > 1:
+        workspaces = [workspace_for(f"diary{i + 1}", root / "workspaces") for i in range(args.workspaces)]
+    else:
+        workspaces = [Workspace(DEFAULT_WORKSPACE, root / DIARY_DIR)]
+    for i, workspace in enumerate(workspaces):
+        workspace.create(PASSKEY)
+        entries = generate_entries(args.size, seed=args.seed + i, content_words=args.content_words,
+                                   image_ratio=args.image_ratio)
+        save_entries(entries, workspace.entries_file)
+
+
+def run_in_process(scenario, sessions, template, args):
+    """Run one scenario in a fresh Python process on a copy of ``template``; returns its results"""
+    workdir = template.with_name(f"{scenario}-{sessions}")
+    shutil.copytree(template, workdir)
+    result_file = workdir / "result.json"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(APP_FILE.parent), env.get("PYTHONPATH")]))
+    env.pop("DIARY_WORKSPACES_DIR", None)
+    if args.workspaces > 1:
+        env["DIARY_WORKSPACES_DIR"] = "workspaces"
+    command = [
+        sys.executable, "-m", "benchmarks.load",
+        "--worker", scenario, str(sessions), "--result", str(result_file),
+        "--workspaces", str(args.workspaces), "--actions", str(args.actions), "--seed", str(args.seed),
+        "--content-words", str(args.content_words), "--timeout", str(args.timeout),
+    ]
+    finished = subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.PIPE, text=True)
+    try:
+        with open(result_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        raise RuntimeError(f"{scenario} with {sessions} sessions failed:\n{finished.stderr[-2000:]}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _ms(value):
+    return "-" if value is None else f"{value:.0f} ms"
+
+
+def format_result(result):
+    latency, memory = result["latency_ms"], result["memory_mb"]
+    lines = [
+        f"{result['scenario']:<6} {result['sessions']:>3} sessions  {result['actions']:>5} actions  "
+        f"{result['throughput']:>6.1f} actions/s  p50 {_ms(latency['all']['p50'])}  p99 {_ms(latency['all']['p99'])}  "
+        f"memory {memory['start']:.0f} → {memory['peak']:.0f} MB peak "
+        f"({memory['per_session']:+.1f} MB/session)  {result['errors']} errors"
+    ]
+    for name, stats in latency.items():
+        if name != "all" and stats["count"]:
+            lines.append(f"    {name:<6} p50 {_ms(stats['p50'])}  p99 {_ms(stats['p99'])}  ({stats['count']})")
+    lines.extend(f"    ! {error}" for error in result["error_samples"])
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS,
+                        help="Concurrent session counts to run each scenario with")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--actions", type=int, default=10, help="Measured actions per session")
+    parser.add_argument("--size", type=int, default=1000, help="Synthetic entries per diary")
+    parser.add_argument("--workspaces", type=int, default=1,
+                        help="Spread the sessions over this many diaries (DIARY_WORKSPACES_DIR)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--content-words", type=int, default=150, help="Mean words per entry")
+    parser.add_argument("--image-ratio", type=float, default=0.1, help="Share of entries with an image")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds one rerun may take")
+    parser.add_argument("--json", type=Path, help="Also write results to this file")
+    # Internal: run one scenario in this process, from the diary in the current folder
+    parser.add_argument("--worker", nargs=2, metavar=("SCENARIO", "SESSIONS"), help=argparse.SUPPRESS)
+    parser.add_argument("--result", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        scenario, sessions = args.worker[0], int(args.worker[1])
+        workspaces = [f"diary{i + 1}" for i in range(args.workspaces)] if args.workspaces > 1 else [None]
+        result = run_scenario(scenario, sessions, workspaces, args)
+        with open(args.result, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="diary-load-") as tmp:
+        template = Path(tmp) / "template"
+        prepare_diaries(template, args)
+        for scenario in args.scenarios:
+            for sessions in args.sessions:
+                result = run_in_process(scenario, sessions, template, args)
+                print(format_result(result), flush=True)
+                results.append(result)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+"""Time the diary hot paths on synthetic data and compare against baselines.
+
+    python -m benchmarks.run                        # 100, 10k and 100k entries
+    python -m benchmarks.run --sizes 1000 --only load_entries save_entries
+    python -m benchmarks.run --save-baseline        # record benchmarks/baselines.json
+
+Each benchmark is timed ``--repeat`` times (best and median are kept) and
+then run once more under ``tracemalloc`` for its peak allocation and the
+memory still held by its return value. When a baseline file exists,
+results slower or hungrier than the baseline by more than ``--tolerance``
+are flagged and the exit code is 1.
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.synthetic import generate_entries
+
+BASELINE_FILE = Path(__file__).with_name("baselines.json")
+DEFAULT_SIZES = [100, 10_000, 100_000]
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register ``prepare(entries, workdir, args)`` returning the callable to time"""
+    def register(prepare):
+        BENCHMARKS[name] = prepare
+        return prepare
+    return register
+
+
+# --- Hot paths ---
+@benchmark("load_entries")
+def bench_load_entries(entries, workdir, args):
+    from diary.storage import load_entries, save_entries
+    path = workdir / "load.json"
+    save_entries(entries, path)
+    return lambda: load_entries(path)
+
+
+@benchmark("save_entries")
+def bench_save_entries(entries, workdir, args):
+    from diary.storage import save_entries
+    path = workdir / "save.json"
+    return lambda: save_entries(entries, path)
+
+
+@benchmark("save_one_month")
+def bench_save_one_month(entries, workdir, args):
+    """What a single add costs the writer: only the newest month's shard is rewritten"""
+    from diary.storage import save_entries, shard_key
+    path = workdir / "sharded.json"
+    save_entries(entries, path, sharded=True)
+    month = max(shard_key(entry) for entry in entries)
+    return lambda: save_entries(entries, path, months={month})
+
+
+@benchmark("backup_incremental")
+def bench_backup_incremental(entries, workdir, args):
+    """A nightly snapshot after one month changed, against a full earlier snapshot"""
+    import shutil
+    from diary.backup import create_snapshot
+    from diary.storage import save_entries, shard_key
+    diary_dir = workdir / "backup-source"
+    diary_dir.mkdir(exist_ok=True)
+    save_entries(entries, diary_dir / "entries.json", sharded=True)
+    target = workdir / "backup-target"
+    shutil.rmtree(target, ignore_errors=True)
+    create_snapshot(target, diary_dir)
+    month = max(shard_key(entry) for entry in entries)
+
+    def run():
+        save_entries(entries, diary_dir / "entries.json", months={month})
+        create_snapshot(target, diary_dir)
+    return run
+
+
+@benchmark("view_entries_dataframe")
+def bench_view_dataframe(entries, workdir, args):
+    from diary.frames import GRID_COLUMNS, entries_dataframe
+    return lambda: entries_dataframe(entries)[GRID_COLUMNS]
+
+
+@benchmark("mapped_view_dataframe")
+def bench_mapped_dataframe(entries, workdir, args):
+    """The entry table built from the memory-mapped metadata records"""
+    from diary.frames import GRID_COLUMNS, mapped_dataframe
+    from diary.mmapstore import MappedEntries, build_mapped_store
+    path = workdir / "entries.mmap"
+    build_mapped_store(entries, path, (0, -1))
+
+    def run():
+        with MappedEntries(path) as mapped:
+            mapped_dataframe(mapped)[GRID_COLUMNS]
+    return run
+
+
+@benchmark("facet_filter")
+def bench_facet_filter(entries, workdir, args):
+    """Tag + mood + month selection and its drill-down counts from the postings"""
+    from diary.facets import facet_counts, select_rows
+    from diary.mmapstore import MappedEntries, build_mapped_store
+    path = workdir / "facets.mmap"
+    build_mapped_store(entries, path, (0, -1))
+    mapped = MappedEntries(path)
+    month = max(mapped.facets['month'], key=lambda m: mapped.facet_counts('month')[m])
+
+    def run():
+        rows = select_rows(mapped, tags=["Work"], moods=["😔"], months=[month])
+        return facet_counts(mapped, rows)
+    return run
+
+
+@benchmark("show_stats")
+def bench_show_stats(entries, workdir, args):
+    """The data work behind the Statistics page, without rendering charts"""
+    from diary.analysis import extract_keywords
+    from diary.frames import analyze_writing_habits, stats_dataframe
+
+    def run():
+        df = stats_dataframe(entries)
+        df['word_count'].sum(), df['sentiment'].mean(), df['word_count'].mean()
+        df['mood'].value_counts().reset_index()
+        df['sentiment'].rolling(window=3, min_periods=1).mean()
+        analyze_writing_habits(df)
+        extract_keywords(" ".join(df['content']), 20)
+    return run
+
+
+@benchmark("activity_update")
+def bench_activity_update(entries, workdir, args):
+    """What the writer adds per save: one entry re-indexed, then the streak and goal queries"""
+    from datetime import date
+    from diary.activity import DEFAULT_GOALS, ActivityIndex
+    index = ActivityIndex.build(entries)
+    entry = dict(entries[0], timestamp=date.today().isoformat())
+
+    def run():
+        index.upsert(entry)
+        return index.current_streak(), index.longest_streak, index.goal_progress(DEFAULT_GOALS)
+    return run
+
+
+@benchmark("edit_long_entry")
+def bench_edit_long_entry(entries, workdir, args):
+    """Saving an edit to one paragraph of an entry made of up to 500 of them"""
+    from itertools import count
+    from diary.arcs import update_arc
+    paragraphs = [entry['content'] for entry in entries[:500]]
+    entry = {'content': "\n\n".join(paragraphs)}
+    update_arc(entry)
+    edits = count()
+
+    def run():
+        paragraphs[-1] = f"{entries[0]['content']} edit {next(edits)}"
+        entry['content'] = "\n\n".join(paragraphs)
+        return update_arc(entry)
+    return run
+
+
+@benchmark("record_revision")
+def bench_record_revision(entries, workdir, args):
+    """Keeping the previous version of a 50-paragraph entry on each of 20 edits"""
+    from itertools import count
+    from diary.revisions import RevisionStore
+    store = RevisionStore(workdir / "revisions.json")
+    paragraphs = [entry['content'] for entry in entries[:50]]
+    entry = {'id': entries[0]['id'], 'title': "Long", 'content': "\n\n".join(paragraphs)}
+    store.record(entry)
+    edits = count()
+
+    def run():
+        for _ in range(20):
+            paragraphs[-1] = f"{entries[0]['content']} edit {next(edits)}"
+            store.record(dict(entry, content="\n\n".join(paragraphs)))
+    return run
+
+
+@benchmark("rebuild_revisions")
+def bench_rebuild_revisions(entries, workdir, args):
+    """Rebuilding every stored version of an entry edited 30 times"""
+    from diary.revisions import RevisionStore
+    store = RevisionStore(workdir / "rebuild.json")
+    paragraphs = [entry['content'] for entry in entries[:50]]
+    entry = {'id': entries[0]['id'], 'title': "Long"}
+    for i in range(30):
+        paragraphs[i % len(paragraphs)] += f" edit {i}"
+        store.record(dict(entry, content="\n\n".join(paragraphs)))
+    records = store.records(entry['id'])
+    return lambda: [store.revision(entry['id'], record['rev'], records) for record in records]
+
+
+@benchmark("extract_keywords")
+def bench_extract_keywords(entries, workdir, args):
+    from diary.analysis import extract_keywords
+    return lambda: [extract_keywords(entry['content']) for entry in entries]
+
+
+def _sentiment(name, engine_name):
+    @benchmark(name)
+    def bench(entries, workdir, args):
+        """Scoring every entry in batches of 256, as imports and reindexing do"""
+        from diary.analysis import get_engine
+        engine = get_engine(engine_name)
+        texts = [entry['content'] for entry in entries]
+        engine.score(texts[:1])
+        return lambda: [engine.score(texts[i:i + 256]) for i in range(0, len(texts), 256)]
+    return bench
+
+
+_sentiment("sentiment_textblob", "textblob")
+_sentiment("sentiment_lexicon", "lexicon")
+
+
+@benchmark("related_entries")
+def bench_related_entries(entries, workdir, args):
+    """Related-entry lookups for 20 entries against a prebuilt vector index"""
+    from diary.similarity import VectorIndex
+    index = VectorIndex.build(entries)
+    ids = [entry['id'] for entry in entries[:20]]
+    return lambda: [index.similar(entry_id) for entry_id in ids]
+
+
+def _render_entry(name, warm):
+    @benchmark(name)
+    def bench(entries, workdir, args):
+        """Opening 20 entries in the detail view, with or without their renders cached"""
+        from diary.rendercache import RenderCache
+        cache = RenderCache()
+        shown = entries[:20]
+        for entry in shown:
+            cache.get(entry)
+
+        def run():
+            if not warm:
+                cache.clear()
+            return [cache.get(entry) for entry in shown]
+        return run
+    return bench
+
+
+_render_entry("render_entry_cold", warm=False)
+_render_entry("render_entry_cached", warm=True)
+
+
+@benchmark("convert_markdown_to_pdf_content")
+def bench_markdown_to_pdf(entries, workdir, args):
+    from diary.pdf import convert_markdown_to_pdf_content
+
+    def run():
+        for entry in entries:
+            for line in entry['content'].split('\n'):
+                convert_markdown_to_pdf_content(line)
+    return run
+
+
+@benchmark("generate_pdf")
+def bench_generate_pdf(entries, workdir, args):
+    """Capped at ``--pdf-limit`` entries; a 100k-page PDF is not a useful timing"""
+    from diary.pdf import generate_pdf
+    selected = entries[:args.pdf_limit]
+    path = workdir / "export.pdf"
+    return lambda: generate_pdf(selected, path)
+
+
+def _streaming_export(name, exporter_name, suffix):
+    @benchmark(name)
+    def bench(entries, workdir, args):
+        """Whole diary, read lazily from a generator as the export queue does"""
+        from diary import exporters
+        exporter = getattr(exporters, exporter_name)
+        path = workdir / f"export{suffix}"
+        return lambda: exporter((entry for entry in entries), path, total=len(entries))
+    return bench
+
+
+_streaming_export("export_html_site", "export_html_site", ".zip")
+_streaming_export("export_epub", "export_epub", ".epub")
+_streaming_export("export_markdown_zip", "export_markdown_zip", ".md.zip")
+
+
+# --- Runner ---
+def measure(fn, repeat, memory):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    result = {"seconds": min(timings), "median": statistics.median(timings)}
+    if memory:
+        tracemalloc.start()
+        try:
+            # The return value is kept alive until measured: what it holds, e.g.
+            # loaded entries, is the retained memory
+            returned = [fn()]
+            current, peak = tracemalloc.get_traced_memory()
+            result["peak_mb"] = peak / 2**20
+            result["retained_mb"] = current / 2**20
+            returned.clear()
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_benchmarks(args):
+    results = {}
+    for size in args.sizes:
+        entries = generate_entries(
+            size,
+            seed=args.seed,
+            content_words=args.content_words,
+            image_ratio=args.image_ratio,
+            tag_cardinality=args.tags,
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, prepare in BENCHMARKS.items():
+                if args.only and name not in args.only:
+                    continue
+                key = f"{name}@{size}"
+                try:
+                    fn = prepare(entries, Path(tmp), args)
+                except ImportError as e:
+                    print(f"{key:<45} skipped ({e})")
+                    continue
+                repeat = args.repeat if size < 100_000 else 1
+                results[key] = measure(fn, repeat, not args.no_memory)
+                print(format_result(key, results[key]))
+    return results
+
+
+def format_result(key, result):
+    line = f"{key:<45} {result['seconds'] * 1000:>10.1f} ms  (median {result['median'] * 1000:.1f} ms)"
+    if "peak_mb" in result:
+        line += f"  peak {result['peak_mb']:.1f} MB"
+    if "retained_mb" in result:
+        line += f"  retained {result['retained_mb']:.1f} MB"
+    return line
+
+
+def compare(results, baselines, tolerance):
+    """Return human-readable regressions against the stored baselines"""
+    regressions = []
+    for key, result in results.items():
+        base = baselines.get(key)
+        if not base:
+            continue
+        for metric in ("seconds", "peak_mb", "retained_mb"):
+            if metric in result and metric in base and base[metric] > 0:
+                ratio = result[metric] / base[metric]
+                if ratio > 1 + tolerance:
+                    regressions.append(f"{key} {metric}: {base[metric]:.4g} -> {result[metric]:.4g} ({ratio:.2f}x)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--content-words", type=int, default=150, help="Mean words per entry")
+    parser.add_argument("--image-ratio", type=float, default=0.1, help="Share of entries with an image")
+    parser.add_argument("--tags", type=int, default=7, help="Number of distinct tags")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark (1 at 100k+)")
+    parser.add_argument("--pdf-limit", type=int, default=20, help="Entries included in generate_pdf")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before flagging")
+    parser.add_argument("--json", type=Path, help="Also write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baselines.update(results)
+        args.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True))
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Compare sentiment engines for throughput and drift from the reference.
+
+    python -m benchmarks.sentiment                          # synthetic diary, qualified
+    python -m benchmarks.sentiment --entries-file diary_entries/entries.json
+    python -m benchmarks.sentiment --engines lexicon --reference textblob --size 5000
+
+Every engine scores the same texts in batches of ``--batch-size``. The
+report lists entries per second and, against ``--reference``, the mean
+and worst absolute polarity difference, the polarity correlation and how
+often both agree on positive / neutral / negative.
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_entries
+from diary.analysis import SENTIMENT_ENGINES, get_engine
+
+# Polarity within this distance of 0 counts as neutral when comparing labels
+NEUTRAL = 0.05
+# Mixed into synthetic text, which otherwise has no negations or intensifiers
+QUALIFIERS = ["not", "very", "really", "never", "not very", "don't", "isn't a", "so", "quite", "extremely"]
+
+
+def qualify(text, rng, share=0.15):
+    """``text`` with qualifiers before some words and the odd exclamation mark"""
+    words = []
+    for word in text.split(" "):
+        if rng.random() < share:
+            words.append(rng.choice(QUALIFIERS))
+        words.append(word + ("!" if rng.random() < 0.02 else ""))
+    return " ".join(words)
+
+
+def score_all(engine, texts, batch_size):
+    """``(polarity, subjectivity, seconds)`` arrays for ``texts``"""
+    engine.score(texts[:1])  # load the lexicon outside the timing
+    start = time.perf_counter()
+    scores = []
+    for offset in range(0, len(texts), batch_size):
+        scores.extend(engine.score(texts[offset:offset + batch_size]))
+    seconds = time.perf_counter() - start
+    polarity, subjectivity, _ = (np.array(column) for column in zip(*scores))
+    return polarity, subjectivity, seconds
+
+
+def labels(polarity):
+    return np.sign(np.where(np.abs(polarity) < NEUTRAL, 0.0, polarity))
+
+
+def compare(reference, scores):
+    """Drift of ``scores`` from ``reference``, both ``(polarity, subjectivity)``"""
+    drift = np.abs(scores[0] - reference[0])
+    correlation = np.corrcoef(scores[0], reference[0])[0, 1] if len(drift) > 1 else 1.0
+    return {
+        "polarity_mae": float(drift.mean()),
+        "polarity_max": float(drift.max()),
+        "subjectivity_mae": float(np.abs(scores[1] - reference[1]).mean()),
+        "correlation": float(np.nan_to_num(correlation, nan=1.0)),
+        "label_agreement": float((labels(scores[0]) == labels(reference[0])).mean()),
+    }
+
+
+def load_texts(args):
+    if args.entries_file:
+        from diary.storage import load_entries
+        return [entry['content'] for entry in load_entries(args.entries_file)]
+    entries = generate_entries(args.size, seed=args.seed, image_ratio=0.0)
+    rng = random.Random(args.seed)
+    return [qualify(entry['content'], rng) for entry in entries]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sentiment", description=__doc__.split("\n")[0])
+    parser.add_argument("--entries-file", help="Score these entries instead of a synthetic diary")
+    parser.add_argument("--size", type=int, default=2000, help="Synthetic entries to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--engines", nargs="+", choices=sorted(SENTIMENT_ENGINES), default=sorted(SENTIMENT_ENGINES))
+    parser.add_argument("--reference", choices=sorted(SENTIMENT_ENGINES), default="textblob")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args(argv)
+
+    texts = load_texts(args)
+    if not texts:
+        print("No entries to score", file=sys.stderr)
+        return 1
+    results = {}
+    for name in dict.fromkeys([args.reference] + args.engines):
+        polarity, subjectivity, seconds = score_all(get_engine(name), texts, args.batch_size)
+        results[name] = (polarity, subjectivity)
+        print(f"{name:<10} {len(texts) / seconds:>10.0f} entries/s  ({seconds * 1000:.0f} ms for {len(texts)})")
+
+    reference = results[args.reference]
+    for name in args.engines:
+        if name == args.reference:
+            continue
+        drift = compare(reference, results[name])
+        print(f"{name} vs {args.reference}: polarity MAE {drift['polarity_mae']:.3f} "
+              f"(max {drift['polarity_max']:.3f}), subjectivity MAE {drift['subjectivity_mae']:.3f}, "
+              f"correlation {drift['correlation']:.3f}, label agreement {drift['label_agreement']:.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Seeded synthetic diary generator for benchmarks.
+
+Entries are plain dicts in the ``diary_entries/entries.json`` layout with
+the content in plain text, so they can be fed straight
+into ``save_entries``, the DataFrame builders and the PDF exporter.
+"""
+import base64
+import random
+import struct
+import uuid
+import zlib
+from datetime import date, datetime, timedelta
+
+from diary.storage import hash_passkey
+
+MOODS = ["😭", "😔", "😐", "🙂", "😊", "😄"]
+BASE_TAGS = ["Personal", "Work", "Ideas", "Goals", "Reflections", "Gratitude", "Challenges"]
+VOCABULARY = (
+    "today morning evening work meeting project friend family coffee walk park "
+    "happy sad tired excited grateful anxious calm wonderful terrible great "
+    "idea plan goal progress learn read book music dinner lunch weather rain "
+    "sunny code python diary write think feel remember hope worry love"
+).split()
+
+
+def make_png(width=64, height=48, seed=0):
+    """A small valid RGB PNG so reportlab and PIL can open the image"""
+    rng = random.Random(seed)
+    row = bytes(rng.randrange(256) for _ in range(width * 3))
+    raw = b"".join(b"\x00" + row for _ in range(height))
+
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+def make_content(rng, words):
+    """Markdown body of roughly ``words`` words with headings, lists and code"""
+    lines = [f"# {rng.choice(VOCABULARY).title()} notes", ""]
+    remaining = words
+    while remaining > 0:
+        size = min(remaining, rng.randint(8, 40))
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(size))
+        style = rng.random()
+        if style < 0.1:
+            lines.append(f"- **{sentence}**")
+        elif style < 0.2:
+            lines.append(f"1. *{sentence}*")
+        elif style < 0.25:
+            lines.append(f"Ran `{rng.choice(VOCABULARY)}()` on {sentence}")
+        else:
+            lines.append(sentence.capitalize() + ".")
+        remaining -= size
+    return "\n".join(lines)
+
+
+def generate_entries(count, seed=42, content_words=150, image_ratio=0.1,
+                     tag_cardinality=7, start=date(2020, 1, 1)):
+    """Generate ``count`` entries deterministically for a given ``seed``.
+
+    ``content_words`` is the mean body length, ``image_ratio`` the share of
+    entries carrying a base64 image and ``tag_cardinality`` the number of
+    distinct tags in use (the app's seven built-in tags, then ``tag8``...).
+    """
+    rng = random.Random(seed)
+    tags = (BASE_TAGS + [f"tag{i}" for i in range(len(BASE_TAGS) + 1, tag_cardinality + 1)])
+    tags = tags[:max(1, tag_cardinality)]
+    image = base64.b64encode(make_png(seed=seed)).decode("utf-8")
+    passkey_hash = hash_passkey("benchmark")
+    entries = []
+    for i in range(count):
+        day = start + timedelta(days=i * 3 // 4)
+        moment = datetime(day.year, day.month, day.day, rng.randrange(24), rng.randrange(60))
+        words = max(1, int(rng.gauss(content_words, content_words / 3)))
+        content = make_content(rng, words)
+        entries.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "date": day.isoformat(),
+            "timestamp": moment.isoformat(),
+            "title": f"Entry {i + 1}",
+            "content": content,
+            "mood": rng.choice(MOODS),
+            "tags": rng.sample(tags, k=min(len(tags), rng.randint(1, 3))),
+            "sentiment": round(rng.uniform(-1, 1), 4),
+            "subjectivity": round(rng.random(), 4),
+            "word_count": len(content.split()),
+            "keywords": rng.sample(VOCABULARY, k=10),
+            "image": image if rng.random() < image_ratio else None,
+            "passkey_hash": passkey_hash,
+        })
+    return entries
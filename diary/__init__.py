@@ -0,0 +1,5 @@
+"""Streamlit-free core of the diary app.
+
+Everything in this package can be imported from scripts and the command
+line without pulling in Streamlit; ``main.py`` layers the UI on top.
+"""
@@ -0,0 +1,284 @@
+"""Daily writing activity: streaks, goals and the calendar heatmap.
+
+Activity is keyed on when an entry was actually written (its
+``timestamp``), not on the diary ``date`` the writer picked, so
+back-dated entries do not fake a streak. Entries without a usable
+timestamp count on their ``date`` and are left out of the hour chart.
+
+``ActivityIndex`` keeps per-day totals plus the runs of consecutive
+writing days, indexed by both ends. Adding an entry joins at most two
+runs, so the current and longest streak are dictionary lookups however
+long the history is. Removing the last entry of a day splits its run,
+which walks that one run. The index is saved as ``entries.activity.json``
+next to the entry file and updated by the writer after every batch, like
+the related-entries index.
+"""
+import json
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from diary.mmapstore import file_signature
+from diary.profiling import timed, timed_function
+from diary.storage import ENTRIES_FILE, GOALS_FILE, load_entries
+
+DEFAULT_GOALS = {"daily_words": 250, "weekly_entries": 5}
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+def activity_path_for(entries_file=None):
+    """Path of the activity index derived from ``entries_file``"""
+    return Path(entries_file or ENTRIES_FILE).with_suffix(".activity.json")
+
+
+def entry_activity(entry):
+    """``(day ordinal, hour or -1, words)`` for an entry"""
+    timestamp = str(entry.get('timestamp') or '')
+    try:
+        written = datetime.fromisoformat(timestamp[:19])
+        day, hour = written.toordinal(), written.hour
+    except ValueError:
+        try:
+            day, hour = date.fromisoformat(str(entry.get('date'))[:10]).toordinal(), -1
+        except ValueError:
+            day, hour = date.today().toordinal(), -1
+    words = entry.get('word_count')
+    if words is None:
+        words = len(str(entry.get('content') or '').split())
+    return day, hour, int(words)
+
+
+class ActivityIndex:
+    """Per-day entry and word totals with streak runs"""
+
+    def __init__(self, source_signature=(0, -1)):
+        self.source_signature = tuple(source_signature)
+        self._entries = {}  # id -> (day, hour, words)
+        self._days = {}  # day ordinal -> [entries, words]
+        self._hours = [0] * 24
+        self._weekdays = [0] * 7
+        # Runs of consecutive days, by both ends, and how many runs have each length
+        self._run_by_start = {}
+        self._run_by_end = {}
+        self._run_lengths = Counter()
+        self.longest_streak = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    @timed_function("activity.build")
+    def build(cls, entries, source_signature=(0, -1)):
+        """Index every entry in ``entries``"""
+        index = cls(source_signature)
+        for entry in entries:
+            index.upsert(entry)
+        return index
+
+    # --- Updates ---
+    def upsert(self, entry):
+        """Add ``entry`` or move it after an edit"""
+        self._set(entry['id'], entry_activity(entry))
+
+    def remove(self, entry_id):
+        self._set(entry_id, None)
+
+    def _set(self, entry_id, activity):
+        previous = self._entries.pop(entry_id, None)
+        if previous is not None:
+            day, hour, words = previous
+            totals = self._days[day]
+            totals[0] -= 1
+            totals[1] -= words
+            self._weekdays[(day - 1) % 7] -= 1
+            if hour >= 0:
+                self._hours[hour] -= 1
+            if not totals[0]:
+                del self._days[day]
+                self._remove_day(day)
+        if activity is None:
+            return
+        self._entries[entry_id] = activity
+        day, hour, words = activity
+        totals = self._days.get(day)
+        if totals is None:
+            totals = self._days[day] = [0, 0]
+            self._add_day(day)
+        totals[0] += 1
+        totals[1] += words
+        # Ordinal 1 (0001-01-01) was a Monday
+        self._weekdays[(day - 1) % 7] += 1
+        if hour >= 0:
+            self._hours[hour] += 1
+
+    def _add_run(self, start, end):
+        self._run_by_start[start] = end
+        self._run_by_end[end] = start
+        self._run_lengths[end - start + 1] += 1
+        self.longest_streak = max(self.longest_streak, end - start + 1)
+
+    def _drop_run(self, start, end):
+        del self._run_by_start[start]
+        del self._run_by_end[end]
+        length = end - start + 1
+        self._run_lengths[length] -= 1
+        if not self._run_lengths[length]:
+            del self._run_lengths[length]
+
+    def _add_day(self, day):
+        start = end = day
+        if day - 1 in self._run_by_end:
+            start = self._run_by_end[day - 1]
+            self._drop_run(start, day - 1)
+        if day + 1 in self._run_by_start:
+            end = self._run_by_start[day + 1]
+            self._drop_run(day + 1, end)
+        self._add_run(start, end)
+
+    def _run_start(self, day):
+        """Start of the run containing ``day``; walks back unless ``day`` ends it"""
+        start = self._run_by_end.get(day, day)
+        while start not in self._run_by_start:
+            start -= 1
+        return start
+
+    def _remove_day(self, day):
+        start = self._run_start(day)
+        end = self._run_by_start[start]
+        self._drop_run(start, end)
+        if start < day:
+            self._add_run(start, day - 1)
+        if day < end:
+            self._add_run(day + 1, end)
+        self.longest_streak = max(self._run_lengths, default=0)
+
+    # --- Queries ---
+    def current_streak(self, today=None):
+        """Days in a row up to today, or up to yesterday if today is still open"""
+        today = (today or date.today()).toordinal()
+        for end in (today, today - 1):
+            if end in self._days:
+                # A run normally ends today; only entries timestamped ahead of
+                # the clock continue it, and then its start is walked back to
+                return end - self._run_start(end) + 1
+        return 0
+
+    def day_totals(self, day):
+        """``(entries, words)`` written on ``day``"""
+        entries, words = self._days.get(day.toordinal(), (0, 0))
+        return entries, words
+
+    def totals_between(self, first, last):
+        """``(entries, words, active days)`` from ``first`` to ``last`` inclusive"""
+        entries = words = active = 0
+        for day in range(first.toordinal(), last.toordinal() + 1):
+            totals = self._days.get(day)
+            if totals:
+                entries += totals[0]
+                words += totals[1]
+                active += 1
+        return entries, words, active
+
+    def hour_counts(self):
+        return list(self._hours)
+
+    def weekday_counts(self):
+        """Entries per weekday, Monday first"""
+        return list(self._weekdays)
+
+    def years(self):
+        """Years with any activity, newest first"""
+        years = set()
+        for start, end in self._run_by_start.items():
+            years.update(range(date.fromordinal(start).year, date.fromordinal(end).year + 1))
+        return sorted(years, reverse=True)
+
+    def calendar(self, year, metric="entries"):
+        """``(values, dates)``: 7 x 53 arrays, weekday rows by Monday-first week columns
+
+        ``values`` holds the entry or word count per day and NaN outside
+        ``year``; ``dates`` holds the matching ``YYYY-MM-DD`` labels.
+        """
+        column = 0 if metric == "entries" else 1
+        values = np.full((7, 54), np.nan)
+        labels = np.full((7, 54), "", dtype=object)
+        first = date(year, 1, 1)
+        offset = first.weekday()
+        for n in range((date(year + 1, 1, 1) - first).days):
+            day = first + timedelta(days=n)
+            week, weekday = divmod(n + offset, 7)
+            values[weekday, week] = self._days.get(day.toordinal(), (0, 0))[column]
+            labels[weekday, week] = day.isoformat()
+        # Only a leap year starting on a Sunday spills into a 54th week
+        used = 54 if not np.isnan(values[:, 53]).all() else 53
+        return values[:, :used], labels[:, :used]
+
+    def goal_progress(self, goals, today=None):
+        """``{goal: (done, target)}`` for today's words and this week's entries"""
+        today = today or date.today()
+        week_start = today - timedelta(days=today.weekday())
+        return {
+            "daily_words": (self.day_totals(today)[1], goals.get("daily_words", 0)),
+            "weekly_entries": (self.totals_between(week_start, today)[0], goals.get("weekly_entries", 0)),
+        }
+
+    # --- Persistence ---
+    def save(self, entries_file=None, source_signature=None):
+        """Write the index next to ``entries_file`` (atomically)"""
+        if source_signature is not None:
+            self.source_signature = tuple(source_signature)
+        ids = list(self._entries)
+        columns = list(zip(*self._entries.values())) or ((), (), ())
+        path = activity_path_for(entries_file)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"signature": list(self.source_signature), "ids": ids, "days": columns[0],
+                       "hours": columns[1], "words": columns[2]}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, entries_file=None):
+        """Read a saved index; raises ``ValueError`` if unusable"""
+        with open(activity_path_for(entries_file), "r") as f:
+            saved = json.load(f)
+        index = cls(saved["signature"])
+        for entry_id, activity in zip(saved["ids"], zip(saved["days"], saved["hours"], saved["words"])):
+            index._set(entry_id, activity)
+        return index
+
+
+def open_activity_index(entries_file=None, signature=None):
+    """Load the saved activity index for ``entries_file``, rebuilding it if stale"""
+    entries_file = Path(entries_file or ENTRIES_FILE)
+    signature = tuple(signature or file_signature(entries_file))
+    try:
+        index = ActivityIndex.load(entries_file)
+        if index.source_signature == signature:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    with timed("activity.rebuild"):
+        index = ActivityIndex.build(load_entries(entries_file), signature)
+        index.save(entries_file)
+    return index
+
+
+# --- Goals ---
+def load_goals(goals_file=None):
+    """Writing goals, with defaults for anything not set"""
+    try:
+        with open(goals_file or GOALS_FILE, "r") as f:
+            return {**DEFAULT_GOALS, **json.load(f)}
+    except (OSError, ValueError):
+        return dict(DEFAULT_GOALS)
+
+
+def save_goals(goals, goals_file=None):
+    goals_file = Path(goals_file or GOALS_FILE)
+    tmp_path = goals_file.with_name(goals_file.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(goals, f)
+    os.replace(tmp_path, goals_file)
@@ -0,0 +1,131 @@
+"""Sentence and paragraph sentiment: the emotional arc of an entry.
+
+An entry's ``arc`` has one record per paragraph (blank-line separated):
+a hash of the paragraph, its word count, and ``[polarity, subjectivity,
+weight]`` triples for the paragraph and for each of its sentences, where
+``weight`` is the number of words the engine scored. When an entry is
+saved only the paragraphs whose hash is not already in its arc are
+scored, the sentences of all of them in one engine call, so an edit
+costs the same however long the entry is. The entry's own polarity and
+subjectivity are the weighted means of its paragraphs, which is how the
+engines average over a whole text.
+"""
+import hashlib
+import re
+
+from diary.analysis import get_engine
+from diary.profiling import timed
+
+PARAGRAPH_RE = re.compile(r'\n[ \t]*\n')
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+# Digits kept per score; the arc is stored with every entry
+PRECISION = 4
+
+
+def split_paragraphs(text):
+    return [paragraph.strip() for paragraph in PARAGRAPH_RE.split(text or '') if paragraph.strip()]
+
+
+def split_sentences(paragraph):
+    return [sentence for sentence in SENTENCE_RE.split(paragraph) if sentence.strip()]
+
+
+def paragraph_key(paragraph):
+    return hashlib.blake2b(paragraph.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _rounded(score):
+    polarity, subjectivity, weight = score
+    return [round(polarity, PRECISION), round(subjectivity, PRECISION), weight]
+
+
+def weighted_mean(triples):
+    """``(polarity, subjectivity, weight)`` over ``[polarity, subjectivity, weight]`` triples"""
+    weight = sum(triple[2] for triple in triples)
+    if not weight:
+        return 0.0, 0.0, 0
+    return (sum(triple[0] * triple[2] for triple in triples) / weight,
+            sum(triple[1] * triple[2] for triple in triples) / weight,
+            weight)
+
+
+def update_arcs(entries, engine=None):
+    """Bring ``entry['arc']`` up to date for each entry, scoring only new paragraphs
+
+    Returns the ``analyze_sentiment``-style dict for each entry, derived
+    from its arc.
+    """
+    engine = get_engine(engine)
+    plans = []
+    pending = []
+    reused = 0
+    for entry in entries:
+        known = {record['key']: record for record in entry.get('arc') or ()}
+        plan = []
+        for paragraph in split_paragraphs(entry['content']):
+            key = paragraph_key(paragraph)
+            if key in known:
+                plan.append(known[key])
+                reused += 1
+            else:
+                sentences = split_sentences(paragraph)
+                plan.append((key, len(paragraph.split()), len(pending), len(sentences)))
+                pending.extend(sentences)
+        plans.append(plan)
+
+    with timed("sentiment.arcs", engine=engine.name, sentences=len(pending), reused=reused):
+        scores = engine.score(pending) if pending else []
+
+    results = []
+    for entry, plan in zip(entries, plans):
+        arc = []
+        for record in plan:
+            if isinstance(record, tuple):
+                key, words, start, count = record
+                sentences = [_rounded(score) for score in scores[start:start + count]]
+                record = {
+                    'key': key,
+                    'words': words,
+                    'score': _rounded(weighted_mean(sentences)),
+                    'sentences': sentences,
+                }
+            arc.append(record)
+        entry['arc'] = arc
+        polarity, subjectivity, _ = weighted_mean([record['score'] for record in arc])
+        results.append({
+            'polarity': polarity,
+            'subjectivity': subjectivity,
+            'word_count': sum(record['words'] for record in arc),
+        })
+    return results
+
+
+def update_arc(entry, engine=None):
+    """``update_arcs`` for one entry"""
+    return update_arcs([entry], engine)[0]
+
+
+def arc_points(entry):
+    """Rows for plotting: one per sentence with its paragraph's polarity too
+
+    Entries saved before arcs existed get theirs computed here, unsaved.
+    """
+    arc = entry.get('arc')
+    keys = [paragraph_key(paragraph) for paragraph in split_paragraphs(entry['content'])]
+    if arc is None or [record['key'] for record in arc] != keys:
+        entry = dict(entry)
+        update_arc(entry)
+        arc = entry['arc']
+    rows = []
+    for paragraph, record in enumerate(arc, start=1):
+        paragraph_polarity = record['score'][0]
+        for sentence, (polarity, subjectivity, weight) in enumerate(record['sentences'], start=1):
+            rows.append({
+                'position': len(rows) + 1,
+                'paragraph': paragraph,
+                'sentence': sentence,
+                'polarity': polarity,
+                'paragraph_polarity': paragraph_polarity,
+                'scored_words': weight,
+            })
+    return rows
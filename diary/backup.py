@@ -0,0 +1,316 @@
+"""Snapshot backups of the diary into a deduplicated chunk store.
+
+A backup target is a plain folder::
+
+    target/chunks/ab/ab12...     zlib-compressed chunk, named by the SHA-256 of its data
+    target/snapshots/<id>.json   one snapshot: every file and its chunk list
+
+Files are cut into content-defined chunks with a gear rolling hash, so
+editing one entry only changes the chunks around it and the rest of a
+month shard (images included) is shared with earlier snapshots. Files
+whose size and mtime match the previous snapshot are not read at all;
+with month shards a nightly backup only reads the months written since
+the last one.
+
+A snapshot holds the entry file, the shards its manifest lists, the
+entries' revision logs and the key, passkey and goals files. Derived files (``.mmap``, vector index) are rebuilt
+from the entry file after a restore. One process at a time may write to a
+target; ``target/.lock`` marks the one that does.
+"""
+import hashlib
+import json
+import os
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from diary.mmapstore import file_signature
+from diary.revisions import revisions_dir_for
+from diary.storage import (
+    DIARY_DIR,
+    ENTRIES_FILE,
+    GOALS_FILE,
+    KEY_FILE,
+    PASSKEY_FILE,
+    read_manifest,
+    shard_dir_for,
+)
+
+SNAPSHOT_FORMAT = "diary-backup"
+COMPRESSION_LEVEL = 6
+# Chunks average 8 KB and stay between 2 KB and 64 KB
+MIN_CHUNK = 2 * 1024
+MAX_CHUNK = 64 * 1024
+AVG_BITS = 13
+WINDOW = 32
+HASH_BLOCK = 1 << 22
+CONSISTENT_READ_ATTEMPTS = 5
+# Fixed table so chunk boundaries, and therefore dedup, are stable across runs
+_GEAR = np.random.default_rng(0x6469617279).integers(0, 2 ** 32, 256, dtype=np.uint32)
+_CUT_BELOW = np.uint32(1 << (32 - AVG_BITS))
+
+
+# --- Chunking ---
+def _gear_hashes(data):
+    """``h[t] = sum(GEAR[data[t - i]] << i for i < WINDOW) mod 2**32``"""
+    gear = _GEAR[np.frombuffer(data, dtype=np.uint8)]
+    hashes = gear.copy()
+    for i in range(1, min(WINDOW, len(gear))):
+        hashes[i:] += gear[:-i] << np.uint32(i)
+    return hashes
+
+
+def chunk_boundaries(data):
+    """End offsets of the content-defined chunks of ``data``"""
+    view = memoryview(data)
+    size = len(view)
+    cuts = []
+    last = 0
+    for start in range(0, size, HASH_BLOCK):
+        # Each block re-reads the window before it, so hashes match an unblocked pass
+        lo = max(start - WINDOW + 1, 0)
+        hashes = _gear_hashes(view[lo:start + HASH_BLOCK])[start - lo:]
+        for cut in (np.flatnonzero(hashes < _CUT_BELOW) + start + 1).tolist():
+            while cut - last > MAX_CHUNK:
+                last += MAX_CHUNK
+                cuts.append(last)
+            if cut - last >= MIN_CHUNK:
+                cuts.append(cut)
+                last = cut
+    while size - last > MAX_CHUNK:
+        last += MAX_CHUNK
+        cuts.append(last)
+    if size > last:
+        cuts.append(size)
+    return cuts
+
+
+def _chunk_path(target, digest):
+    return Path(target) / "chunks" / digest[:2] / digest
+
+
+def _put_chunk(target, data):
+    """Store ``data`` unless present; returns ``(digest, bytes written)``"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(target, digest)
+    if path.exists():
+        return digest, 0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    blob = zlib.compress(data, COMPRESSION_LEVEL)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return digest, len(blob)
+
+
+def _get_chunk(target, digest):
+    with open(_chunk_path(target, digest), "rb") as f:
+        data = zlib.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"Chunk {digest} is corrupt")
+    return data
+
+
+@contextmanager
+def _locked(target):
+    lock = Path(target) / ".lock"
+    lock.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise RuntimeError(f"{target} is in use by another backup (remove {lock} if none is running)")
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        yield
+    finally:
+        os.close(fd)
+        lock.unlink(missing_ok=True)
+
+
+# --- Snapshots ---
+def snapshot_files(diary_dir=DIARY_DIR):
+    """Paths, relative to ``diary_dir``, of the files a snapshot copies"""
+    diary_dir = Path(diary_dir)
+    entries_file = diary_dir / ENTRIES_FILE.name
+    files = []
+    manifest = read_manifest(entries_file)
+    if manifest:
+        shard_dir = shard_dir_for(entries_file).relative_to(diary_dir)
+        files.extend((shard_dir / info["file"]).as_posix() for _, info in sorted(manifest["shards"].items()))
+    revisions_dir = revisions_dir_for(entries_file)
+    if revisions_dir.is_dir():
+        files.extend(path.relative_to(diary_dir).as_posix() for path in sorted(revisions_dir.glob("*.jsonl")))
+    for name in (KEY_FILE.name, PASSKEY_FILE.name, GOALS_FILE.name):
+        if (diary_dir / name).exists():
+            files.append(name)
+    # The entry file goes last: a restore swaps it in after the shards it lists
+    files.append(entries_file.name)
+    return files
+
+
+def list_snapshots(target):
+    """Snapshot ids in ``target``, oldest first"""
+    snapshot_dir = Path(target) / "snapshots"
+    if not snapshot_dir.is_dir():
+        return []
+    return sorted(path.stem for path in snapshot_dir.glob("*.json"))
+
+
+def read_snapshot(target, snapshot_id):
+    with open(Path(target) / "snapshots" / f"{snapshot_id}.json", "r") as f:
+        snapshot = json.load(f)
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"{snapshot_id} is not a diary snapshot")
+    return snapshot
+
+
+def find_snapshot(target, snapshot_id=None, at=None):
+    """The snapshot ``snapshot_id``, else the newest taken at or before ``at``"""
+    if snapshot_id is not None:
+        return read_snapshot(target, snapshot_id)
+    for candidate in reversed(list_snapshots(target)):
+        snapshot = read_snapshot(target, candidate)
+        if at is None or datetime.fromisoformat(snapshot["created"]) <= at:
+            return snapshot
+    return None
+
+
+def _backup_file(target, path, previous, stats):
+    signature = file_signature(path)
+    if previous and (previous["mtime_ns"], previous["size"]) == signature:
+        stats["files_unchanged"] += 1
+        return previous
+    with open(path, "rb") as f:
+        data = f.read()
+    view = memoryview(data)
+    chunks = []
+    last = 0
+    for cut in chunk_boundaries(data):
+        digest, written = _put_chunk(target, view[last:cut])
+        chunks.append(digest)
+        stats["chunks_new" if written else "chunks_reused"] += 1
+        stats["bytes_stored"] += written
+        last = cut
+    stats["files_read"] += 1
+    stats["bytes_read"] += len(data)
+    return {
+        "size": len(data),
+        # Signature from before the read: a write during it forces a re-read next time
+        "mtime_ns": signature[0],
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "chunks": chunks,
+    }
+
+
+def create_snapshot(target, diary_dir=DIARY_DIR):
+    """Back up ``diary_dir`` into ``target``; returns the new snapshot
+
+    The snapshot's ``stats`` record how much was read and stored.
+    """
+    diary_dir, target = Path(diary_dir), Path(target)
+    entries_file = diary_dir / ENTRIES_FILE.name
+    started = time.perf_counter()
+    with _locked(target):
+        existing = list_snapshots(target)
+        previous = read_snapshot(target, existing[-1])["files"] if existing else {}
+        for _ in range(CONSISTENT_READ_ATTEMPTS):
+            stats = dict.fromkeys(("files_read", "files_unchanged", "chunks_new", "chunks_reused",
+                                   "bytes_read", "bytes_stored"), 0)
+            before = file_signature(entries_file)
+            files = {name: _backup_file(target, diary_dir / name, previous.get(name), stats)
+                     for name in snapshot_files(diary_dir)}
+            # Every save rewrites the entry file last, so an unchanged one
+            # means no shard was swapped underneath this snapshot
+            if file_signature(entries_file) == before:
+                break
+        else:
+            raise RuntimeError(f"{entries_file} kept changing; try again when the diary is idle")
+
+        created = datetime.now()
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "version": 1,
+            "id": created.strftime("%Y%m%d-%H%M%S-%f"),
+            "created": created.isoformat(timespec="seconds"),
+            "files": files,
+        }
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        snapshot["stats"] = stats
+        snapshot_dir = target / "snapshots"
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        path = snapshot_dir / f"{snapshot['id']}.json"
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    return snapshot
+
+
+def restore_snapshot(target, diary_dir=DIARY_DIR, snapshot_id=None, at=None):
+    """Restore a snapshot into ``diary_dir``; returns the snapshot restored
+
+    Picks ``snapshot_id``, else the newest snapshot taken at or before the
+    datetime ``at``, else the newest one. Every file is checked against its
+    recorded hash before it replaces the current one. Shards the restored
+    manifest does not list, and revision logs the snapshot does not hold,
+    are removed, so no history newer than the restored entries is left
+    behind. Stop the app first: its
+    writer would otherwise save its own entries over the restored ones.
+    """
+    diary_dir = Path(diary_dir)
+    snapshot = find_snapshot(target, snapshot_id, at)
+    if snapshot is None:
+        raise ValueError(f"No snapshot in {target}" + (f" taken before {at}" if at else ""))
+
+    diary_dir.mkdir(parents=True, exist_ok=True)
+    for name, info in snapshot["files"].items():
+        path = diary_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        digest = hashlib.sha256()
+        with open(tmp_path, "wb") as f:
+            for chunk in info["chunks"]:
+                data = _get_chunk(target, chunk)
+                digest.update(data)
+                f.write(data)
+        if digest.hexdigest() != info["sha256"]:
+            tmp_path.unlink(missing_ok=True)
+            raise ValueError(f"{name} in snapshot {snapshot['id']} does not match its hash")
+        os.replace(tmp_path, path)
+
+    entries_file = diary_dir / ENTRIES_FILE.name
+    restored = {(diary_dir / name).resolve() for name in snapshot["files"]}
+    for folder, pattern in ((shard_dir_for(entries_file), "*.json"), (revisions_dir_for(entries_file), "*.jsonl")):
+        if folder.is_dir():
+            for path in folder.glob(pattern):
+                if path.resolve() not in restored:
+                    path.unlink()
+    return snapshot
+
+
+def prune_snapshots(target, keep):
+    """Keep the newest ``keep`` snapshots; returns ``(snapshots, chunks, bytes)`` removed"""
+    target = Path(target)
+    with _locked(target):
+        snapshot_ids = list_snapshots(target)
+        expired = snapshot_ids[:-keep] if keep > 0 else snapshot_ids
+        for snapshot_id in expired:
+            (target / "snapshots" / f"{snapshot_id}.json").unlink()
+        live = set()
+        for snapshot_id in list_snapshots(target):
+            for info in read_snapshot(target, snapshot_id)["files"].values():
+                live.update(info["chunks"])
+        removed_chunks = removed_bytes = 0
+        chunk_dir = target / "chunks"
+        if chunk_dir.is_dir():
+            for path in chunk_dir.glob("*/*"):
+                if path.name not in live:
+                    removed_bytes += path.stat().st_size
+                    path.unlink()
+                    removed_chunks += 1
+    return len(expired), removed_chunks, removed_bytes
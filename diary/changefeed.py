@@ -0,0 +1,244 @@
+"""Change feed: numbered create, update and delete events for an entry file.
+
+Every write of the entry writer appends one event per changed entry to
+``entries.changes.jsonl`` next to the entry file::
+
+    {"seq": 42, "op": "update", "id": "...", "month": "2025-04", "at": "...", "signature": [...]}
+
+Events name entries but never hold their content, so the log keeps
+nothing the encrypted store does not. ``signature`` is the entry file's
+after the write. If the file has changed since the last event (the CLI,
+a restore, a crash between saving and appending) the next writer or
+reader appends a ``reset``, which tells subscribers to rebuild from the
+store instead of applying events.
+
+Hooks subscribed in-process are called with each appended batch on the
+writing thread; there, created and updated events also carry the
+``Entry`` under ``entry``, and updates the version they replaced under
+``previous``. Other consumers read the log after a sequence
+number, or use ``catch_up`` with a name to keep a checkpoint and resume
+from it after a restart. Only about the newest ``keep`` events are kept;
+a checkpoint older than those gets a ``reset`` first.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from diary.mmapstore import file_signature
+from diary.reporting import report_error
+from diary.storage import ENTRIES_FILE, shard_key
+
+OPS = ("create", "update", "delete", "reset")
+# Event keys handed to hooks but never written to the log
+IN_MEMORY = ("entry", "previous")
+DEFAULT_KEEP = 10_000
+
+
+def changes_path_for(entries_file=None):
+    """Path of the change log of ``entries_file``"""
+    return Path(entries_file or ENTRIES_FILE).with_suffix(".changes.jsonl")
+
+
+def checkpoints_path_for(entries_file=None):
+    """Path of the subscriber checkpoints of ``entries_file``"""
+    return Path(entries_file or ENTRIES_FILE).with_suffix(".checkpoints.json")
+
+
+def entry_event(op, entry, previous=None):
+    """Event for ``entry``; ``previous`` is its stored version before an update"""
+    event = {"op": op, "id": entry['id'], "month": shard_key(entry)}
+    if previous is not None:
+        event["previous"] = previous
+        if shard_key(previous) != event["month"]:
+            # A changed date moves the entry to another month
+            event["previous_month"] = shard_key(previous)
+    if op != "delete":
+        event["entry"] = entry
+    return event
+
+
+class ChangeFeed:
+    """Append-only event log of one entry file, with hooks and checkpoints"""
+
+    def __init__(self, entries_file=None, keep=DEFAULT_KEEP):
+        self.entries_file = Path(entries_file or ENTRIES_FILE)
+        self.path = changes_path_for(self.entries_file)
+        self.keep = keep
+        self._hooks = []
+        self._lock = threading.Lock()
+        self._seen = None
+        self._first = self._last = 0
+        self._count = 0
+        self._signature = None
+
+    # --- Hooks ---
+    def subscribe(self, hook):
+        """Call ``hook(events)`` after every append in this process; returns ``hook``"""
+        self._hooks.append(hook)
+        return hook
+
+    def unsubscribe(self, hook):
+        self._hooks.remove(hook)
+
+    # --- Writing ---
+    @property
+    def last_seq(self):
+        with self._lock:
+            self._refresh()
+            return self._last
+
+    def append(self, events, signature=None):
+        """Number and persist ``events``, then run the hooks; returns the events"""
+        if not events:
+            return events
+        with self._lock:
+            self._refresh()
+            now = datetime.now().isoformat(timespec='seconds')
+            lines = []
+            for event in events:
+                self._last += 1
+                event["seq"] = self._last
+                event.setdefault("at", now)
+                if signature is not None:
+                    event["signature"] = list(signature)
+                lines.append(json.dumps({k: v for k, v in event.items() if k not in IN_MEMORY}, sort_keys=True))
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write("".join(line + "\n" for line in lines))
+            self._first = self._first or events[0]["seq"]
+            self._count += len(events)
+            if signature is not None:
+                self._signature = list(signature)
+            if self._count > 2 * self.keep:
+                self._truncate()
+            self._seen = file_signature(self.path)
+        for hook in list(self._hooks):
+            try:
+                hook(events)
+            except Exception as e:
+                # The write already happened; a failing subscriber must not undo it
+                report_error(f"Change feed subscriber failed: {e}")
+        return events
+
+    def sync(self, signature):
+        """Append a ``reset`` if the entry file changed since the last event; True if so"""
+        with self._lock:
+            self._refresh()
+            recorded = self._signature
+        if recorded == list(signature):
+            return False
+        self.append([{"op": "reset"}], signature)
+        return True
+
+    # --- Reading ---
+    def read(self, after=0):
+        """Events with ``seq`` above ``after``, oldest first
+
+        Starts with a ``reset`` when some of those events were already dropped.
+        """
+        first = True
+        for event in self._iter_file():
+            if first:
+                first = False
+                if after < event["seq"] - 1:
+                    yield {"op": "reset", "seq": event["seq"] - 1}
+            if event["seq"] > after:
+                yield event
+
+    def checkpoint(self, name):
+        """Sequence number ``name`` has processed up to, 0 if it never ran"""
+        return self._checkpoints().get(name, 0)
+
+    def save_checkpoint(self, name, seq):
+        checkpoints = self._checkpoints()
+        checkpoints[name] = seq
+        path = checkpoints_path_for(self.entries_file)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoints, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def catch_up(self, name, handler, batch_size=500):
+        """Pass the events after ``name``'s checkpoint to ``handler`` in batches
+
+        The checkpoint moves after each batch ``handler`` returns from, so
+        a consumer stopped halfway resumes at the first batch it did not
+        finish. Returns the number of events handled.
+        """
+        self.sync(file_signature(self.entries_file))
+        handled = 0
+        batch = []
+        for event in self.read(self.checkpoint(name)):
+            batch.append(event)
+            if len(batch) >= batch_size:
+                handled += self._handle(name, handler, batch)
+                batch = []
+        if batch:
+            handled += self._handle(name, handler, batch)
+        return handled
+
+    # --- Internals ---
+    def _handle(self, name, handler, batch):
+        handler(batch)
+        self.save_checkpoint(name, batch[-1]["seq"])
+        return len(batch)
+
+    def _checkpoints(self):
+        try:
+            with open(checkpoints_path_for(self.entries_file), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _iter_file(self):
+        try:
+            f = open(self.path, "r")
+        except OSError:
+            return
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+
+    def _refresh(self):
+        """Re-read the log's tail if another process appended to it"""
+        seen = file_signature(self.path)
+        if seen == self._seen:
+            return
+        self._first = self._last = self._count = 0
+        self._signature = None
+        for event in self._iter_file():
+            self._first = self._first or event["seq"]
+            self._last = event["seq"]
+            self._count += 1
+            if "signature" in event:
+                self._signature = event["signature"]
+        self._seen = seen
+
+    def _truncate(self):
+        """Keep only the newest ``keep`` events"""
+        lines = []
+        with open(self.path, "r") as f:
+            lines = f.readlines()[-self.keep:]
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+        self._first = json.loads(lines[0])["seq"] if lines else 0
+        self._count = len(lines)
+
+
+def record_changes(entries_file, events, previous_signature):
+    """Append ``events`` for a save made without the entry writer
+
+    ``previous_signature`` is the entry file's before the save, so changes
+    nobody recorded before it still produce a ``reset``.
+    """
+    feed = ChangeFeed(entries_file)
+    feed.sync(previous_signature)
+    return feed.append(events, file_signature(entries_file))
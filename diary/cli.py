@@ -0,0 +1,370 @@
+"""Headless command line for bulk diary jobs.
+
+Runs the same storage, analysis and PDF code as the Streamlit app
+without importing Streamlit::
+
+    python -m diary.cli import notes/ dayone/Journal.json --passkey secret
+    python -m diary.cli export --format pdf --output diary.pdf
+    python -m diary.cli export --format epub --output diary.epub
+    python -m diary.cli reindex --engine textblob
+    python -m diary.cli stats --json
+    python -m diary.cli maintain --dry-run
+    python -m diary.cli shard
+    python -m diary.cli backup create /mnt/backups/diary
+    python -m diary.cli --workspace alice stats
+    python -m diary.cli workspaces
+    python -m diary.cli changes --subscriber nightly-sync
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from diary.analysis import BULK_ENGINE, SENTIMENT_ENGINES, extract_keywords
+from diary.backup import create_snapshot, list_snapshots, prune_snapshots, read_snapshot, restore_snapshot
+from diary.changefeed import ChangeFeed, entry_event, record_changes
+from diary.entries import apply_analysis_batch
+from diary.exporters import export_epub, export_html_site, export_markdown_zip
+from diary.importers import import_entries
+from diary.maintenance import DEFAULT_MAX_AGE, run_maintenance, store_size
+from diary.mmapstore import file_signature
+from diary.storage import ENTRIES_FILE, load_entries, save_entries, shard_store
+from diary.workspaces import list_workspaces, workspace_for
+
+
+# --- Import ---
+def cmd_import(args):
+    try:
+        imported, skipped = import_entries(
+            args.sources,
+            entries_file=args.entries_file,
+            passkey=args.passkey,
+            default_tags=args.tags,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            dry_run=args.dry_run,
+            engine=args.engine,
+        )
+    except (OSError, ValueError) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Imported {imported} entries ({skipped} skipped)")
+    return 0
+
+
+# --- Export ---
+def select_entries(entries, args):
+    """Filter entries by the date range and tags given on the command line"""
+    selected = []
+    for entry in entries:
+        if args.since and entry['date'] < args.since:
+            continue
+        if args.until and entry['date'] > args.until:
+            continue
+        if args.tag and not set(args.tag) & set(entry.get('tags', [])):
+            continue
+        selected.append(entry)
+    selected.sort(key=lambda e: (e['date'], e.get('timestamp', '')))
+    return selected
+
+
+STREAMING_EXPORTERS = {
+    "html": export_html_site,
+    "epub": export_epub,
+    "markdown": export_markdown_zip,
+}
+
+
+def cmd_export(args):
+    # Only the month shards inside --since/--until are read
+    entries = select_entries(load_entries(args.entries_file, since=args.since, until=args.until), args)
+    if not entries:
+        print("No entries match the selection", file=sys.stderr)
+        return 1
+
+    output = Path(args.output)
+    if args.format in STREAMING_EXPORTERS:
+        if args.no_images:
+            entries = (dict(entry, image=None) for entry in entries)
+        count = STREAMING_EXPORTERS[args.format](entries, output)
+        print(f"Exported {count} entries to {output}")
+        return 0
+    if args.format == "jsonl":
+        with open(output, "w", encoding="utf-8") as f:
+            for entry in entries:
+                record = dict(entry)
+                if args.no_images:
+                    record.pop('image', None)
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"Exported {len(entries)} entries to {output}")
+        return 0
+
+    # reportlab is only needed for PDF output
+    from diary.pdf import generate_pdf
+    if args.split:
+        output.mkdir(parents=True, exist_ok=True)
+        for entry in entries:
+            pdf_path = output / f"diary_entry_{entry['date']}_{entry['id'][:8]}.pdf"
+            if generate_pdf([entry], pdf_path) is None:
+                return 1
+    elif generate_pdf(entries, output) is None:
+        return 1
+    print(f"Exported {len(entries)} entries to {output}")
+    return 0
+
+
+# --- Reindex ---
+def cmd_reindex(args):
+    previous_signature = file_signature(args.entries_file)
+    try:
+        # Every shard is rewritten, so one that cannot be read must stop the reindex
+        entries = load_entries(args.entries_file, raise_errors=True)
+    except (OSError, ValueError) as e:
+        print(f"Reindex failed: {e}", file=sys.stderr)
+        return 1
+    for entry in entries:
+        # A full rescore, e.g. with another engine, not just of changed paragraphs
+        entry.pop('arc', None)
+    for offset in range(0, len(entries), args.batch_size):
+        apply_analysis_batch(entries[offset:offset + args.batch_size], args.engine)
+    if not args.dry_run:
+        try:
+            save_entries(entries, args.entries_file, raise_errors=True)
+        except (OSError, ValueError) as e:
+            print(f"Reindex failed: {e}", file=sys.stderr)
+            return 1
+        record_changes(args.entries_file, [entry_event("update", entry) for entry in entries], previous_signature)
+    print(f"Reindexed {len(entries)} entries")
+    return 0
+
+
+# --- Stats ---
+def compute_stats(entries, top=20):
+    """Summary numbers matching the Statistics page"""
+    if not entries:
+        return {"total_entries": 0}
+    word_counts = [e.get('word_count', len(e['content'].split())) for e in entries]
+    sentiments = [e.get('sentiment', 0.0) for e in entries]
+    dates = sorted(e['date'] for e in entries)
+    tag_counts = Counter(tag for e in entries for tag in e.get('tags', []))
+    all_text = " ".join(e['content'] for e in entries)
+    return {
+        "total_entries": len(entries),
+        "total_words": sum(word_counts),
+        "avg_sentiment": sum(sentiments) / len(sentiments),
+        "avg_words_per_entry": sum(word_counts) / len(word_counts),
+        "first_date": dates[0],
+        "last_date": dates[-1],
+        "moods": dict(Counter(e['mood'] for e in entries).most_common()),
+        "tags": dict(tag_counts.most_common()),
+        "top_keywords": dict(extract_keywords(all_text, top)),
+    }
+
+
+def cmd_stats(args):
+    stats = compute_stats(load_entries(args.entries_file, since=args.since, until=args.until), args.top)
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return 0
+    if not stats["total_entries"]:
+        print("No data to analyze yet")
+        return 0
+    print(f"Total Entries:    {stats['total_entries']}")
+    print(f"Total Words:      {stats['total_words']}")
+    print(f"Avg. Sentiment:   {stats['avg_sentiment']:.2f}")
+    print(f"Avg. Words/Entry: {stats['avg_words_per_entry']:.0f}")
+    print(f"Date Range:       {stats['first_date']} .. {stats['last_date']}")
+    for label in ("moods", "tags", "top_keywords"):
+        counts = ", ".join(f"{k} ({v})" for k, v in stats[label].items())
+        print(f"{label.replace('_', ' ').title()}: {counts}")
+    return 0
+
+
+# --- Maintenance ---
+def cmd_maintain(args):
+    report = run_maintenance(args.entries_file, max_age=args.max_age * 3600, dry_run=args.dry_run)
+    for line in report.lines():
+        print(line)
+    return 0
+
+
+def cmd_shard(args):
+    if shard_store(args.entries_file):
+        print(f"Split {args.entries_file} into month shards")
+    else:
+        print(f"{args.entries_file} is already sharded")
+    return 0
+
+
+def cmd_changes(args):
+    feed = ChangeFeed(args.entries_file)
+
+    def show(events):
+        for event in events:
+            print(json.dumps(event, sort_keys=True))
+    if args.subscriber:
+        feed.catch_up(args.subscriber, show)
+    else:
+        feed.sync(file_signature(args.entries_file))
+        show(feed.read(args.after))
+    return 0
+
+
+def cmd_workspaces(args):
+    if args.workspaces_dir is None:
+        print("DIARY_WORKSPACES_DIR is not set; there is only the default diary", file=sys.stderr)
+        return 1
+    workspaces = list_workspaces(args.workspaces_dir)
+    for workspace in workspaces:
+        print(f"{workspace.name:<24} {store_size(workspace.entries_file):>12} bytes")
+    print(f"{len(workspaces)} diaries in {args.workspaces_dir}")
+    return 0
+
+
+# --- Backup ---
+def cmd_backup_create(args):
+    snapshot = create_snapshot(args.target, args.entries_file.parent)
+    stats = snapshot["stats"]
+    print(f"Snapshot {snapshot['id']}: read {stats['files_read']} files "
+          f"({stats['files_unchanged']} unchanged), {stats['chunks_new']} new chunks "
+          f"({stats['bytes_stored']} bytes stored), {stats['chunks_reused']} reused, {stats['seconds']} s")
+    return 0
+
+
+def cmd_backup_list(args):
+    for snapshot_id in list_snapshots(args.target):
+        snapshot = read_snapshot(args.target, snapshot_id)
+        size = sum(info["size"] for info in snapshot["files"].values())
+        print(f"{snapshot_id}  {snapshot['created']}  {len(snapshot['files'])} files  {size} bytes")
+    return 0
+
+
+def cmd_backup_restore(args):
+    at = datetime.fromisoformat(args.at) if args.at else None
+    diary_dir = args.into or args.entries_file.parent
+    try:
+        snapshot = restore_snapshot(args.target, diary_dir, snapshot_id=args.snapshot, at=at)
+    except (OSError, ValueError) as e:
+        print(f"Restore failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Restored snapshot {snapshot['id']} ({snapshot['created']}) into {diary_dir}")
+    return 0
+
+
+def cmd_backup_prune(args):
+    snapshots, chunks, size = prune_snapshots(args.target, args.keep)
+    print(f"Removed {snapshots} snapshots and {chunks} unused chunks ({size} bytes)")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m diary.cli", description=__doc__.split("\n")[0])
+    parser.add_argument("--entries-file", type=Path, default=ENTRIES_FILE,
+                        help=f"Entry file to operate on (default: {ENTRIES_FILE})")
+    parser.add_argument("--workspace", help="Operate on this diary of --workspaces-dir instead of --entries-file")
+    parser.add_argument("--workspaces-dir", type=Path, default=os.environ.get("DIARY_WORKSPACES_DIR") or None,
+                        help="Folder of diaries (default: $DIARY_WORKSPACES_DIR)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="Import Markdown, text, JSONL or Day One exports")
+    p.add_argument("sources", nargs="+", help="Files or folders (.md, .txt, .jsonl, Day One .json)")
+    p.add_argument("--passkey", default="", help="Entry passkey for records without a passkey_hash")
+    p.add_argument("--tag", dest="tags", action="append", default=None,
+                   help="Tag for records without tags (repeatable, default: Personal)")
+    p.add_argument("--batch-size", type=int, default=256, help="Records analysed per batch")
+    p.add_argument("--workers", type=int, default=None,
+                   help="Analysis processes (default: CPU count, 1 disables the pool)")
+    p.add_argument("--engine", choices=sorted(SENTIMENT_ENGINES), default=BULK_ENGINE,
+                   help=f"Sentiment engine (default: {BULK_ENGINE})")
+    p.add_argument("--dry-run", action="store_true", help="Analyse but do not write")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="Export entries as PDF, JSONL, an HTML site, EPUB or Markdown")
+    p.add_argument("--format", choices=["pdf", "jsonl", "html", "epub", "markdown"], default="pdf",
+                   help="html and markdown write a .zip archive")
+    p.add_argument("--output", required=True, help="Output file (or folder with --split)")
+    p.add_argument("--split", action="store_true", help="Write one PDF per entry into --output")
+    p.add_argument("--since", help="Only entries on or after YYYY-MM-DD")
+    p.add_argument("--until", help="Only entries on or before YYYY-MM-DD")
+    p.add_argument("--tag", action="append", help="Only entries with this tag (repeatable)")
+    p.add_argument("--no-images", action="store_true",
+                   help="Leave images out of JSONL, HTML, EPUB and Markdown output")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("reindex", help="Recompute sentiment, word counts and keywords")
+    p.add_argument("--engine", choices=sorted(SENTIMENT_ENGINES), default=BULK_ENGINE,
+                   help=f"Sentiment engine (default: {BULK_ENGINE})")
+    p.add_argument("--batch-size", type=int, default=256, help="Entries scored per engine call")
+    p.add_argument("--dry-run", action="store_true", help="Analyse but do not write")
+    p.set_defaults(func=cmd_reindex)
+
+    p = sub.add_parser("stats", help="Print writing statistics")
+    p.add_argument("--top", type=int, default=20, help="Number of keywords to list")
+    p.add_argument("--since", help="Only entries on or after YYYY-MM-DD")
+    p.add_argument("--until", help="Only entries on or before YYYY-MM-DD")
+    p.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("maintain", help="Compact the entry file and delete leftover temp files")
+    p.add_argument("--max-age", type=float, default=DEFAULT_MAX_AGE / 3600,
+                   help="Only delete temp files older than this many hours (default: 1)")
+    p.add_argument("--dry-run", action="store_true", help="Report what would be removed")
+    p.set_defaults(func=cmd_maintain)
+
+    p = sub.add_parser("shard", help="Split a single-file entry store into month shards")
+    p.set_defaults(func=cmd_shard)
+
+    p = sub.add_parser("changes", help="Print change feed events as JSON lines")
+    p.add_argument("--after", type=int, default=0, help="Only events after this sequence number")
+    p.add_argument("--subscriber", help="Print the events after this subscriber's checkpoint and advance it")
+    p.set_defaults(func=cmd_changes)
+
+    p = sub.add_parser("workspaces", help="List the diaries in --workspaces-dir")
+    p.set_defaults(func=cmd_workspaces)
+
+    p = sub.add_parser("backup", help="Snapshot, list, restore or prune backups in a folder")
+    backup = p.add_subparsers(dest="backup_command", required=True)
+    p = backup.add_parser("create", help="Take a snapshot; unchanged data is not copied again")
+    p.add_argument("target", type=Path, help="Backup folder")
+    p.set_defaults(func=cmd_backup_create)
+    p = backup.add_parser("list", help="List snapshots, oldest first")
+    p.add_argument("target", type=Path, help="Backup folder")
+    p.set_defaults(func=cmd_backup_list)
+    p = backup.add_parser("restore", help="Restore a snapshot (stop the app first)")
+    p.add_argument("target", type=Path, help="Backup folder")
+    p.add_argument("--snapshot", help="Snapshot id (default: the newest)")
+    p.add_argument("--at", help="Restore the newest snapshot taken at or before YYYY-MM-DD[THH:MM]")
+    p.add_argument("--into", type=Path, help="Restore into this folder instead of the diary folder")
+    p.set_defaults(func=cmd_backup_restore)
+    p = backup.add_parser("prune", help="Delete old snapshots and the chunks only they used")
+    p.add_argument("target", type=Path, help="Backup folder")
+    p.add_argument("--keep", type=int, default=30, help="Snapshots to keep (default: 30)")
+    p.set_defaults(func=cmd_backup_prune)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "workspaces":
+        return args.func(args)
+    if args.workspace:
+        try:
+            workspace = workspace_for(args.workspace, args.workspaces_dir)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        if not workspace.exists():
+            print(f"No diary called {workspace.name} in {args.workspaces_dir}", file=sys.stderr)
+            return 1
+        args.entries_file = workspace.entries_file
+    if not args.entries_file.exists():
+        args.entries_file.parent.mkdir(parents=True, exist_ok=True)
+        save_entries([], args.entries_file)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""Short-lived record of entries whose passkey was just verified.
+
+Passkey hashes use a deliberately slow KDF, so a session that has proven
+it knows an entry's passkey keeps that proof for a few minutes instead of
+re-deriving the key on every edit or delete. Each proof is tied to the
+entry's stored hash, so changing or upgrading the passkey invalidates it.
+"""
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 32
+
+
+class VerifiedKeyCache:
+    """Bounded LRU of ``entry_id -> (passkey_hash, expires_at)``"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._verified = OrderedDict()
+
+    def __len__(self):
+        return len(self._verified)
+
+    def add(self, entry_id, passkey_hash):
+        """Record that the passkey for ``entry_id`` was just checked"""
+        self._verified[entry_id] = (passkey_hash, self._clock() + self.ttl)
+        self._verified.move_to_end(entry_id)
+        while len(self._verified) > self.max_entries:
+            self._verified.popitem(last=False)
+
+    def is_verified(self, entry_id, passkey_hash):
+        """True if ``entry_id`` was verified against ``passkey_hash`` and has not expired"""
+        cached = self._verified.get(entry_id)
+        if cached is None:
+            return False
+        if cached[0] != passkey_hash or cached[1] <= self._clock():
+            del self._verified[entry_id]
+            return False
+        self._verified.move_to_end(entry_id)
+        return True
+
+    def discard(self, entry_id):
+        self._verified.pop(entry_id, None)
+
+    def clear(self):
+        self._verified.clear()
@@ -0,0 +1,56 @@
+"""Building and refreshing entry records"""
+import uuid
+from datetime import datetime
+
+from diary.analysis import extract_keywords
+from diary.arcs import update_arc, update_arcs
+from diary.storage import hash_passkey
+
+
+def apply_analysis(entry, keywords=None, sentiment=None):
+    """Recompute the derived sentiment/keyword fields of an entry in place.
+
+    Sentiment comes from the entry's arc, rescored only for paragraphs
+    changed since it was last analysed; ``sentiment`` may be passed in
+    when the arc was already updated in a batch.
+    Returns the ``(sentiment, keywords)`` pair so callers can show it.
+    """
+    if sentiment is None:
+        sentiment = update_arc(entry)
+    if keywords is None:
+        keywords = extract_keywords(entry['content'])
+    entry['sentiment'] = sentiment['polarity']
+    entry['subjectivity'] = sentiment['subjectivity']
+    entry['word_count'] = sentiment['word_count']
+    entry['keywords'] = [kw[0] for kw in keywords]
+    return sentiment, keywords
+
+
+def apply_analysis_batch(entries, engine=None):
+    """``apply_analysis`` for many entries, scored with one engine call"""
+    sentiments = update_arcs(entries, engine)
+    for entry, sentiment in zip(entries, sentiments):
+        apply_analysis(entry, sentiment=sentiment)
+
+
+def make_entry(title, content, date, mood, tags, passkey=None,
+               image=None, timestamp=None, passkey_hash=None, analyze=True):
+    """Create a new entry dict in the on-disk layout
+
+    With ``analyze=False`` the derived fields are left for the caller,
+    e.g. to ``apply_analysis_batch``.
+    """
+    entry = {
+        "id": str(uuid.uuid4()),
+        "date": str(date),
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "title": title,
+        "content": content,
+        "mood": mood,
+        "tags": list(tags),
+    }
+    if analyze:
+        apply_analysis(entry)
+    entry["image"] = image
+    entry["passkey_hash"] = passkey_hash or hash_passkey(passkey or "")
+    return entry
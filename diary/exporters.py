@@ -0,0 +1,269 @@
+"""Streaming exports: static HTML site, EPUB book and Markdown archive.
+
+Each exporter writes one zip-based file entry by entry, so only the entry
+being written is in memory and ``entries`` can be a generator. Pages are
+rendered with the same Markdown setup as the PDF export; images are
+stored as files beside the pages rather than inline base64. All three
+take ``progress(fraction)`` and the number of entries as ``total`` when
+``entries`` has no length.
+"""
+import base64
+import binascii
+import html
+import json
+import re
+import zipfile
+from datetime import datetime
+
+from diary.markup import convert_markdown_to_html, html_excerpt
+from diary.profiling import timed_function
+
+EXCERPT_CHARS = 160
+IMAGE_TYPES = (
+    (b"\x89PNG", "png", "image/png"),
+    (b"\xff\xd8", "jpg", "image/jpeg"),
+    (b"GIF8", "gif", "image/gif"),
+    (b"RIFF", "webp", "image/webp"),
+)
+STYLESHEET = """\
+body { font-family: Georgia, serif; max-width: 42em; margin: 2em auto; padding: 0 1em; line-height: 1.5; color: #222; }
+nav { display: flex; justify-content: space-between; margin: 2em 0; }
+.meta { color: #666; font-size: 0.9em; }
+.tag { background: #eef; border-radius: 3px; padding: 0 0.3em; margin-right: 0.3em; }
+pre { background: #f4f4f4; padding: 0.8em; overflow-x: auto; }
+img { max-width: 100%; }
+li { margin: 0.4em 0; }
+"""
+
+
+# --- Helpers ---
+def _slug(entry):
+    words = re.sub(r"[^a-z0-9]+", "-", str(entry.get('title') or '').lower()).strip("-")[:40]
+    return f"{entry.get('date', 'undated')}-{words or 'entry'}-{str(entry.get('id', ''))[:8]}"
+
+
+def _image(entry):
+    """``(bytes, extension, media type)`` of the entry image, or None"""
+    if not entry.get('image'):
+        return None
+    try:
+        data = base64.b64decode(entry['image'])
+    except (binascii.Error, ValueError):
+        return None
+    for magic, extension, media_type in IMAGE_TYPES:
+        if data.startswith(magic):
+            return data, extension, media_type
+    return data, "png", "image/png"
+
+
+def _excerpt(page_html):
+    # Taken from the page already rendered rather than converting the Markdown twice
+    return html_excerpt(page_html, EXCERPT_CHARS)
+
+
+def _with_lookahead(entries):
+    """``(previous, entry, next)`` over an iterable, reading one entry ahead"""
+    iterator = iter(entries)
+    previous, current = None, next(iterator, None)
+    while current is not None:
+        following = next(iterator, None)
+        yield previous, current, following
+        previous, current = current, following
+
+
+def _reporter(entries, progress, total):
+    if total is None and hasattr(entries, "__len__"):
+        total = len(entries)
+    if progress is None or not total:
+        return lambda done: None
+    return lambda done: progress(done / total)
+
+
+def _meta_html(entry):
+    tags = "".join(f'<span class="tag">{html.escape(tag)}</span>' for tag in entry.get('tags') or [])
+    return (f'<p class="meta">{html.escape(str(entry.get("date", "")))} · '
+            f'{html.escape(str(entry.get("mood", "")))} {tags}</p>')
+
+
+# --- HTML site ---
+def _html_page(title, body, stylesheet, xhtml=False):
+    if xhtml:
+        return ('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+                f'<head><meta charset="utf-8"/><title>{html.escape(title)}</title>'
+                f'<link rel="stylesheet" href="{stylesheet}" type="text/css"/></head>\n'
+                f'<body>\n{body}\n</body>\n</html>\n')
+    return ('<!DOCTYPE html>\n<html lang="en">\n'
+            f'<head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">'
+            f'<title>{html.escape(title)}</title><link rel="stylesheet" href="{stylesheet}"></head>\n'
+            f'<body>\n{body}\n</body>\n</html>\n')
+
+
+def _month_page(month, items):
+    heading = f'<p><a href="../index.html">← All months</a></p><h1>{html.escape(month)}</h1>'
+    return _html_page(month, heading + "\n" + "\n".join(items), "../style.css")
+
+
+@timed_function()
+def export_html_site(entries, output_path, progress=None, total=None):
+    """Write a static site as a zip: an index of months, a page per month
+    and a page per entry
+
+    Entries should come in date order. Only the current month's listing is
+    held while writing, so memory stays flat however long the diary is.
+    Returns the number of entries written.
+    """
+    report = _reporter(entries, progress, total)
+    months = []  # (page, label, count)
+    items = []
+    written = 0
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("style.css", STYLESHEET)
+
+        def close_month():
+            page, label, _ = months[-1]
+            archive.writestr(f"months/{page}.html", _month_page(label, items))
+            months[-1] = (page, label, len(items))
+            items.clear()
+
+        for written, (previous, entry, following) in enumerate(_with_lookahead(entries), 1):
+            slug = _slug(entry)
+            title = str(entry.get('title') or 'Untitled')
+            date = str(entry.get('date') or '')
+            label = date[:7] or 'Undated'
+            if not months or months[-1][1] != label:
+                if months:
+                    close_month()
+                # Out-of-order input revisits a month; it gets another page
+                seen = sum(month[1] == label for month in months)
+                months.append((f"{label}-{seen + 1}" if seen else label, label, 0))
+            content = convert_markdown_to_html(entry.get('content'))
+            body = [f'<p><a href="../months/{months[-1][0]}.html">← {html.escape(label)}</a></p>',
+                    f"<h1>{html.escape(title)}</h1>", _meta_html(entry), content]
+            image = _image(entry)
+            if image:
+                data, extension, _ = image
+                archive.writestr(f"images/{slug}.{extension}", data, compress_type=zipfile.ZIP_STORED)
+                body.append(f'<p><img src="../images/{slug}.{extension}" alt="Attached image"></p>')
+            links = [f'<a href="{_slug(previous)}.html">← {html.escape(str(previous.get("title", "")))}</a>'
+                     if previous else "<span></span>",
+                     f'<a href="{_slug(following)}.html">{html.escape(str(following.get("title", "")))} →</a>'
+                     if following else "<span></span>"]
+            body.append(f"<nav>{''.join(links)}</nav>")
+            archive.writestr(f"entries/{slug}.html", _html_page(title, "\n".join(body), "../style.css"))
+            items.append(f'<p><a href="../entries/{slug}.html"><strong>{html.escape(title)}</strong></a> '
+                         f'<span class="meta">{html.escape(date)} · {html.escape(str(entry.get("mood", "")))}'
+                         f"</span><br>{html.escape(_excerpt(content))}</p>")
+            report(written)
+        if months:
+            close_month()
+
+        listing = "\n".join(f'<li><a href="months/{page}.html">{html.escape(label)}</a> '
+                            f'<span class="meta">({count} entries)</span></li>'
+                            for page, label, count in reversed(months))
+        heading = (f'<h1>My Personal Diary</h1><p class="meta">{written} entries · exported '
+                   f"{datetime.now():%B %d, %Y}</p>")
+        archive.writestr("index.html", _html_page("My Personal Diary", f"{heading}\n<ul>\n{listing}\n</ul>",
+                                                  "style.css"))
+    return written
+
+
+# --- EPUB ---
+CONTAINER_XML = """\
+<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>
+"""
+
+
+@timed_function()
+def export_epub(entries, output_path, progress=None, total=None, title="My Personal Diary"):
+    """Write an EPUB 3 book with one chapter per entry
+
+    Returns the number of entries written.
+    """
+    report = _reporter(entries, progress, total)
+    manifest = []
+    chapters = []
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as book:
+        # The mimetype must come first and uncompressed
+        book.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        book.writestr("META-INF/container.xml", CONTAINER_XML)
+        book.writestr("OEBPS/style.css", STYLESHEET)
+        for done, entry in enumerate(entries, 1):
+            chapter_id = f"entry{done}"
+            entry_title = str(entry.get('title') or 'Untitled')
+            body = [f"<h1>{html.escape(entry_title)}</h1>", _meta_html(entry),
+                    convert_markdown_to_html(entry.get('content'), xhtml=True)]
+            image = _image(entry)
+            if image:
+                data, extension, media_type = image
+                book.writestr(f"OEBPS/images/{chapter_id}.{extension}", data, compress_type=zipfile.ZIP_STORED)
+                manifest.append((f"{chapter_id}-image", f"images/{chapter_id}.{extension}", media_type))
+                body.append(f'<p><img src="images/{chapter_id}.{extension}" alt="Attached image"/></p>')
+            book.writestr(f"OEBPS/{chapter_id}.xhtml",
+                          _html_page(entry_title, "\n".join(body), "style.css", xhtml=True))
+            manifest.append((chapter_id, f"{chapter_id}.xhtml", "application/xhtml+xml"))
+            chapters.append((chapter_id, f"{entry.get('date', '')} - {entry_title}"))
+            report(done)
+
+        toc = "\n".join(f'<li><a href="{chapter_id}.xhtml">{html.escape(label)}</a></li>'
+                        for chapter_id, label in chapters)
+        book.writestr("OEBPS/nav.xhtml", _html_page(
+            "Contents", f'<nav epub:type="toc" id="toc"><h1>Contents</h1><ol>\n{toc}\n</ol></nav>',
+            "style.css", xhtml=True))
+        items = "\n".join(f'    <item id="{item_id}" href="{href}" media-type="{media_type}"/>'
+                          for item_id, href, media_type in manifest)
+        spine = "\n".join(f'    <itemref idref="{chapter_id}"/>' for chapter_id, _ in chapters)
+        book.writestr("OEBPS/content.opf", f"""\
+<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="book-id">urn:diary:{datetime.now():%Y%m%d%H%M%S}</dc:identifier>
+    <dc:title>{html.escape(title)}</dc:title>
+    <dc:language>en</dc:language>
+    <meta property="dcterms:modified">{datetime.utcnow():%Y-%m-%dT%H:%M:%SZ}</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+    <item id="style" href="style.css" media-type="text/css"/>
+{items}
+  </manifest>
+  <spine>
+{spine}
+  </spine>
+</package>
+""")
+    return len(chapters)
+
+
+# --- Markdown archive ---
+FRONT_MATTER_FIELDS = ('id', 'title', 'date', 'timestamp', 'mood', 'tags', 'sentiment', 'word_count')
+
+
+@timed_function()
+def export_markdown_zip(entries, output_path, progress=None, total=None):
+    """Write each entry as a Markdown file with front matter, plus its image
+
+    Returns the number of entries written.
+    """
+    report = _reporter(entries, progress, total)
+    index = []
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for done, entry in enumerate(entries, 1):
+            slug = _slug(entry)
+            # JSON values are valid YAML, so any front matter reader can load them
+            front_matter = "\n".join(f"{field}: {json.dumps(entry[field], ensure_ascii=False)}"
+                                     for field in FRONT_MATTER_FIELDS if field in entry)
+            text = f"---\n{front_matter}\n---\n\n{entry.get('content') or ''}\n"
+            image = _image(entry)
+            if image:
+                data, extension, _ = image
+                archive.writestr(f"attachments/{slug}.{extension}", data, compress_type=zipfile.ZIP_STORED)
+                text += f"\n![Attached image](../attachments/{slug}.{extension})\n"
+            archive.writestr(f"entries/{slug}.md", text)
+            index.append(f"- {entry.get('date', '')} [{entry.get('title') or 'Untitled'}](entries/{slug}.md)")
+            report(done)
+        archive.writestr("index.md", "# My Personal Diary\n\n" + "\n".join(index) + "\n")
+    return len(index)
@@ -0,0 +1,215 @@
+"""Background export jobs with progress, kept on disk until downloaded.
+
+Pages hand entries to an ``ExportQueue`` and return at once. A small
+thread pool renders the queued jobs as PDF, a zipped HTML site, EPUB or a
+Markdown archive, at most ``workers`` at a time, while each job reports
+its progress. A finished file is written next to its target and swapped
+in, together with a small JSON record, so it is still there for download
+after the page (or the whole app) is restarted.
+Only the newest ``keep`` finished jobs are kept; maintenance removes
+exports older than a week. Queues of several diaries can share one
+``executor``, so ``workers`` bounds the exports of the whole process.
+"""
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from diary.exporters import export_epub, export_html_site, export_markdown_zip
+from diary.reporting import capture_errors
+from diary.storage import EXPORTS_DIR
+
+DEFAULT_WORKERS = 2
+DEFAULT_KEEP = 20
+DEFAULT_MAX_PENDING = 20
+
+
+def _render_pdf(entries, path, progress, total):
+    # reportlab is only imported once a PDF is actually requested; it lays
+    # out the whole document at once, so the entries are collected first
+    from diary.pdf import generate_pdf
+    return generate_pdf(list(entries), path, progress=progress) is not None
+
+
+def _render_streaming(exporter):
+    def render(entries, path, progress, total):
+        exporter(entries, path, progress=progress, total=total)
+        return True
+    return render
+
+
+# format -> (file suffix, MIME type, render(entries, path, progress, total) -> success)
+FORMATS = {
+    "pdf": (".pdf", "application/pdf", _render_pdf),
+    "html": (".zip", "application/zip", _render_streaming(export_html_site)),
+    "epub": (".epub", "application/epub+zip", _render_streaming(export_epub)),
+    "markdown": (".zip", "application/zip", _render_streaming(export_markdown_zip)),
+}
+
+
+class ExportJob:
+    """One export; ``status`` is queued, running, done or failed"""
+
+    def __init__(self, job_id, label, file_name, export_format, created=None):
+        self.id = job_id
+        self.label = label
+        self.file_name = file_name
+        self.format = export_format
+        self.created = created or datetime.now()
+        self.status = "queued"
+        self.progress = 0.0
+        self.error = None
+        self.finished = None
+        self.path = None
+
+    @property
+    def mime(self):
+        return FORMATS[self.format][1]
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def to_record(self):
+        return {
+            "id": self.id,
+            "label": self.label,
+            "file_name": self.file_name,
+            "format": self.format,
+            "created": self.created.isoformat(timespec="seconds"),
+            "finished": self.finished.isoformat(timespec="seconds"),
+            "path": Path(self.path).name,
+        }
+
+    @classmethod
+    def from_record(cls, record, export_dir):
+        job = cls(record["id"], record["label"], record["file_name"], record["format"],
+                  datetime.fromisoformat(record["created"]))
+        job.status = "done"
+        job.progress = 1.0
+        job.finished = datetime.fromisoformat(record["finished"])
+        job.path = Path(export_dir) / record["path"]
+        return job
+
+
+class ExportQueue:
+    """Runs exports on a bounded thread pool and keeps their results on disk"""
+
+    def __init__(self, export_dir=None, workers=DEFAULT_WORKERS, keep=DEFAULT_KEEP,
+                 max_pending=DEFAULT_MAX_PENDING, executor=None):
+        self.export_dir = Path(export_dir or EXPORTS_DIR)
+        self.keep = keep
+        self.max_pending = max_pending
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix="diary-export")
+        self._load_finished()
+
+    # --- Public API ---
+    def submit(self, entries, label, file_name, export_format="pdf", total=None):
+        """Queue an export of ``entries``; returns its ``ExportJob``
+
+        ``entries`` may be a generator, read on the worker thread; pass its
+        length as ``total`` for progress. Raises ``RuntimeError`` when
+        ``max_pending`` jobs are already waiting.
+        """
+        if export_format not in FORMATS:
+            raise ValueError(f"Unknown export format: {export_format}")
+        with self._lock:
+            if sum(job.active for job in self._jobs.values()) >= self.max_pending:
+                raise RuntimeError("Too many exports are already waiting; try again when some have finished")
+            job = ExportJob(uuid.uuid4().hex[:12], label, file_name, export_format)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, entries, total)
+        return job
+
+    def jobs(self):
+        """Jobs, newest first; finished ones whose file was removed are dropped"""
+        with self._lock:
+            for job in list(self._jobs.values()):
+                if job.status == "done" and not Path(job.path).exists():
+                    del self._jobs[job.id]
+            return sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def remove(self, job_id):
+        """Forget a finished job and delete its file"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.active:
+                return False
+            del self._jobs[job_id]
+        self._delete_files(job)
+        return True
+
+    def clear_finished(self):
+        for job in self.jobs():
+            if not job.active:
+                self.remove(job.id)
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads; a shared executor is left to its owner"""
+        if self._owns_executor:
+            self._executor.shutdown(wait=wait)
+
+    # --- Worker ---
+    def _record_path(self, job_id):
+        return self.export_dir / f"{job_id}.json"
+
+    def _delete_files(self, job):
+        for path in (job.path, self._record_path(job.id)):
+            if path is not None:
+                Path(path).unlink(missing_ok=True)
+
+    def _load_finished(self):
+        if not self.export_dir.is_dir():
+            return
+        for record_path in self.export_dir.glob("*.json"):
+            try:
+                with open(record_path, "r") as f:
+                    job = ExportJob.from_record(json.load(f), self.export_dir)
+            except (OSError, ValueError, KeyError):
+                continue
+            if job.format in FORMATS and job.path.exists():
+                self._jobs[job.id] = job
+
+    def _set_progress(self, job, fraction):
+        job.progress = max(job.progress, min(fraction, 1.0))
+
+    def _run(self, job, entries, total):
+        job.status = "running"
+        suffix, _, render = FORMATS[job.format]
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        path = self.export_dir / f"{job.id}{suffix}"
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            with capture_errors() as errors:
+                ok = render(entries, tmp_path, lambda fraction: self._set_progress(job, fraction), total)
+            if not ok:
+                raise RuntimeError(errors[-1] if errors else "Export failed")
+            os.replace(tmp_path, path)
+            job.path = path
+            job.finished = datetime.now()
+            # The record goes last: a job is only listed after a restart once its file is complete
+            record_tmp = self._record_path(job.id).with_suffix(".json.tmp")
+            with open(record_tmp, "w") as f:
+                json.dump(job.to_record(), f)
+            os.replace(record_tmp, self._record_path(job.id))
+            job.progress = 1.0
+            job.status = "done"
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            job.error = str(e)
+            job.status = "failed"
+        self._prune()
+
+    def _prune(self):
+        finished = [job for job in self.jobs() if job.status == "done"]
+        for job in finished[self.keep:]:
+            self.remove(job.id)
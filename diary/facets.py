@@ -0,0 +1,45 @@
+"""Faceted entry filtering over the posting lists in ``entries.mmap``.
+
+Values within one facet are alternatives (``Work`` or ``Ideas``), different
+facets narrow each other, and selected tags must all be present. Each
+selection is answered by merging and intersecting sorted posting lists,
+smallest first, so the cost follows the size of the matches rather than
+the size of the diary.
+"""
+from functools import reduce
+
+import numpy as np
+
+
+def _union(mapped, facet, values):
+    # Within the mood and month facets an entry has one value, so the lists are disjoint
+    return np.sort(np.concatenate([mapped.postings(facet, value) for value in values]))
+
+
+def select_rows(mapped, tags=(), moods=(), months=()):
+    """Sorted row numbers of the entries matching the selection"""
+    candidates = [mapped.postings('tag', tag) for tag in tags]
+    if moods:
+        candidates.append(_union(mapped, 'mood', moods))
+    if months:
+        candidates.append(_union(mapped, 'month', months))
+    if not candidates:
+        return np.arange(len(mapped))
+    candidates.sort(key=len)
+    return reduce(lambda rows, other: np.intersect1d(rows, other, assume_unique=True), candidates)
+
+
+def _count_within(posting, rows):
+    positions = np.searchsorted(rows, posting)
+    positions[positions == len(rows)] = 0
+    return int(np.count_nonzero(rows[positions] == posting)) if len(rows) else 0
+
+
+def facet_counts(mapped, rows=None):
+    """``{facet: {value: count}}``, restricted to ``rows`` when given"""
+    if rows is None:
+        return {facet: mapped.facet_counts(facet) for facet in mapped.facets}
+    return {
+        facet: {value: _count_within(mapped.postings(facet, value), rows) for value in mapped.facets[facet]}
+        for facet in mapped.facets
+    }
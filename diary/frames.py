@@ -0,0 +1,75 @@
+"""DataFrame preparation shared by the entry table and the statistics page"""
+import pandas as pd
+
+# Columns shown in the entry table
+GRID_COLUMNS = ['date', 'title', 'mood', 'tags', 'word_count', 'sentiment']
+
+
+def entries_dataframe(entries):
+    """Build the DataFrame behind the entry table, filling missing columns"""
+    df = pd.DataFrame(entries)
+    df['date'] = pd.to_datetime(df['date'])
+
+    # Ensure all required columns exist
+    for col in GRID_COLUMNS:
+        if col not in df.columns:
+            if col == 'word_count':
+                df[col] = df['content'].apply(lambda x: len(str(x).split()))
+            elif col == 'sentiment':
+                df[col] = 0.0  # Default sentiment value
+            else:
+                df[col] = ''  # Default empty value for other columns
+    return df
+
+
+def stats_dataframe(entries):
+    """Build the DataFrame behind the statistics page"""
+    df = pd.DataFrame(entries)
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def analyze_writing_habits(df):
+    """Analyze writing patterns
+
+    Days and hours come from when an entry was written (``timestamp``);
+    ``date`` carries no time of day, so entries without a timestamp count
+    on their date and are left out of the hours.
+    """
+    if 'timestamp' in df.columns:
+        written = pd.to_datetime(df['timestamp'].astype(str).str[:19], errors='coerce')
+    else:
+        written = pd.Series(pd.NaT, index=df.index)
+    df['day_of_week'] = written.fillna(df['date']).dt.day_name()
+    df['hour'] = written.dt.hour.astype('Int64')
+    df['month'] = df['date'].dt.month_name()
+
+    # Most active days
+    day_counts = df['day_of_week'].value_counts().reset_index()
+    day_counts.columns = ['Day', 'Entries']
+
+    # Most active hours
+    hour_counts = df['hour'].dropna().astype(int).value_counts().reset_index()
+    hour_counts.columns = ['Hour', 'Entries']
+
+    return day_counts, hour_counts
+
+
+def mapped_dataframe(mapped):
+    """Entry metadata from a ``MappedEntries`` view, without touching bodies.
+
+    Has the ``GRID_COLUMNS`` plus ``id`` and ``subjectivity``; rows are in
+    file order so ``df.index`` matches the mapped entry index.
+    """
+    records = mapped.records
+    metas = mapped.all_meta()
+    return pd.DataFrame({
+        'id': [meta['id'] for meta in metas],
+        'date': pd.to_datetime(records['date']),
+        'title': [meta['title'] for meta in metas],
+        'mood': mapped.mood_column(),
+        'tags': [meta['tags'] for meta in metas],
+        'word_count': records['word_count'].astype('int64'),
+        'sentiment': records['sentiment'].copy(),
+        'subjectivity': records['subjectivity'].copy(),
+    })
@@ -0,0 +1,258 @@
+"""Streaming bulk import from Markdown, plain text, JSONL and Day One exports.
+
+Readers yield raw records (``title``, ``content``, ``date`` and optional
+``mood``/``tags``/``image``/``timestamp``) one file at a time. Records are
+grouped into batches, analysed in a process pool and written to the entry
+file with a single ``save_entries`` call at the end of the run, which
+adds one ``create`` event per entry to the change feed. Each batch is
+scored with one call to the bulk sentiment engine.
+"""
+import base64
+import json
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+from diary.analysis import BULK_ENGINE
+from diary.changefeed import entry_event, record_changes
+from diary.entries import apply_analysis_batch, make_entry
+from diary.mmapstore import file_signature
+from diary.storage import hash_passkey, load_entries, save_entries, shard_key
+
+DATE_IN_NAME = re.compile(r'(\d{4}-\d{2}-\d{2})')
+# Day One escapes Markdown punctuation in its JSON export
+DAY_ONE_ESCAPE = re.compile(r'\\([\\`*_{}\[\]()#+\-.!>])')
+DEFAULT_MOOD = '🙂'
+DEFAULT_TAGS = ["Personal"]
+MARKDOWN_SUFFIXES = {".md", ".markdown"}
+TEXT_SUFFIXES = {".txt"}
+
+
+# --- Readers ---
+def split_title(text, fallback):
+    """Use a leading ``# `` heading as the title and drop it from the body"""
+    lines = text.split('\n')
+    for i, line in enumerate(lines):
+        if line.startswith('# '):
+            return line[2:].strip(), '\n'.join(lines[:i] + lines[i + 1:]).strip()
+        if line.strip():
+            break
+    return fallback, text.strip()
+
+
+def date_for_file(path):
+    """A ``YYYY-MM-DD`` in the file name, else the modification date"""
+    match = DATE_IN_NAME.search(path.name)
+    if match:
+        return match.group(1)
+    return datetime.fromtimestamp(path.stat().st_mtime).date().isoformat()
+
+
+def read_markdown_file(path):
+    """Turn a Markdown file into a raw record"""
+    path = Path(path)
+    title, content = split_title(path.read_text(encoding="utf-8"), path.stem)
+    return {"title": title, "content": content, "date": date_for_file(path)}
+
+
+def read_text_file(path):
+    """Turn a plain-text file into a raw record; the first line is the title"""
+    path = Path(path)
+    text = path.read_text(encoding="utf-8").strip()
+    first, _, rest = text.partition('\n')
+    if rest.strip() and len(first) <= 120:
+        title, content = first.strip(), rest.strip()
+    else:
+        title, content = path.stem, text
+    return {"title": title, "content": content, "date": date_for_file(path)}
+
+
+def iter_jsonl(path):
+    """Yield one record per non-empty line of a JSONL file"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping {path}:{line_no}: {e}", file=sys.stderr)
+
+
+def _day_one_photo(photos_dir, photos):
+    """Base64 of the first attached photo that exists next to the export"""
+    for photo in photos or []:
+        for suffix in (photo.get("type"), "jpeg", "jpg", "png"):
+            if not suffix or not photo.get("md5"):
+                continue
+            candidate = photos_dir / f"{photo['md5']}.{suffix}"
+            if candidate.exists():
+                return base64.b64encode(candidate.read_bytes()).decode("utf-8")
+    return None
+
+
+def iter_day_one(path):
+    """Yield records from a Day One JSON export (``{"entries": [...]}``).
+
+    Photos are picked up from the ``photos/`` folder Day One writes next
+    to the JSON file; only the first photo of an entry is kept since the
+    diary stores a single image per entry.
+    """
+    path = Path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    photos_dir = path.parent / "photos"
+    for item in data.get("entries", []):
+        text = item.get("text") or ""
+        created = item.get("creationDate") or ""
+        title, content = split_title(DAY_ONE_ESCAPE.sub(r'\1', text), "Untitled")
+        if title == "Untitled" and content:
+            title = content.split('\n', 1)[0][:80]
+        yield {
+            "title": title,
+            "content": content,
+            "date": created[:10] or None,
+            "timestamp": created.rstrip("Z") or None,
+            "tags": item.get("tags") or None,
+            "image": _day_one_photo(photos_dir, item.get("photos")),
+        }
+
+
+def is_day_one_export(path):
+    """Cheap check for the Day One export layout without parsing the file"""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(4096)
+    return '"entries"' in head and '"metadata"' in head
+
+
+def iter_file(path):
+    """Yield records from a single file, chosen by its suffix"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    try:
+        if suffix in MARKDOWN_SUFFIXES:
+            yield read_markdown_file(path)
+        elif suffix in TEXT_SUFFIXES:
+            yield read_text_file(path)
+        elif suffix == ".jsonl":
+            yield from iter_jsonl(path)
+        elif suffix == ".json" and is_day_one_export(path):
+            yield from iter_day_one(path)
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        print(f"Skipping {path}: {e}", file=sys.stderr)
+
+
+def iter_records(sources):
+    """Yield raw records from files and folders, walking folders in name order"""
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    yield from iter_file(Path(root) / name)
+        else:
+            yield from iter_file(source)
+
+
+# --- Analysis ---
+def record_to_entry(record, passkey_hash, default_tags, analyze=True):
+    """Build an entry from a raw record, or None if it is empty or its date is not a date"""
+    if not record.get("content"):
+        return None
+    date = str(record.get("date") or datetime.now().date().isoformat())[:10]
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        # The app parses every stored date; one it cannot read breaks the entry list
+        return None
+    return make_entry(
+        title=record.get("title") or "Untitled",
+        content=record["content"],
+        date=date,
+        mood=record.get("mood") or DEFAULT_MOOD,
+        tags=record.get("tags") or default_tags,
+        image=record.get("image"),
+        timestamp=record.get("timestamp"),
+        passkey_hash=record.get("passkey_hash") or passkey_hash,
+        analyze=analyze,
+    )
+
+
+def analyze_batch(records, passkey_hash, default_tags, engine=BULK_ENGINE):
+    """Analyse a batch of records; runs inside pool workers"""
+    entries = []
+    for record in records:
+        entry = record_to_entry(record, passkey_hash, default_tags, analyze=False)
+        if entry is not None:
+            entries.append(entry)
+    apply_analysis_batch(entries, engine)
+    return entries, len(records) - len(entries)
+
+
+def iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_analyzed(records, passkey_hash, default_tags, batch_size=256, workers=None,
+                  engine=BULK_ENGINE):
+    """Yield ``(entries, skipped)`` per batch, in input order.
+
+    With more than one worker, batches are analysed in a process pool
+    with at most ``2 * workers`` batches in flight, so memory stays flat
+    no matter how many files are streamed in.
+    """
+    workers = workers or os.cpu_count() or 1
+    batches = iter_batches(records, batch_size)
+    if workers == 1:
+        for batch in batches:
+            yield analyze_batch(batch, passkey_hash, default_tags, engine)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(analyze_batch, batch, passkey_hash, default_tags, engine))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def import_entries(sources, entries_file=None, passkey="", default_tags=None,
+                   batch_size=256, workers=None, dry_run=False, engine=BULK_ENGINE):
+    """Import every record found in ``sources`` into the entry file.
+
+    Existing entries are loaded once and the combined list is written
+    with one ``save_entries`` call. A store that cannot be loaded or saved
+    raises, and nothing is imported. ``engine`` names the sentiment engine.
+    Returns ``(imported, skipped)``.
+    """
+    passkey_hash = hash_passkey(passkey)
+    default_tags = default_tags or DEFAULT_TAGS
+    new_entries = []
+    skipped = 0
+    for entries, batch_skipped in iter_analyzed(iter_records(sources), passkey_hash,
+                                                default_tags, batch_size, workers, engine):
+        new_entries.extend(entries)
+        skipped += batch_skipped
+
+    if new_entries and not dry_run:
+        previous_signature = file_signature(entries_file)
+        # The months imported into are rewritten, so they must have been read in full
+        entries = load_entries(entries_file, raise_errors=True)
+        entries.extend(new_entries)
+        save_entries(entries, entries_file, months={shard_key(entry) for entry in new_entries}, raise_errors=True)
+        record_changes(entries_file, [entry_event("create", entry) for entry in new_entries], previous_signature)
+    return len(new_entries), skipped
@@ -0,0 +1,291 @@
+"""Compaction and garbage collection for the diary data directories.
+
+``run_maintenance`` does two things and reports the bytes reclaimed:
+
+* compacts the entry file: duplicate ids left by interrupted writes are
+  collapsed to the newest copy and empty ``image`` fields (left behind when
+  an image is removed in the editor) are dropped;
+* removes leftovers: temporary PDFs and images from failed exports,
+  ``*.tmp`` files from interrupted writes, month shards the manifest no
+  longer lists, derived files (``.mmap``, vector and activity indexes) whose entry file
+  no longer exists, background exports older than a week, and truncated
+  or corrupt downloads in ``fonts/``, which are fetched again on next use.
+
+Images are stored inline in the entry file, so there are no separately
+stored attachments to collect. Files younger than ``max_age`` are left
+alone because an export or write may still be using them.
+
+``MaintenanceScheduler`` runs the same job periodically on a background
+thread. Compaction goes through the ``EntryWriter`` queue when one is
+given, so it is ordered with regular saves, and readers keep using the
+memory-mapped view until the new files are swapped in.
+"""
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from diary.activity import activity_path_for
+from diary.changefeed import changes_path_for, checkpoints_path_for
+from diary.mmapstore import mapped_path_for
+from diary.similarity import vector_paths_for
+from diary.storage import (
+    DIARY_DIR,
+    ENTRIES_FILE,
+    EXPORTS_DIR,
+    FONTS_DIR,
+    TEMP_PREFIX,
+    load_entries,
+    read_manifest,
+    save_entries,
+    shard_dir_for,
+)
+
+DEFAULT_MAX_AGE = 3600
+EXPORT_MAX_AGE = 7 * 24 * 3600
+# Index files kept beside an entry file; they are not entry files themselves
+DERIVED_JSON = (".vectors.json", ".activity.json", ".checkpoints.json")
+TTF_TAGS = (b"\x00\x01\x00\x00", b"true", b"OTTO", b"ttcf")
+TABLE_RECORD = struct.Struct(">4sIII")
+
+
+class MaintenanceReport:
+    """What a maintenance run removed or would remove"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.finished = None
+        self.compacted = 0
+        self.removed = []  # (path, bytes, reason)
+        self.compaction_bytes = 0
+
+    @property
+    def reclaimed(self):
+        return self.compaction_bytes + sum(size for _, size, _ in self.removed)
+
+    def lines(self):
+        verb = "Would remove" if self.dry_run else "Removed"
+        lines = [f"{verb} {path} ({_format_size(size)}, {reason})" for path, size, reason in self.removed]
+        if self.compacted:
+            verb = "Would compact" if self.dry_run else "Compacted"
+            lines.append(f"{verb} {self.compacted} entries ({_format_size(self.compaction_bytes)})")
+        lines.append(f"{'Reclaimable' if self.dry_run else 'Reclaimed'}: {_format_size(self.reclaimed)}")
+        return lines
+
+
+def _format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+# --- Compaction ---
+def compact_entries(entries):
+    """Compact ``entries`` in place; returns ``(changed, removed_ids)``
+
+    Keeps the last copy of a repeated id and drops empty ``image`` fields.
+    """
+    last_index = {entry['id']: i for i, entry in enumerate(entries)}
+    removed_ids = []
+    if len(last_index) != len(entries):
+        removed_ids = [entry['id'] for i, entry in enumerate(entries) if last_index[entry['id']] != i]
+        entries[:] = [entry for i, entry in enumerate(entries) if last_index[entry['id']] == i]
+    changed = len(removed_ids)
+    for entry in entries:
+        if 'image' in entry and not entry['image']:
+            del entry['image']
+            changed += 1
+    return changed, removed_ids
+
+
+def compact_store(entries_file=None, writer=None, dry_run=False):
+    """Compact the entry file; returns ``(entries changed, bytes reclaimed)``"""
+    entries_file = Path(entries_file or ENTRIES_FILE)
+    if writer is not None and not dry_run:
+        size_before = store_size(entries_file)
+        changed = writer.compact().result()
+        return changed, size_before - store_size(entries_file)
+
+    entries = load_entries(entries_file)
+    size_before = store_size(entries_file)
+    changed, _ = compact_entries(entries)
+    if not changed or dry_run:
+        return changed, 0
+    save_entries(entries, entries_file)
+    return changed, size_before - store_size(entries_file)
+
+
+# --- Garbage Collection ---
+def _size(path):
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def store_size(entries_file):
+    """Bytes used by the entry file and the shards its manifest lists"""
+    entries_file = Path(entries_file)
+    manifest = read_manifest(entries_file)
+    shards = manifest["shards"].values() if manifest else ()
+    return _size(entries_file) + sum(_size(shard_dir_for(entries_file) / info["file"]) for info in shards)
+
+
+def _is_stale(path, max_age, now):
+    try:
+        return now - path.stat().st_mtime >= max_age
+    except OSError:
+        return False
+
+
+def font_is_complete(path):
+    """True if ``path`` looks like a whole TrueType/OpenType file"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(12)
+            if len(header) < 12 or header[:4] not in TTF_TAGS:
+                return False
+            if header[:4] == b"ttcf":
+                return True
+            num_tables = struct.unpack(">H", header[4:6])[0]
+            directory = f.read(TABLE_RECORD.size * num_tables)
+    except OSError:
+        return False
+    if len(directory) < TABLE_RECORD.size * num_tables:
+        return False
+    # Every table must fit inside the file; a cut-off download fails this
+    size = path.stat().st_size
+    for i in range(num_tables):
+        _, _, offset, length = TABLE_RECORD.unpack_from(directory, i * TABLE_RECORD.size)
+        if offset + length > size:
+            return False
+    return True
+
+
+def _shard_garbage(entries_file, max_age, now):
+    shard_dir = shard_dir_for(entries_file)
+    if not shard_dir.is_dir():
+        return []
+    manifest = read_manifest(entries_file)
+    listed = {info["file"] for info in manifest["shards"].values()} if manifest else set()
+    garbage = []
+    for path in shard_dir.iterdir():
+        # Age check: a shard written just before its manifest is not an orphan yet
+        if not _is_stale(path, max_age, now):
+            continue
+        if path.name.endswith(".tmp"):
+            garbage.append((path, "interrupted write"))
+        elif path.suffix == ".json" and path.name not in listed:
+            garbage.append((path, "shard not in the manifest"))
+    return garbage
+
+
+def find_garbage(diary_dir=DIARY_DIR, fonts_dir=FONTS_DIR, temp_dir=None, max_age=DEFAULT_MAX_AGE, now=None):
+    """``[(path, reason)]`` of files that are safe to delete"""
+    now = time.time() if now is None else now
+    diary_dir, fonts_dir = Path(diary_dir), Path(fonts_dir)
+    temp_dir = Path(temp_dir or tempfile.gettempdir())
+    garbage = []
+
+    for pattern in (f"{TEMP_PREFIX}*.pdf", f"{TEMP_PREFIX}*.png"):
+        for path in temp_dir.glob(pattern):
+            if _is_stale(path, max_age, now):
+                garbage.append((path, "orphaned export temp file"))
+
+    if diary_dir.is_dir():
+        for path in diary_dir.glob("*.tmp"):
+            if _is_stale(path, max_age, now):
+                garbage.append((path, "interrupted write"))
+        sources = {p for p in diary_dir.glob("*.json") if not p.name.endswith(DERIVED_JSON)}
+        derived = list(diary_dir.glob("*.mmap")) + list(diary_dir.glob("*.vectors.npy")) \
+            + list(diary_dir.glob("*.changes.jsonl")) \
+            + [p for p in diary_dir.glob("*.json") if p.name.endswith(DERIVED_JSON)]
+        owned = set()
+        for source in sources:
+            owned.add(mapped_path_for(source))
+            owned.update(vector_paths_for(source))
+            owned.add(activity_path_for(source))
+            owned.add(changes_path_for(source))
+            owned.add(checkpoints_path_for(source))
+        for path in derived:
+            if path not in owned:
+                garbage.append((path, "index for a missing entry file"))
+        for source in sources:
+            garbage.extend(_shard_garbage(source, max_age, now))
+
+    exports_dir = diary_dir / EXPORTS_DIR.name
+    if exports_dir.is_dir():
+        for path in exports_dir.iterdir():
+            if path.name.endswith(".tmp"):
+                if _is_stale(path, max_age, now):
+                    garbage.append((path, "interrupted export"))
+            elif _is_stale(path, max(max_age, EXPORT_MAX_AGE), now):
+                garbage.append((path, "expired export"))
+
+    if fonts_dir.is_dir():
+        for path in fonts_dir.iterdir():
+            if path.name.endswith(".tmp"):
+                if _is_stale(path, max_age, now):
+                    garbage.append((path, "interrupted font download"))
+            elif path.is_file() and path.suffix.lower() == ".ttf" and not font_is_complete(path):
+                garbage.append((path, "incomplete font download"))
+    return garbage
+
+
+def run_maintenance(entries_file=None, writer=None, fonts_dir=FONTS_DIR, temp_dir=None,
+                    max_age=DEFAULT_MAX_AGE, dry_run=False):
+    """Compact the store and collect garbage; returns a ``MaintenanceReport``"""
+    entries_file = Path(entries_file or ENTRIES_FILE)
+    report = MaintenanceReport(dry_run)
+    report.compacted, report.compaction_bytes = compact_store(entries_file, writer, dry_run)
+    for path, reason in find_garbage(entries_file.parent, fonts_dir, temp_dir, max_age):
+        size = _size(path)
+        if not dry_run:
+            try:
+                path.unlink()
+            except OSError:
+                continue
+        report.removed.append((path, size, reason))
+    report.finished = datetime.now()
+    return report
+
+
+class MaintenanceScheduler:
+    """Runs ``run_maintenance`` every ``interval`` seconds on a daemon thread"""
+
+    def __init__(self, interval, **maintenance_kwargs):
+        self.interval = interval
+        self.maintenance_kwargs = maintenance_kwargs
+        self.last_report = None
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="diary-maintenance", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run_soon(self):
+        """Run at the next opportunity instead of waiting for the interval"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            if self._stop.is_set():
+                break
+            self._wake.clear()
+            try:
+                self.last_report = run_maintenance(**self.maintenance_kwargs)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
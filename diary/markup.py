@@ -0,0 +1,96 @@
+"""Markdown rendering shared by the exporters and the entry view"""
+import html
+import re
+import threading
+
+import html2text
+import markdown
+from bs4 import BeautifulSoup
+
+MARKDOWN_EXTENSIONS = ['tables', 'fenced_code']
+_TAG_RE = re.compile(r"<[^>]*>?")
+_URL_ATTRIBUTE_RE = re.compile(r'\b(href|src)="([^"]*)"', re.IGNORECASE)
+_URL_SCHEME_RE = re.compile(r'([a-z][a-z0-9+.-]*):', re.IGNORECASE)
+# Browsers drop these anywhere in a URL, so "java\tscript:" still runs script
+_URL_IGNORED_RE = re.compile(r'[\x00-\x20\x7f]+')
+# Links shown in the app may only use these schemes, or none (relative links)
+SAFE_URL_SCHEMES = {"http", "https", "mailto"}
+_converters = threading.local()
+
+
+def safe_url(url):
+    """``url`` if it is relative or uses a safe scheme, else ``#``
+
+    ``url`` is an attribute value, so entities are decoded first, as the
+    browser would decode ``&#106;avascript:``.
+    """
+    scheme = _URL_SCHEME_RE.match(_URL_IGNORED_RE.sub("", html.unescape(url)))
+    if scheme and scheme.group(1).lower() not in SAFE_URL_SCHEMES:
+        return "#"
+    return url
+
+
+def _safe_link(match):
+    return f'{match.group(1)}="{safe_url(match.group(2))}"'
+
+
+def _markdown(output_format="html", raw_html=True):
+    """A reset ``Markdown`` converter for this thread
+
+    Building one loads every extension, which costs more than converting a
+    typical entry, so each thread keeps one per output format.
+    """
+    name = output_format if raw_html else f"{output_format}_escaped"
+    converter = getattr(_converters, name, None)
+    if converter is None:
+        converter = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS, output_format=output_format)
+        if not raw_html:
+            converter.preprocessors.deregister('html_block')
+            converter.inlinePatterns.deregister('html')
+        setattr(_converters, name, converter)
+    return converter.reset()
+
+
+def convert_markdown_to_text(markdown_text):
+    """Convert markdown to plain text for PDF"""
+    # First convert markdown to HTML
+    html = _markdown().convert(markdown_text)
+    
+    # Then convert HTML to plain text while preserving some formatting
+    h = html2text.HTML2Text()
+    h.ignore_links = True
+    h.ignore_images = True
+    h.body_width = 0  # No wrapping
+    text = h.handle(html)
+    
+    # Clean up any remaining HTML tags
+    text = re.sub(r'<[^>]+>', '', text)
+    
+    return text
+
+
+def convert_markdown_to_html(markdown_text, xhtml=False, raw_html=True):
+    """Render entry Markdown as an HTML fragment
+
+    With ``xhtml`` the fragment is well-formed XML, as EPUB requires. Raw
+    HTML or entities typed into an entry are passed through by Markdown,
+    so those entries are re-serialised to keep them from breaking the book.
+    Without ``raw_html`` typed HTML is shown as text and links and images
+    other than relative, http, https and mailto ones point nowhere, so the
+    result is safe to show in the app.
+    """
+    markdown_text = markdown_text or ""
+    if not raw_html:
+        return _URL_ATTRIBUTE_RE.sub(_safe_link, _markdown(raw_html=False).convert(markdown_text))
+    if not xhtml:
+        return _markdown().convert(markdown_text)
+    html = _markdown("xhtml").convert(markdown_text)
+    if "<" in markdown_text or "&" in markdown_text:
+        html = BeautifulSoup(html, "html.parser").decode(formatter="minimal")
+    return html
+
+
+def html_excerpt(page_html, limit):
+    """The first ``limit`` characters of rendered HTML as one line of text"""
+    text = " ".join(html.unescape(_TAG_RE.sub(" ", page_html[:limit * 8])).split())
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + "…"
@@ -0,0 +1,302 @@
+"""Memory-mapped read path for the entry file.
+
+``entries.json`` stays the source of truth. Next to it we keep a derived
+``entries.mmap`` laid out as::
+
+    header | string tables (JSON) | fixed-size metadata records | postings | blobs
+
+Each metadata record holds the date, mood, sentiment, subjectivity and
+word count plus (offset, length) pairs into the blob region for the
+small per-entry metadata (id, title, tags, timestamp), the content, the
+image and any remaining fields. The per-entry metadata blobs come first
+and together form one JSON array, so a whole column of titles or tags
+is a single parse.
+
+The postings region holds sorted int32 row numbers per tag, mood and
+month (``YYYY-MM``); the string tables map each facet value to its slice
+of that region, so facet counts and filters never scan the entries.
+
+The record array is exposed as a NumPy view over the map, so table and
+statistics code can scan it without deserialising anything; bodies and
+images are sliced and decoded only for the entries that are opened.
+"""
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from diary.model import Entry
+from diary.profiling import timed, timed_function
+from diary.storage import ENTRIES_FILE, decrypt_data, encrypt_data, load_entries
+
+MAGIC = b"DIARYMM1"
+VERSION = 2
+# magic, version, count, tables_len, records_off, blobs_off, meta region length,
+# source mtime_ns, source size
+HEADER = struct.Struct("<8sHIIQQQqq")
+RECORD_DTYPE = np.dtype([
+    ('date', '<M8[D]'),
+    ('sentiment', '<f8'),
+    ('subjectivity', '<f8'),
+    ('word_count', '<u4'),
+    ('mood', '<u2'),
+    ('has_image', 'u1'),
+    ('_pad', 'u1'),
+    ('meta_off', '<u8'), ('meta_len', '<u4'),
+    ('content_off', '<u8'), ('content_len', '<u4'),
+    ('image_off', '<u8'), ('image_len', '<u4'),
+    ('extra_off', '<u8'), ('extra_len', '<u4'),
+])
+META_FIELDS = ('id', 'title', 'tags', 'timestamp')
+FACETS = ('tag', 'mood', 'month')
+FIXED_FIELDS = ('date', 'mood', 'sentiment', 'subjectivity', 'word_count', 'content', 'image')
+
+
+def mapped_path_for(entries_file=None):
+    """Path of the mapped file derived from ``entries_file``"""
+    return Path(entries_file or ENTRIES_FILE).with_suffix(".mmap")
+
+
+def file_signature(path):
+    """``(mtime_ns, size)`` of ``path``, or ``(0, -1)`` if it is missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (0, -1)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _parse_date(value):
+    try:
+        return np.datetime64(str(value)[:10], 'D')
+    except ValueError:
+        return np.datetime64('NaT', 'D')
+
+
+@timed_function("mmap.build")
+def build_mapped_store(entries, path, source_signature):
+    """Write ``entries`` (``Entry`` objects or plain decrypted dicts) to ``path``"""
+    path = Path(path)
+    moods = []
+    mood_index = {}
+    postings = {facet: {} for facet in FACETS}
+    records = np.zeros(len(entries), dtype=RECORD_DTYPE)
+    blobs = bytearray(b"[")
+
+    # Metadata blobs first, comma-separated so the region is a JSON array
+    for i, entry in enumerate(entries):
+        if i:
+            blobs.extend(b",")
+        meta = json.dumps({key: entry.get(key) for key in META_FIELDS}, ensure_ascii=False).encode('utf-8')
+        records[i]['meta_off'], records[i]['meta_len'] = len(blobs), len(meta)
+        blobs.extend(meta)
+    blobs.extend(b"]")
+    meta_region_len = len(blobs)
+
+    def add_blob(data):
+        offset = len(blobs)
+        blobs.extend(data)
+        return offset, len(data)
+
+    for i, entry in enumerate(entries):
+        record = records[i]
+        mood = entry.get('mood', '')
+        if mood not in mood_index:
+            mood_index[mood] = len(moods)
+            moods.append(mood)
+        if isinstance(entry, Entry):
+            # Already encrypted in memory; no decrypt/encrypt round trip
+            encrypted = entry.encrypted_content() or ''
+        else:
+            encrypted = encrypt_data(entry.get('content') or '')
+        record['date'] = _parse_date(entry.get('date'))
+        postings['mood'].setdefault(mood, []).append(i)
+        for tag in dict.fromkeys(entry.get('tags') or ()):
+            postings['tag'].setdefault(tag, []).append(i)
+        if not np.isnat(record['date']):
+            postings['month'].setdefault(str(entry.get('date'))[:7], []).append(i)
+        record['mood'] = mood_index[mood]
+        record['sentiment'] = entry.get('sentiment', 0.0) or 0.0
+        record['subjectivity'] = entry.get('subjectivity', 0.0) or 0.0
+        if 'word_count' in entry:
+            record['word_count'] = entry['word_count']
+        else:
+            record['word_count'] = len((entry.get('content') or '').split())
+        extra = {k: entry[k] for k in entry if k not in META_FIELDS and k not in FIXED_FIELDS}
+        record['content_off'], record['content_len'] = add_blob(encrypted.encode('utf-8'))
+        if entry.get('image'):
+            record['has_image'] = 1
+            record['image_off'], record['image_len'] = add_blob(entry['image'].encode('ascii'))
+        record['extra_off'], record['extra_len'] = add_blob(json.dumps(extra, ensure_ascii=False).encode('utf-8'))
+
+    # Rows were visited in order, so every posting list is already sorted
+    flat = []
+    facets = {}
+    for facet, values in postings.items():
+        facets[facet] = {}
+        for value, rows in values.items():
+            facets[facet][value] = [len(flat), len(rows)]
+            flat.extend(rows)
+    posting_array = np.array(flat, dtype='<i4')
+
+    tables = json.dumps({"moods": moods, "facets": facets}, ensure_ascii=False).encode('utf-8')
+    records_off = HEADER.size + len(tables)
+    records_off += -records_off % 8
+    blobs_off = records_off + records.nbytes + posting_array.nbytes
+    header = HEADER.pack(MAGIC, VERSION, len(entries), len(tables), records_off, blobs_off,
+                         meta_region_len, source_signature[0], source_signature[1])
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(tables)
+        f.write(b"\0" * (records_off - HEADER.size - len(tables)))
+        f.write(records.tobytes())
+        f.write(posting_array.tobytes())
+        f.write(blobs)
+    os.replace(tmp_path, path)
+
+
+class MappedEntries:
+    """Read-only view of an ``entries.mmap`` file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, count, tables_len, records_off, blobs_off,
+         meta_region_len, mtime_ns, size) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} mapped entry file")
+        self.source_signature = (mtime_ns, size)
+        tables = json.loads(self._map[HEADER.size:HEADER.size + tables_len].decode('utf-8'))
+        self.moods = np.array(tables["moods"] or [''], dtype=object)
+        self.facets = tables["facets"]
+        self._blobs_off = blobs_off
+        self._meta_region_len = meta_region_len
+        self._all_meta = None
+        # Zero-copy: the structured array reads straight from the map
+        self.records = np.frombuffer(self._map, dtype=RECORD_DTYPE, count=count, offset=records_off)
+        postings_off = records_off + self.records.nbytes
+        self._postings = np.frombuffer(self._map, dtype='<i4', count=(blobs_off - postings_off) // 4,
+                                       offset=postings_off)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Views into the map must be gone before it can be closed
+        self.records = None
+        self._postings = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Someone still holds a view; the map is released with it
+                pass
+            self._map = None
+        self._file.close()
+
+    # --- Columns ---
+    def mood_column(self):
+        """Mood strings for every entry"""
+        return self.moods[self.records['mood']]
+
+    # --- Facets ---
+    def facet_counts(self, facet):
+        """``{value: entry count}`` for a facet, straight from the tables"""
+        return {value: length for value, (_, length) in self.facets[facet].items()}
+
+    def postings(self, facet, value):
+        """Sorted row numbers of the entries with ``value`` for ``facet``"""
+        start, length = self.facets[facet].get(value, (0, 0))
+        return self._postings[start:start + length]
+
+    def _blob(self, i, field):
+        offset = self._blobs_off + int(self.records[i][f'{field}_off'])
+        return self._map[offset:offset + int(self.records[i][f'{field}_len'])]
+
+    def meta(self, i):
+        """``id``, ``title``, ``tags`` and ``timestamp`` of entry ``i``"""
+        return json.loads(self._blob(i, 'meta').decode('utf-8'))
+
+    def all_meta(self):
+        """Metadata dicts for every entry, parsed in one pass and kept"""
+        if self._all_meta is None:
+            region = self._map[self._blobs_off:self._blobs_off + self._meta_region_len]
+            self._all_meta = json.loads(region.decode('utf-8'))
+        return self._all_meta
+
+    def meta_column(self, field):
+        """One metadata field for every entry"""
+        return [meta[field] for meta in self.all_meta()]
+
+    # --- Bodies ---
+    def content(self, i):
+        """Decrypted content of entry ``i``"""
+        return decrypt_data(self._blob(i, 'content').decode('utf-8'))
+
+    def image(self, i):
+        """Base64 image of entry ``i``, or None"""
+        if not self.records[i]['has_image']:
+            return None
+        return self._blob(i, 'image').decode('ascii')
+
+    def iter_contents(self):
+        for i in range(len(self)):
+            yield self.content(i)
+
+    def entry(self, i):
+        """Full entry dict ``i`` in the ``load_entries`` layout"""
+        record = self.records[i]
+        meta = self.meta(i)
+        entry = {
+            "id": meta['id'],
+            "date": str(record['date']),
+            "timestamp": meta['timestamp'],
+            "title": meta['title'],
+            "content": self.content(i),
+            "mood": self.moods[record['mood']],
+            "tags": meta['tags'],
+            "sentiment": float(record['sentiment']),
+            "subjectivity": float(record['subjectivity']),
+            "word_count": int(record['word_count']),
+        }
+        entry.update(json.loads(self._blob(i, 'extra').decode('utf-8')))
+        entry["image"] = self.image(i)
+        return entry
+
+    def find(self, entry_id):
+        """Index of the entry with ``entry_id``, or None"""
+        for i, meta in enumerate(self.all_meta()):
+            if meta['id'] == entry_id:
+                return i
+        return None
+
+
+def open_mapped_entries(entries_file=None):
+    """Open the mapped view of ``entries_file``, rebuilding it if stale"""
+    entries_file = Path(entries_file or ENTRIES_FILE)
+    path = mapped_path_for(entries_file)
+    signature = file_signature(entries_file)
+    if path.exists():
+        try:
+            mapped = MappedEntries(path)
+            if mapped.source_signature == signature:
+                return mapped
+            mapped.close()
+        except (ValueError, struct.error, OSError):
+            pass
+    with timed("mmap.rebuild"):
+        build_mapped_store(load_entries(entries_file), path, signature)
+    return MappedEntries(path)
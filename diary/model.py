@@ -0,0 +1,175 @@
+"""Compact in-memory entry model.
+
+``Entry`` behaves like the plain entry dicts the app has always used
+(``entry['title']``, ``entry.get('image')``, ``dict(entry)``) but stores
+its fields in ``__slots__`` instead of a per-entry dict:
+
+* moods, dates, tags, keywords and passkey hashes are interned, and
+  identical tag combinations share one tuple;
+* content is kept exactly as stored on disk (encrypted) and decrypted
+  on access, so loading never decodes bodies nobody reads and saving an
+  unchanged entry writes the stored string back as-is;
+* the base64 image string is kept as loaded and only decoded by the code
+  that displays or exports it.
+"""
+import sys
+from collections.abc import MutableMapping
+
+from diary.storage import decrypt_data, encrypt_data
+
+# Field order used when writing entries.json
+FIELDS = ('id', 'date', 'timestamp', 'title', 'content', 'mood', 'tags', 'sentiment',
+          'subjectivity', 'word_count', 'keywords', 'arc', 'image', 'passkey_hash', 'last_edited')
+_SLOT_FIELDS = tuple(f for f in FIELDS if f != 'content')
+_SLOT_SET = frozenset(_SLOT_FIELDS)
+_MISSING = object()
+_TAG_TUPLES = {}
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _intern_tags(tags):
+    """Interned tag tuple, shared by every entry with the same tags"""
+    key = tuple(_intern(tag) for tag in tags)
+    return _TAG_TUPLES.setdefault(key, key)
+
+
+_CONVERTERS = {
+    'date': _intern,
+    'mood': _intern,
+    'passkey_hash': _intern,
+    'tags': _intern_tags,
+    'keywords': lambda words: tuple(_intern(word) for word in words),
+}
+
+
+class Entry(MutableMapping):
+    """One diary entry with dict-style access and slotted storage"""
+
+    __slots__ = _SLOT_FIELDS + ('_raw_content', '_content', '_extra')
+
+    def __init__(self, fields=None, **kwargs):
+        for name in _SLOT_FIELDS:
+            object.__setattr__(self, name, _MISSING)
+        self._raw_content = None
+        self._content = _MISSING
+        self._extra = None
+        if fields or kwargs:
+            self.update(fields or (), **kwargs)
+
+    @classmethod
+    def from_record(cls, record):
+        """Build an entry from a stored record whose content is still encrypted
+
+        ``record`` is consumed; it is normally a freshly parsed JSON object.
+        """
+        entry = cls()
+        entry._raw_content = record.pop('content', None)
+        for key, value in record.items():
+            if key in _SLOT_SET:
+                converter = _CONVERTERS.get(key)
+                if converter is not None and value is not None:
+                    value = converter(value)
+                object.__setattr__(entry, key, value)
+            else:
+                if entry._extra is None:
+                    entry._extra = {}
+                entry._extra[key] = value
+        return entry
+
+    def encrypted_content(self):
+        """Content as stored on disk, re-encrypted only if it was changed"""
+        if self._content is not _MISSING:
+            return encrypt_data(self._content)
+        return self._raw_content
+
+    def to_record(self):
+        """The on-disk dict for this entry, with content encrypted"""
+        record = {}
+        for name in FIELDS:
+            if name == 'content':
+                if 'content' in self:
+                    record['content'] = self.encrypted_content()
+                continue
+            value = getattr(self, name)
+            if value is not _MISSING:
+                record[name] = list(value) if isinstance(value, tuple) else value
+        if self._extra:
+            record.update(self._extra)
+        return record
+
+    # --- Mapping protocol ---
+    def __getitem__(self, key):
+        if key == 'content':
+            if self._content is not _MISSING:
+                return self._content
+            if self._raw_content is None:
+                raise KeyError(key)
+            # Not cached: the stored string is the only copy kept in memory
+            return decrypt_data(self._raw_content)
+        if key in _SLOT_SET:
+            value = getattr(self, key)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'content':
+            self._content = value
+            self._raw_content = None
+        elif key in _SLOT_SET:
+            converter = _CONVERTERS.get(key)
+            if converter is not None and value is not None:
+                value = converter(value)
+            object.__setattr__(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key == 'content':
+            self._content = _MISSING
+            self._raw_content = None
+        elif key in _SLOT_SET:
+            object.__setattr__(self, key, _MISSING)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key == 'content':
+            return self._content is not _MISSING or self._raw_content is not None
+        if key in _SLOT_SET:
+            return getattr(self, key) is not _MISSING
+        return bool(self._extra) and key in self._extra
+
+    def __iter__(self):
+        for name in FIELDS:
+            if name in self:
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Entry(id={self.get('id')!r}, date={self.get('date')!r}, title={self.get('title')!r})"
+
+    def copy(self):
+        """Shallow copy; the stored content string is shared, not re-encoded"""
+        entry = Entry()
+        for name in _SLOT_FIELDS:
+            object.__setattr__(entry, name, getattr(self, name))
+        entry._raw_content = self._raw_content
+        entry._content = self._content
+        entry._extra = dict(self._extra) if self._extra else None
+        return entry
+
@@ -0,0 +1,321 @@
+"""Markdown conversion and PDF export"""
+import base64
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+
+import emoji
+import requests
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, PageBreak
+
+from diary.profiling import timed_function
+from diary.reporting import report_error
+from diary.storage import FONTS_DIR, TEMP_PREFIX
+
+
+def convert_markdown_to_pdf_content(text):
+    """Convert markdown text to properly formatted PDF content"""
+    # Remove any existing HTML-like tags
+    text = re.sub(r'<[^>]+>', '', text)
+    
+    # Handle basic markdown formatting
+    formatted_text = text
+    
+    # Handle code blocks first (save them to preserve from other formatting)
+    code_blocks = []
+    def save_code(match):
+        code_blocks.append(match.group(1))
+        return f"CODE_BLOCK_{len(code_blocks)-1}"
+    
+    formatted_text = re.sub(r'`([^`]+)`', save_code, formatted_text)
+    
+    # Handle bold text (handle both ** and __ syntax)
+    bold_blocks = []
+    def save_bold(match):
+        bold_blocks.append(match.group(1))
+        return f"BOLD_BLOCK_{len(bold_blocks)-1}"
+    
+    formatted_text = re.sub(r'\*\*([^\*]+)\*\*', save_bold, formatted_text)
+    formatted_text = re.sub(r'__([^_]+)__', save_bold, formatted_text)
+    
+    # Handle italic text (handle both * and _ syntax)
+    italic_blocks = []
+    def save_italic(match):
+        italic_blocks.append(match.group(1))
+        return f"ITALIC_BLOCK_{len(italic_blocks)-1}"
+    
+    formatted_text = re.sub(r'\*([^\*]+)\*', save_italic, formatted_text)
+    formatted_text = re.sub(r'_([^_]+)_', save_italic, formatted_text)
+    
+    # Handle lists
+    formatted_text = re.sub(r'^\s*[\-\*]\s+(.+)$', r'• \1', formatted_text, flags=re.MULTILINE)
+    formatted_text = re.sub(r'^\s*(\d+)\.\s+(.+)$', r'\1. \2', formatted_text, flags=re.MULTILINE)
+    
+    # Clean up any remaining special characters
+    formatted_text = (formatted_text
+        .replace('&lt;', '<')
+        .replace('&gt;', '>')
+        .replace('&amp;', '&')
+        .replace('&quot;', '"')
+        .replace('&apos;', "'")
+        .replace('\\', '')
+    )
+    
+    # Restore code blocks
+    for i, code in enumerate(code_blocks):
+        formatted_text = formatted_text.replace(
+            f"CODE_BLOCK_{i}",
+            f'<font face="Courier">{code}</font>'
+        )
+    
+    # Restore bold blocks
+    for i, bold in enumerate(bold_blocks):
+        formatted_text = formatted_text.replace(
+            f"BOLD_BLOCK_{i}",
+            f'<b>{bold}</b>'
+        )
+    
+    # Restore italic blocks
+    for i, italic in enumerate(italic_blocks):
+        formatted_text = formatted_text.replace(
+            f"ITALIC_BLOCK_{i}",
+            f'<i>{italic}</i>'
+        )
+    
+    return formatted_text
+
+
+def setup_fonts():
+    """Download and setup DejaVu fonts for PDF generation"""
+    fonts_dir = FONTS_DIR
+    fonts_dir.mkdir(exist_ok=True)
+    
+    # Updated URLs to the correct DejaVu font repository
+    font_files = {
+        'DejaVuSansCondensed.ttf': 'https://raw.githubusercontent.com/dejavu-fonts/dejavu-fonts/master/ttf/DejaVuSansCondensed.ttf',
+        'DejaVuSansCondensed-Bold.ttf': 'https://raw.githubusercontent.com/dejavu-fonts/dejavu-fonts/master/ttf/DejaVuSansCondensed-Bold.ttf',
+        'DejaVuSansCondensed-Oblique.ttf': 'https://raw.githubusercontent.com/dejavu-fonts/dejavu-fonts/master/ttf/DejaVuSansCondensed-Oblique.ttf'
+    }
+    
+    for font_file, url in font_files.items():
+        font_path = fonts_dir / font_file
+        if not font_path.exists():
+            try:
+                response = requests.get(url, stream=True)
+                response.raise_for_status()
+                # Download beside the font so a failed transfer never looks installed
+                tmp_path = font_path.with_name(font_path.name + '.tmp')
+                with open(tmp_path, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f)
+                os.replace(tmp_path, font_path)
+            except Exception as e:
+                report_error(f"Error downloading font {font_file}: {str(e)}")
+                return False
+    return True
+
+
+# Share of the progress bar for laying out entries; drawing pages takes the rest
+STORY_SHARE = 0.2
+
+
+def _build_progress(progress):
+    """Adapt reportlab's ``(kind, value)`` callbacks to a fraction"""
+    total = 1
+
+    def on_progress(kind, value):
+        nonlocal total
+        if kind == 'SIZE_EST':
+            total = max(value, 1)
+        elif kind == 'PROGRESS':
+            progress(STORY_SHARE + (1 - STORY_SHARE) * min(value / total, 1.0))
+    return on_progress
+
+
+@timed_function()
+def generate_pdf(selected_entries, output_path=None, progress=None):
+    """Generate a beautiful PDF of selected diary entries using reportlab
+
+    The PDF is written to ``output_path`` when given, otherwise to a new
+    temporary file. Returns the path, or None on failure. ``progress`` is
+    called with the fraction done (0.0-1.0) as entries are laid out and
+    pages are drawn.
+    """
+    if output_path:
+        pdf_path = str(output_path)
+    else:
+        # Create a temporary file for the PDF
+        with tempfile.NamedTemporaryFile(delete=False, prefix=TEMP_PREFIX, suffix='.pdf') as tmp:
+            pdf_path = tmp.name
+    
+    # Create the PDF document
+    doc = SimpleDocTemplate(
+        pdf_path,
+        pagesize=A4,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+    
+    # Get styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        alignment=1  # Center alignment
+    )
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Heading2'],
+        fontSize=16,
+        spaceAfter=20,
+        alignment=1
+    )
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading3'],
+        fontSize=14,
+        spaceAfter=12
+    )
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontSize=11,
+        spaceAfter=8,
+        allowWidows=0,
+        allowOrphans=0
+    )
+    code_style = ParagraphStyle(
+        'CustomCode',
+        parent=styles['Code'],
+        fontSize=10,
+        fontName='Courier',
+        spaceAfter=8,
+        allowWidows=0,
+        allowOrphans=0,
+        backColor=colors.lightgrey,
+        borderPadding=5
+    )
+    
+    # Prepare the story (content) for the PDF
+    story = []
+    temp_files = []  # Keep track of temporary files
+    
+    try:
+        # Add cover page
+        story.append(Paragraph("My Personal Diary", title_style))
+        story.append(Spacer(1, 30))
+        story.append(Paragraph(f"Generated on: {datetime.now().strftime('%B %d, %Y')}", subtitle_style))
+        story.append(Paragraph(f"Selected Entries: {len(selected_entries)}", subtitle_style))
+        story.append(Spacer(1, 50))
+        
+        # Add entries
+        for done, entry in enumerate(selected_entries):
+            if progress is not None:
+                progress(STORY_SHARE * done / len(selected_entries))
+            # Add page break between entries
+            if len(story) > 0:
+                story.append(PageBreak())
+            
+            # Entry title
+            title = convert_markdown_to_pdf_content(entry['title'])
+            story.append(Paragraph(title, title_style))
+            story.append(Spacer(1, 12))
+            
+            # Date and mood
+            mood_text = emoji.demojize(entry['mood'], delimiters=('(', ')'))
+            story.append(Paragraph(f"Date: {entry['date']} | Mood: {mood_text}", normal_style))
+            
+            # Tags
+            tags = [tag for tag in entry['tags']]  # No need to convert tags
+            tags_text = ", ".join(tags)
+            story.append(Paragraph(f"Tags: {tags_text}", normal_style))
+            story.append(Spacer(1, 12))
+            
+            # Content
+            content = entry['content']
+            paragraphs = content.split('\n')
+            
+            in_code_block = False
+            code_block_content = []
+            
+            for para in paragraphs:
+                if para.strip():
+                    if para.startswith('```'):
+                        if in_code_block:
+                            # End of code block
+                            code_text = '\n'.join(code_block_content)
+                            story.append(Paragraph(code_text, code_style))
+                            code_block_content = []
+                            in_code_block = False
+                        else:
+                            # Start of code block
+                            in_code_block = True
+                    elif in_code_block:
+                        code_block_content.append(para)
+                    elif para.startswith('# '):
+                        story.append(Paragraph(para[2:].strip(), title_style))
+                    elif para.startswith('## '):
+                        story.append(Paragraph(para[3:].strip(), subtitle_style))
+                    elif para.startswith('### '):
+                        story.append(Paragraph(para[4:].strip(), heading_style))
+                    else:
+                        formatted_para = convert_markdown_to_pdf_content(para)
+                        story.append(Paragraph(formatted_para, normal_style))
+                    
+                    if not in_code_block:
+                        story.append(Spacer(1, 6))
+            
+            # Handle any remaining code block
+            if code_block_content:
+                code_text = '\n'.join(code_block_content)
+                story.append(Paragraph(code_text, code_style))
+            
+            # Add image if available
+            if entry.get('image'):
+                try:
+                    # Create a temporary file for the image
+                    with tempfile.NamedTemporaryFile(delete=False, prefix=TEMP_PREFIX, suffix='.png') as img_tmp:
+                        img_path = img_tmp.name
+                        temp_files.append(img_path)  # Add to list of temp files
+                        img_bytes = base64.b64decode(entry['image'])
+                        with open(img_path, 'wb') as f:
+                            f.write(img_bytes)
+                    
+                    # Add image to PDF
+                    if os.path.exists(img_path) and os.path.getsize(img_path) > 0:
+                        img = RLImage(img_path, width=6*inch, height=4*inch)
+                        story.append(Spacer(1, 12))
+                        story.append(img)
+                        story.append(Paragraph("Attached Image", normal_style))
+                except Exception as e:
+                    story.append(Paragraph(f"Image could not be included: {str(e)}", normal_style))
+        
+        # Build the PDF
+        if progress is not None:
+            doc.setProgressCallBack(_build_progress(progress))
+        doc.build(story)
+        return pdf_path
+        
+    except Exception as e:
+        report_error(f"Error generating PDF: {str(e)}")
+        if os.path.exists(pdf_path):
+            os.unlink(pdf_path)
+        return None
+        
+    finally:
+        # Clean up temporary files
+        for temp_file in temp_files:
+            try:
+                if os.path.exists(temp_file):
+                    os.unlink(temp_file)
+            except Exception as e:
+                print(f"Warning: Could not delete temporary file {temp_file}: {e}")
@@ -0,0 +1,109 @@
+"""Lightweight hot-path timing and optional cProfile capture.
+
+Timings are collected per thread, which in Streamlit means per script
+rerun of a session: call ``start_run()`` at the top of the script and
+``run_timings()`` at the end to get everything measured in between.
+Each timing is also emitted on the ``diary.perf`` logger as one JSON
+object per line; ``configure_perf_log()`` attaches a file handler.
+"""
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("diary.perf")
+_local = threading.local()
+_configure_lock = threading.Lock()
+
+
+def configure_perf_log(path):
+    """Append structured timing records to ``path`` (no-op when falsy)
+
+    Called on every rerun; a file that already has a handler is left alone.
+    """
+    if not path:
+        return
+    # FileHandler keeps the absolute path, so compare against that
+    path = os.path.abspath(path)
+    with _configure_lock:
+        for handler in logger.handlers:
+            if getattr(handler, "baseFilename", None) == path:
+                return
+        handler = logging.FileHandler(path, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+
+def start_run():
+    """Reset the timings collected for the current thread"""
+    _local.timings = []
+    _local.depth = 0
+
+
+def run_timings():
+    """Timings recorded since ``start_run()`` as dicts, in start order"""
+    return sorted(getattr(_local, "timings", []), key=lambda t: t["start"])
+
+
+@contextmanager
+def timed(name, **fields):
+    """Time the enclosed block under ``name``; extra fields go to the log"""
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _local.depth = depth
+        record = {"name": name, "ms": elapsed_ms, "depth": depth, "start": start}
+        timings = getattr(_local, "timings", None)
+        if timings is not None:
+            timings.append(record)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                "event": "timing",
+                "name": name,
+                "ms": round(elapsed_ms, 3),
+                "thread": threading.current_thread().name,
+                "ts": time.time(),
+                **fields,
+            }))
+
+
+def timed_function(name=None):
+    """Decorator form of ``timed`` using the function name by default"""
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def profile_call(func, *args, limit=30, **kwargs):
+    """Run ``func`` under cProfile.
+
+    Returns ``(result, report, profile)`` where ``report`` is the top
+    ``limit`` functions by cumulative time and ``profile`` the raw
+    ``cProfile.Profile`` for ``dump_stats``.
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profile.disable()
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return result, stream.getvalue(), profile
@@ -0,0 +1,144 @@
+"""Pre-rendered entry views, kept in a memory-bounded LRU.
+
+Showing an entry means converting its Markdown, decoding its base64 image
+and scaling it down, which costs far more than reading the entry. The
+first time an entry version is shown the results are kept: the content as
+HTML, the image as a small JPEG or PNG thumbnail and a plain-text snippet.
+Entries are keyed by id and remember the version they were rendered from,
+a hash of everything shown, so an edited entry is rendered again and its
+old render dropped. The least recently shown entries are evicted once the
+cache holds more than ``max_bytes``. One cache can serve several diaries:
+pass each diary's name as ``scope`` so their entries never mix.
+"""
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from diary.markup import convert_markdown_to_html, html_excerpt
+from diary.profiling import timed
+
+DEFAULT_MAX_BYTES = 64 * 2**20
+# Twice the width the entry view shows the image at, for high-DPI screens
+THUMBNAIL_SIZE = (800, 800)
+SNIPPET_CHARS = 200
+# Dict, key and object overhead per cached entry, on top of its payload
+ENTRY_OVERHEAD = 600
+# Characters of the image hashed from each end; see entry_version
+IMAGE_SAMPLE = 4096
+
+
+def entry_version(entry):
+    """Hash of the fields an entry view shows
+
+    Images are several megabytes, so only their length and both ends are
+    hashed: every edit that replaces an image also sets ``last_edited``.
+    """
+    image = entry.get('image') or ''
+    parts = (entry.get('content') or '', entry.get('last_edited') or '', entry.get('timestamp') or '',
+             str(len(image)), image[:IMAGE_SAMPLE], image[-IMAGE_SAMPLE:])
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def make_thumbnail(image_b64, size=THUMBNAIL_SIZE):
+    """``(bytes, mime)`` of a scaled-down copy of a base64 image, or ``(None, None)``"""
+    from PIL import Image
+    try:
+        image = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+        # JPEGs decode straight at a reduced scale, which is most of the saving
+        image.draft('RGB', size)
+        image.thumbnail(size)
+        out = io.BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.save(out, format='PNG', optimize=True)
+            return out.getvalue(), 'image/png'
+        image.convert('RGB').save(out, format='JPEG', quality=85)
+        return out.getvalue(), 'image/jpeg'
+    except Exception:
+        return None, None
+
+
+class RenderedEntry:
+    """What the entry view shows for one entry version"""
+
+    __slots__ = ('version', 'html', 'snippet', 'thumbnail', 'thumbnail_mime', 'image_error', 'nbytes')
+
+    def __init__(self, version, html, snippet, thumbnail=None, thumbnail_mime=None, image_error=False):
+        self.version = version
+        self.html = html
+        self.snippet = snippet
+        self.thumbnail = thumbnail
+        self.thumbnail_mime = thumbnail_mime
+        self.image_error = image_error
+        self.nbytes = (ENTRY_OVERHEAD + len(html.encode('utf-8')) + len(snippet.encode('utf-8'))
+                       + len(thumbnail or b''))
+
+    @classmethod
+    def render(cls, entry, version=None):
+        html = convert_markdown_to_html(entry.get('content'), raw_html=False)
+        snippet = html_excerpt(html, SNIPPET_CHARS)
+        thumbnail = mime = None
+        if entry.get('image'):
+            thumbnail, mime = make_thumbnail(entry['image'])
+        return cls(version or entry_version(entry), html, snippet, thumbnail, mime,
+                   image_error=bool(entry.get('image')) and thumbnail is None)
+
+
+class RenderCache:
+    """Bounded LRU of ``(scope, entry_id) -> RenderedEntry``, by rendered size"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._rendered = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rendered)
+
+    def get(self, entry, scope=None):
+        """The rendered view of ``entry``, rendering it if this version is not cached"""
+        version = entry_version(entry)
+        key = (scope, entry['id'])
+        with self._lock:
+            rendered = self._rendered.get(key)
+            if rendered is not None and rendered.version == version:
+                self._rendered.move_to_end(key)
+                self.hits += 1
+                return rendered
+        with timed("render.entry"):
+            rendered = RenderedEntry.render(entry, version)
+        with self._lock:
+            self.misses += 1
+            self._store(key, rendered)
+        return rendered
+
+    def _store(self, key, rendered):
+        previous = self._rendered.pop(key, None)
+        if previous is not None:
+            self.nbytes -= previous.nbytes
+        if rendered.nbytes > self.max_bytes:
+            return
+        self._rendered[key] = rendered
+        self.nbytes += rendered.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._rendered.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def discard(self, entry_id, scope=None):
+        with self._lock:
+            previous = self._rendered.pop((scope, entry_id), None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._rendered.clear()
+            self.nbytes = 0
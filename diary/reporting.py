@@ -0,0 +1,40 @@
+"""Error reporting shared by the UI and headless entry points"""
+import sys
+import threading
+from contextlib import contextmanager
+
+_error_reporter = None
+_captured = threading.local()
+
+
+def set_error_reporter(reporter):
+    """Route core error messages to ``reporter`` (e.g. ``st.error``)"""
+    global _error_reporter
+    _error_reporter = reporter
+
+
+@contextmanager
+def capture_errors():
+    """Collect errors reported on this thread into the yielded list
+
+    Background jobs use this: they have no page to show an error on, so
+    the messages are kept with the job instead.
+    """
+    messages = []
+    previous = getattr(_captured, "messages", None)
+    _captured.messages = messages
+    try:
+        yield messages
+    finally:
+        _captured.messages = previous
+
+
+def report_error(message):
+    """Report an error through the configured reporter, or stderr"""
+    messages = getattr(_captured, "messages", None)
+    if messages is not None:
+        messages.append(message)
+    elif _error_reporter is not None:
+        _error_reporter(message)
+    else:
+        print(message, file=sys.stderr)
@@ -0,0 +1,265 @@
+"""Entry history: every saved version, stored as compressed deltas.
+
+Each entry has a revision log ``entries.revisions/<id>.jsonl`` with one
+line per saved version: its number, when it was saved, the title, date,
+mood and tags it had, and its content either in full (a keyframe) or as
+a delta against the revision before. A delta copies ranges of the older
+text and inserts what is new::
+
+    [[0, 1412], "a new sentence. ", [1412, 96]]
+
+It is found with a line diff refined word by word inside changed lines,
+so fixing a typo stores a few bytes however long the entry is. Every
+``KEYFRAME_INTERVAL``-th revision, and any that rewrites much of the
+text, is stored in full, so rebuilding a revision
+applies at most ``KEYFRAME_INTERVAL - 1`` deltas. Content is compressed
+and base64 encoded, like the entry file's.
+
+The entry writer feeds its change feed events to ``apply_events``: a
+revision is recorded for each created or updated entry whose versioned
+fields changed, and the log of a deleted entry is removed.
+"""
+import base64
+import difflib
+import hashlib
+import json
+import re
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from diary.profiling import timed
+from diary.storage import ENTRIES_FILE
+
+VERSIONED_FIELDS = ('title', 'date', 'mood', 'tags')
+KEYFRAME_INTERVAL = 10
+# A delta inserting more than this share of the text is stored as a keyframe instead
+DELTA_MAX_RATIO = 0.5
+# Changed blocks with more token pairs than this are stored as inserted text, not diffed
+TOKEN_DIFF_LIMIT = 4_000_000
+_TOKEN_RE = re.compile(r'\S+\s*|\s+')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+_ENTRY_ID_RE = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+def revisions_dir_for(entries_file=None):
+    """Folder holding the revision logs of ``entries_file``"""
+    return Path(entries_file or ENTRIES_FILE).with_suffix(".revisions")
+
+
+def _pack(value):
+    data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.b64encode(zlib.compress(data)).decode('ascii')
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(base64.b64decode(data)).decode('utf-8'))
+
+
+# --- Deltas ---
+def _offsets(parts):
+    """Start offset of each part in ``"".join(parts)``, plus the total length"""
+    offsets = [0]
+    for part in parts:
+        offsets.append(offsets[-1] + len(part))
+    return offsets
+
+
+def _copy(ops, start, length):
+    if not length:
+        return
+    if ops and isinstance(ops[-1], list) and ops[-1][0] + ops[-1][1] == start:
+        ops[-1][1] += length
+    else:
+        ops.append([start, length])
+
+
+def _insert(ops, text):
+    if not text:
+        return
+    if ops and isinstance(ops[-1], str):
+        ops[-1] += text
+    else:
+        ops.append(text)
+
+
+def _diff_tokens(ops, old, offset, new):
+    """Ops for one changed block, diffed word by word"""
+    old_tokens, new_tokens = _TOKEN_RE.findall(old), _TOKEN_RE.findall(new)
+    if len(old_tokens) * len(new_tokens) > TOKEN_DIFF_LIMIT:
+        _insert(ops, new)
+        return
+    at = _offsets(old_tokens)
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            _copy(ops, offset + at[i1], at[i2] - at[i1])
+        elif tag != 'delete':
+            _insert(ops, "".join(new_tokens[j1:j2]))
+
+
+def make_delta(base, text):
+    """Ops that turn ``base`` into ``text``: ``[start, length]`` copies and inserted strings"""
+    ops = []
+    old_lines, new_lines = base.splitlines(keepends=True), text.splitlines(keepends=True)
+    at = _offsets(old_lines)
+    # An edit is usually in one place: only the lines between the common head and tail are diffed
+    head, shortest = 0, min(len(old_lines), len(new_lines))
+    while head < shortest and old_lines[head] == new_lines[head]:
+        head += 1
+    tail = 0
+    while tail < shortest - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+        tail += 1
+    _copy(ops, 0, at[head])
+    old_middle = old_lines[head:len(old_lines) - tail]
+    new_middle = new_lines[head:len(new_lines) - tail]
+    matcher = difflib.SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        i1, i2 = i1 + head, i2 + head
+        if tag == 'equal':
+            _copy(ops, at[i1], at[i2] - at[i1])
+        elif tag == 'insert':
+            _insert(ops, "".join(new_middle[j1:j2]))
+        elif tag == 'replace':
+            _diff_tokens(ops, base[at[i1]:at[i2]], at[i1], "".join(new_middle[j1:j2]))
+    _copy(ops, at[len(old_lines) - tail], at[-1] - at[len(old_lines) - tail])
+    return ops
+
+
+def apply_delta(base, ops):
+    return "".join(base[op[0]:op[0] + op[1]] if isinstance(op, list) else op for op in ops)
+
+
+def _diff_lines(text):
+    # One sentence per line, so a diff points at the sentence that changed
+    return [sentence for line in text.splitlines() for sentence in _SENTENCE_END_RE.split(line)]
+
+
+def _summary(record):
+    """A revision record without its content"""
+    return {key: value for key, value in record.items() if key not in ('full', 'delta')}
+
+
+def _format_field(value):
+    return ", ".join(value) if isinstance(value, list) else str(value)
+
+
+# --- Store ---
+class RevisionStore:
+    """Revision logs of the entries of one entry file"""
+
+    def __init__(self, entries_file=None):
+        self.entries_file = Path(entries_file or ENTRIES_FILE)
+        self.path = revisions_dir_for(self.entries_file)
+
+    def _log_path(self, entry_id):
+        # Entry ids are uuids; anything else is hashed so it cannot name a path outside the folder
+        if not _ENTRY_ID_RE.fullmatch(entry_id):
+            entry_id = hashlib.blake2b(entry_id.encode('utf-8'), digest_size=16).hexdigest()
+        return self.path / f"{entry_id}.jsonl"
+
+    def records(self, entry_id):
+        """The stored revision records of an entry, oldest first"""
+        try:
+            f = open(self._log_path(entry_id), "r")
+        except OSError:
+            return []
+        records = []
+        with f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+        return records
+
+    def history(self, entry_id):
+        """Revisions of an entry without their content, oldest first"""
+        return [_summary(record) for record in self.records(entry_id)]
+
+    def revision(self, entry_id, rev=None, records=None):
+        """Revision ``rev`` (default: the latest) with its ``content``, or None"""
+        records = self.records(entry_id) if records is None else records
+        if not records:
+            return None
+        target = len(records) - 1 if rev is None else next(
+            (i for i, record in enumerate(records) if record['rev'] == rev), None)
+        if target is None:
+            return None
+        start = target
+        while 'full' not in records[start]:
+            start -= 1
+        content = _unpack(records[start]['full'])
+        for record in records[start + 1:target + 1]:
+            content = apply_delta(content, _unpack(record['delta']))
+        revision = _summary(records[target])
+        revision['content'] = content
+        return revision
+
+    def record(self, entry, records=None):
+        """Append ``entry`` as a new revision; returns it, or None if nothing versioned changed
+
+        ``records`` are the entry's existing records when already read; the
+        new one is appended to it.
+        """
+        records = self.records(entry['id']) if records is None else records
+        content = entry.get('content') or ''
+        fields = {field: list(entry.get(field) or ()) if field == 'tags' else entry.get(field)
+                  for field in VERSIONED_FIELDS}
+        record = {
+            'rev': 1,
+            'at': entry.get('last_edited') or entry.get('timestamp') or datetime.now().isoformat(),
+            **fields,
+            'words': len(content.split()),
+        }
+        if records:
+            latest = self.revision(entry['id'], records=records)
+            if latest['content'] == content and all(latest.get(f) == fields[f] for f in VERSIONED_FIELDS):
+                return None
+            record['rev'] = records[-1]['rev'] + 1
+            since_keyframe = next(i for i, old in enumerate(reversed(records)) if 'full' in old)
+            if since_keyframe < KEYFRAME_INTERVAL - 1:
+                ops = make_delta(latest['content'], content)
+                if sum(len(op) for op in ops if isinstance(op, str)) <= DELTA_MAX_RATIO * len(content):
+                    record['delta'] = _pack(ops)
+        if 'delta' not in record:
+            record['full'] = _pack(content)
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self._log_path(entry['id']), "a") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        records.append(record)
+        return record
+
+    def discard(self, entry_id):
+        self._log_path(entry_id).unlink(missing_ok=True)
+
+    def diff(self, entry_id, old_rev, new_rev, context=3):
+        """Unified diff from revision ``old_rev`` to ``new_rev``, changed fields first"""
+        records = self.records(entry_id)
+        old = self.revision(entry_id, old_rev, records)
+        new = self.revision(entry_id, new_rev, records)
+        if old is None or new is None:
+            return ""
+        lines = []
+        for field in VERSIONED_FIELDS:
+            if old.get(field) != new.get(field):
+                lines.append(f"-{field}: {_format_field(old.get(field))}")
+                lines.append(f"+{field}: {_format_field(new.get(field))}")
+        lines.extend(difflib.unified_diff(_diff_lines(old['content']), _diff_lines(new['content']),
+                                          f"revision {old_rev}", f"revision {new_rev}", n=context, lineterm=""))
+        return "\n".join(lines)
+
+    # --- Change feed ---
+    def apply_events(self, events):
+        """Change feed hook: record created and updated entries, forget deleted ones"""
+        with timed("revisions.record", events=len(events)):
+            for event in events:
+                if event['op'] == 'delete':
+                    self.discard(event['id'])
+                elif event['op'] in ('create', 'update'):
+                    records = self.records(event['id'])
+                    if not records and event.get('previous') is not None:
+                        # Saved before history was kept, or imported: keep the version being replaced
+                        self.record(event['previous'], records)
+                    self.record(event['entry'], records)
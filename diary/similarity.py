@@ -0,0 +1,210 @@
+"""Offline "related entries" index built from hashed word vectors.
+
+Every entry is reduced to a fixed-size vector by hashing its words and
+adjacent word pairs into ``DIM`` buckets (log-scaled counts). Document
+frequencies per bucket give TF-IDF weights at query time, so entries can
+be added, changed or removed without re-weighting the rest.
+
+The vectors live in ``entries.vectors.npy`` next to the entry file, with
+the row ids and source signature in ``entries.vectors.json``. Readers map
+the array instead of loading it; a query is two mat-vec products over the
+whole matrix, which at ``DIM = 256`` stays in the millisecond range for
+100k entries without an approximate index.
+"""
+import json
+import os
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from diary.analysis import STOPWORDS, WORD_RE
+from diary.mmapstore import file_signature
+from diary.profiling import timed, timed_function
+from diary.storage import ENTRIES_FILE, load_entries
+
+DIM = 256
+_BUCKETS = {}
+
+
+def vector_paths_for(entries_file=None):
+    """``(vectors .npy, ids .json)`` paths derived from ``entries_file``"""
+    base = Path(entries_file or ENTRIES_FILE)
+    return base.with_suffix(".vectors.npy"), base.with_suffix(".vectors.json")
+
+
+def entry_text(entry):
+    """The text an entry is compared on"""
+    return f"{entry.get('title', '')}\n{entry.get('content') or ''}"
+
+
+def _bucket(word):
+    bucket = _BUCKETS.get(word)
+    if bucket is None:
+        # crc32 rather than hash(): buckets must be stable across processes
+        bucket = _BUCKETS[word] = zlib.crc32(word.encode('utf-8')) % DIM
+    return bucket
+
+
+def embed(text):
+    """Hashed unigram + bigram vector for ``text``"""
+    words = [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+    vector = np.zeros(DIM, dtype=np.float32)
+    if not words:
+        return vector
+    buckets = np.fromiter((_bucket(word) for word in words), dtype=np.int64, count=len(words))
+    pairs = (buckets[:-1] * 7919 + buckets[1:] * 104729) % DIM
+    counts = np.bincount(buckets, minlength=DIM) + np.bincount(pairs, minlength=DIM)
+    nonzero = counts > 0
+    vector[nonzero] = 1 + np.log(counts[nonzero])
+    return vector
+
+
+class VectorIndex:
+    """Entry vectors in row order with an id -> row lookup"""
+
+    def __init__(self, ids=(), vectors=None, source_signature=(0, -1)):
+        self.ids = list(ids)
+        self._rows = {entry_id: i for i, entry_id in enumerate(self.ids)}
+        self._vectors = vectors if vectors is not None else np.zeros((0, DIM), dtype=np.float32)
+        self.source_signature = tuple(source_signature)
+        self._weights = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._rows
+
+    @property
+    def vectors(self):
+        return self._vectors[:len(self.ids)]
+
+    @classmethod
+    @timed_function("similarity.build")
+    def build(cls, entries, source_signature=(0, -1)):
+        """Index every entry in ``entries``"""
+        vectors = np.zeros((len(entries), DIM), dtype=np.float32)
+        for i, entry in enumerate(entries):
+            vectors[i] = embed(entry_text(entry))
+        return cls([entry['id'] for entry in entries], vectors, source_signature)
+
+    # --- Updates ---
+    def upsert(self, entry):
+        """Add ``entry`` or refresh its vector after an edit"""
+        row = self._rows.get(entry['id'])
+        if row is None:
+            row = len(self.ids)
+            if row == len(self._vectors) or not self._vectors.flags.writeable:
+                # Grow geometrically so a run of adds is not quadratic
+                grown = np.zeros((max(16, row * 2), DIM), dtype=np.float32)
+                grown[:row] = self.vectors
+                self._vectors = grown
+            self.ids.append(entry['id'])
+            self._rows[entry['id']] = row
+        elif not self._vectors.flags.writeable:
+            self._vectors = np.array(self._vectors)
+        self._vectors[row] = embed(entry_text(entry))
+        self._weights = None
+
+    def remove(self, entry_id):
+        """Drop ``entry_id``, moving the last row into its place"""
+        row = self._rows.pop(entry_id, None)
+        if row is None:
+            return
+        if not self._vectors.flags.writeable:
+            self._vectors = np.array(self._vectors)
+        last = len(self.ids) - 1
+        if row != last:
+            self._vectors[row] = self._vectors[last]
+            self.ids[row] = self.ids[last]
+            self._rows[self.ids[row]] = row
+        self.ids.pop()
+        self._weights = None
+
+    # --- Queries ---
+    def _idf_and_norms(self):
+        if self._weights is None:
+            vectors = self.vectors
+            df = np.count_nonzero(vectors, axis=0)
+            idf = (np.log((1 + len(vectors)) / (1 + df)) + 1).astype(np.float32)
+            # Row norms of the TF-IDF matrix without materialising it
+            norms = np.sqrt(np.square(vectors) @ np.square(idf))
+            self._weights = (idf, norms)
+        return self._weights
+
+    def similar_to_vector(self, vector, k=5, exclude=None):
+        """``[(entry_id, score)]`` of the ``k`` entries closest to ``vector``"""
+        if not len(self):
+            return []
+        idf, norms = self._idf_and_norms()
+        query = vector * idf
+        query_norm = float(np.linalg.norm(query))
+        if query_norm == 0:
+            return []
+        scores = (self.vectors @ (query * idf)) / np.maximum(norms * query_norm, 1e-12)
+        if exclude is not None:
+            scores[exclude] = -np.inf
+        k = min(k, len(scores) - (exclude is not None))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def similar(self, entry_id, k=5):
+        """Entries most similar to the indexed entry ``entry_id``"""
+        row = self._rows.get(entry_id)
+        if row is None:
+            return []
+        return self.similar_to_vector(self.vectors[row], k, exclude=row)
+
+    def search(self, text, k=5):
+        """Entries most similar to free ``text``"""
+        return self.similar_to_vector(embed(text), k)
+
+    # --- Persistence ---
+    def save(self, entries_file=None, source_signature=None):
+        """Write the index next to ``entries_file`` (atomically per file)"""
+        if source_signature is not None:
+            self.source_signature = tuple(source_signature)
+        vectors_path, ids_path = vector_paths_for(entries_file)
+        for path, write in (
+            (vectors_path, lambda f: np.save(f, np.ascontiguousarray(self.vectors))),
+            (ids_path, lambda f: f.write(json.dumps({
+                "dim": DIM, "signature": list(self.source_signature), "ids": self.ids,
+            }).encode('utf-8'))),
+        ):
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, entries_file=None):
+        """Map a saved index read-only; raises ``ValueError`` if unusable"""
+        vectors_path, ids_path = vector_paths_for(entries_file)
+        with open(ids_path, "rb") as f:
+            meta = json.loads(f.read().decode('utf-8'))
+        if meta.get("dim") != DIM:
+            raise ValueError(f"{ids_path} was built with a different vector size")
+        vectors = np.load(vectors_path, mmap_mode='r')
+        if vectors.shape != (len(meta["ids"]), DIM):
+            raise ValueError(f"{vectors_path} does not match {ids_path}")
+        return cls(meta["ids"], vectors, meta["signature"])
+
+
+def open_vector_index(entries_file=None, signature=None):
+    """Load the saved index for ``entries_file``, rebuilding it if stale"""
+    entries_file = Path(entries_file or ENTRIES_FILE)
+    signature = tuple(signature or file_signature(entries_file))
+    try:
+        index = VectorIndex.load(entries_file)
+        if index.source_signature == signature:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    with timed("similarity.rebuild"):
+        index = VectorIndex.build(load_entries(entries_file), signature)
+        index.save(entries_file)
+    return index
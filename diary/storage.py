@@ -0,0 +1,352 @@
+"""Entry storage: paths, encryption and the JSON entry file"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+from pathlib import Path
+
+from diary.profiling import timed, timed_function
+from diary.reporting import report_error
+
+# --- Path Setup ---
+DIARY_DIR = Path("diary_entries")
+ENTRIES_FILE = DIARY_DIR / "entries.json"
+KEY_FILE = DIARY_DIR / ".encryption_key"
+PASSKEY_FILE = DIARY_DIR / ".passkey"
+GOALS_FILE = DIARY_DIR / "goals.json"
+FONTS_DIR = Path("fonts")
+# Finished background exports waiting to be downloaded
+EXPORTS_DIR = DIARY_DIR / "exports"
+# Prefix of the temporary files written by PDF export, so leftovers can be found
+TEMP_PREFIX = "diary-"
+
+
+def init_store(diary_dir=DIARY_DIR):
+    """Create the diary directory and a sharded entry store if missing"""
+    diary_dir = Path(diary_dir)
+    diary_dir.mkdir(parents=True, exist_ok=True)
+    entries_file = diary_dir / ENTRIES_FILE.name
+    if not entries_file.exists():
+        save_entries([], entries_file, sharded=True)
+    else:
+        # Older diaries kept everything in one file
+        shard_store(entries_file)
+    return entries_file
+
+
+# --- Encryption Setup ---
+def get_encryption_key(key_file=None):
+    """Generate or load encryption key"""
+    key_file = Path(key_file or KEY_FILE)
+    if not key_file.exists():
+        key = base64.urlsafe_b64encode(os.urandom(32))
+        with open(key_file, "wb") as f:
+            f.write(key)
+        return key
+    else:
+        with open(key_file, "rb") as f:
+            return f.read()
+
+
+def encrypt_data(data):
+    """Simple encryption for diary content"""
+    if not data:
+        return data
+    try:
+        # First encode as UTF-8, then base64
+        data_bytes = data.encode('utf-8')
+        return base64.urlsafe_b64encode(data_bytes).decode('utf-8')
+    except Exception:
+        # If encryption fails, return original data
+        return data
+
+
+def decrypt_data(encrypted_data):
+    """Decrypt diary content"""
+    if not encrypted_data:
+        return encrypted_data
+    try:
+        # Try to decode as base64 first
+        return base64.urlsafe_b64decode(encrypted_data.encode('utf-8')).decode('utf-8')
+    except Exception:
+        # If decryption fails, return original data
+        return encrypted_data
+
+
+# --- Passkey Setup ---
+# scrypt cost: ~16 MB and a few tens of milliseconds per hash
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+PBKDF2_ITERATIONS = 600_000
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def hash_passkey(passkey):
+    """Hash the passkey for secure storage with a salted KDF
+
+    Returns ``scrypt$n$r$p$salt$hash``, or ``pbkdf2_sha256$iterations$salt$hash``
+    where OpenSSL lacks scrypt. Every call draws a fresh salt.
+    """
+    salt = os.urandom(16)
+    if hasattr(hashlib, "scrypt"):
+        key = hashlib.scrypt(passkey.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}"
+    key = hashlib.pbkdf2_hmac("sha256", passkey.encode(), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(key)}"
+
+
+def check_passkey(passkey, stored_hash):
+    """Compare ``passkey`` with a stored hash in any supported format"""
+    if not stored_hash:
+        return False
+    parts = stored_hash.split("$")
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = (int(x) for x in parts[1:4])
+            salt, expected = base64.b64decode(parts[4]), base64.b64decode(parts[5])
+            key = hashlib.scrypt(passkey.encode(), salt=salt, n=n, r=r, p=p,
+                                 maxmem=2 * 128 * n * r * p, dklen=len(expected))
+        elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            salt, expected = base64.b64decode(parts[2]), base64.b64decode(parts[3])
+            key = hashlib.pbkdf2_hmac("sha256", passkey.encode(), salt, int(parts[1]), len(expected))
+        else:
+            # Unsalted SHA-256 hex digest from before the KDF
+            expected = stored_hash.encode()
+            key = hashlib.sha256(passkey.encode()).hexdigest().encode()
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(key, expected)
+
+
+def needs_rehash(stored_hash):
+    """True for hashes that should be replaced with ``hash_passkey`` output"""
+    if not stored_hash:
+        return False
+    if stored_hash.startswith("scrypt$"):
+        # Older cost parameters are upgraded too
+        return stored_hash.split("$")[1:4] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+    if stored_hash.startswith("pbkdf2_sha256$"):
+        return hasattr(hashlib, "scrypt")
+    return True
+
+
+def verify_passkey(passkey, passkey_file=None):
+    """Verify if the provided passkey is correct, upgrading a legacy hash"""
+    passkey_file = Path(passkey_file or PASSKEY_FILE)
+    if not passkey_file.exists():
+        return False
+
+    with open(passkey_file, "r") as f:
+        stored_hash = f.read().strip()
+
+    if not check_passkey(passkey, stored_hash):
+        return False
+    if needs_rehash(stored_hash):
+        with open(passkey_file, "w") as f:
+            f.write(hash_passkey(passkey))
+    return True
+
+
+# --- Entry File ---
+# ``entries.json`` is either a plain list of entries (the original layout)
+# or a small manifest of per-month shards kept in ``entries.shards/``.
+# The manifest is rewritten on every save, so its signature still tells
+# readers when anything changed.
+SHARD_FORMAT = "diary-shards"
+UNDATED_SHARD = "undated"
+_MONTH_RE = re.compile(r"\d{4}-\d{2}")
+
+
+def shard_dir_for(entries_file=None):
+    """Folder holding the month shards of ``entries_file``"""
+    return Path(entries_file or ENTRIES_FILE).with_suffix(".shards")
+
+
+def shard_key(entry):
+    """``YYYY-MM`` shard of an entry, from its ``date``"""
+    date = str(entry.get('date') or '')
+    return date[:7] if _MONTH_RE.match(date) else UNDATED_SHARD
+
+
+def read_manifest(entries_file=None):
+    """The shard manifest, or None for a missing or single-file store"""
+    try:
+        with open(entries_file or ENTRIES_FILE, "r") as f:
+            # The first character tells the layouts apart without parsing a large list
+            if f.read(64).lstrip()[:1] != "{":
+                return None
+            f.seek(0)
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == SHARD_FORMAT else None
+
+
+def _load_records(path):
+    from diary.model import Entry
+    with open(path, "r") as f:
+        with timed("load_entries.json"):
+            records = json.load(f)
+    if not isinstance(records, list):
+        raise ValueError(f"{path} does not hold a list of entries")
+    with timed("load_entries.model"):
+        # Swap records for entries in place so both lists never coexist
+        for i, record in enumerate(records):
+            records[i] = Entry.from_record(record)
+    return records
+
+
+def _write_records(entries, path):
+    """Stream ``entries`` to ``path`` as an indented JSON list, atomically"""
+    from diary.model import Entry
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write("[")
+        for i, entry in enumerate(entries):
+            if isinstance(entry, Entry):
+                record = entry.to_record()
+            else:
+                record = dict(entry, content=encrypt_data(entry['content']))
+            f.write(",\n  " if i else "\n  ")
+            f.write(json.dumps(record, indent=2).replace("\n", "\n  "))
+        f.write("\n]" if entries else "]")
+    os.replace(tmp_path, path)
+
+
+def _shard_overlaps(key, since, until):
+    if key == UNDATED_SHARD:
+        return since is None and until is None
+    return (since is None or key >= since[:7]) and (until is None or key <= until[:7])
+
+
+@timed_function()
+def load_entries(entries_file=None, since=None, until=None, raise_errors=False):
+    """Load entries as ``Entry`` objects, optionally only ``since``..``until``
+
+    Dates are ``YYYY-MM-DD`` strings; with a sharded store only the shards
+    overlapping the range are opened. Content stays encrypted inside each
+    entry and is decrypted when read. An unreadable store is reported and
+    loads as no entries, unless ``raise_errors`` is set.
+    """
+    entries_file = Path(entries_file or ENTRIES_FILE)
+    try:
+        manifest = read_manifest(entries_file)
+        if manifest is None:
+            entries = _load_records(entries_file)
+        else:
+            shard_dir = shard_dir_for(entries_file)
+            entries = []
+            for key in sorted(manifest["shards"]):
+                if _shard_overlaps(key, since, until):
+                    entries.extend(_load_records(shard_dir / manifest["shards"][key]["file"]))
+        if since is not None or until is not None:
+            entries = [e for e in entries
+                       if (since is None or str(e.get('date')) >= since)
+                       and (until is None or str(e.get('date')) <= until)]
+        return entries
+    except Exception as e:
+        if raise_errors:
+            raise
+        report_error(f"Error loading entries: {str(e)}")
+        return []
+
+
+def _write_manifest(shards, entries_file):
+    entries_file = Path(entries_file)
+    tmp_path = entries_file.with_name(entries_file.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        # Unindented so the C encoder is used; this is rewritten on every save
+        json.dump({"format": SHARD_FORMAT, "version": 1, "shards": shards}, f, sort_keys=True)
+    os.replace(tmp_path, entries_file)
+
+
+def _save_shards(entries, entries_file, months=None):
+    shard_dir = shard_dir_for(entries_file)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(entries_file)
+    shards = dict(manifest["shards"]) if manifest else {}
+
+    groups = {}
+    if months is None or UNDATED_SHARD in months:
+        for entry in entries:
+            key = shard_key(entry)
+            if months is None or key in months:
+                groups.setdefault(key, []).append(entry)
+    else:
+        # Cheap prefix test first; a save usually touches one month of many
+        for entry in entries:
+            prefix = str(entry.get('date') or '')[:7]
+            if prefix in months:
+                groups.setdefault(prefix, []).append(entry)
+    keys = (set(shards) | set(groups)) if months is None else months
+    # A month left without entries loses its shard, unless the shard cannot be
+    # read: then the entries given were likely loaded without it
+    for key in keys:
+        if key not in shards or groups.get(key):
+            continue
+        path = shard_dir / shards[key]["file"]
+        try:
+            if path.exists():
+                _load_records(path)
+        except Exception as e:
+            raise ValueError(f"Not removing unreadable shard {path}: {e}") from e
+    for key in keys:
+        rows = groups.get(key)
+        path = shard_dir / f"{key}.json"
+        if rows:
+            _write_records(rows, path)
+            dates = [str(entry.get('date') or '') for entry in rows]
+            shards[key] = {"file": path.name, "count": len(rows), "first": min(dates), "last": max(dates)}
+        elif key in shards:
+            del shards[key]
+            path.unlink(missing_ok=True)
+    # The manifest is swapped in last, so readers see old or new shards, never a mix
+    _write_manifest(shards, entries_file)
+
+
+@timed_function()
+def save_entries(entries, entries_file=None, months=None, sharded=None, raise_errors=False):
+    """Save entries with encryption
+
+    A sharded store rewrites only the shards in ``months`` (``YYYY-MM``
+    keys) when given, and every shard otherwise. ``sharded`` picks the
+    layout; by default an existing single-file store stays single-file and
+    everything else is sharded. Entries are serialised one at a time, so
+    no encrypted copy of the whole list is built, and every file is written
+    next to its target and swapped in. A failed save is reported, or raised
+    with ``raise_errors``.
+    """
+    if not isinstance(entries, list):
+        entries = []
+    entries_file = Path(entries_file or ENTRIES_FILE)
+    if sharded is None:
+        sharded = not entries_file.exists() or read_manifest(entries_file) is not None
+    try:
+        if sharded:
+            _save_shards(entries, entries_file, months)
+        else:
+            _write_records(entries, entries_file)
+    except Exception as e:
+        if raise_errors:
+            raise
+        report_error(f"Error saving entries: {str(e)}")
+
+
+def shard_store(entries_file=None):
+    """Convert a single-file store to month shards; returns False if already sharded"""
+    entries_file = Path(entries_file or ENTRIES_FILE)
+    if read_manifest(entries_file) is not None:
+        return False
+    try:
+        entries = _load_records(entries_file)
+    except Exception as e:
+        # Leave an unreadable file alone rather than replacing it with nothing
+        report_error(f"Error loading entries: {str(e)}")
+        return False
+    save_entries(entries, entries_file, sharded=True)
+    return True
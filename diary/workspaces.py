@@ -0,0 +1,282 @@
+"""Workspaces: many isolated diaries served by one process.
+
+A workspace is a folder with its own entry store, encryption key,
+passkey, goals and exports, laid out like ``diary_entries/``. Without a
+workspaces folder the app serves ``diary_entries/`` as its only,
+``default`` workspace; with one (``DIARY_WORKSPACES_DIR``) every diary
+lives in a subfolder named after it.
+
+``WorkspacePool`` holds the workspaces a process has open. Each open
+workspace has its own entry writer, maintenance schedule, export queue
+and read views (mapped entries, related-entries and activity indexes),
+so no state is shared between diaries; only the export threads are
+pooled. The least recently used workspaces are closed once the open ones
+hold more than ``max_bytes`` by estimate, or there are more than
+``max_open`` of them, which keeps memory and threads bounded however
+many diaries there are.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from diary.activity import open_activity_index
+from diary.exports import DEFAULT_WORKERS, ExportQueue
+from diary.maintenance import MaintenanceScheduler, store_size
+from diary.mmapstore import file_signature, open_mapped_entries
+from diary.similarity import open_vector_index
+from diary.storage import (
+    DIARY_DIR,
+    ENTRIES_FILE,
+    EXPORTS_DIR,
+    GOALS_FILE,
+    KEY_FILE,
+    PASSKEY_FILE,
+    get_encryption_key,
+    hash_passkey,
+    init_store,
+    verify_passkey,
+)
+from diary.writer import EntryWriter
+
+DEFAULT_WORKSPACE = "default"
+DEFAULT_MAX_BYTES = 512 * 2**20
+DEFAULT_MAX_OPEN = 64
+# A workspace used this recently is never closed, so a rerun still using it keeps its writer
+MIN_IDLE = 30
+WORKSPACE_NAME_RE = re.compile(r"[a-z0-9][a-z0-9_-]{0,63}")
+
+
+def check_workspace_name(name):
+    """``name`` lowercased, or ``ValueError`` if it cannot name a workspace folder"""
+    name = (name or "").strip().lower()
+    if not WORKSPACE_NAME_RE.fullmatch(name):
+        raise ValueError("Diary names are up to 64 letters, digits, '-' or '_', "
+                         "starting with a letter or digit")
+    return name
+
+
+class Workspace:
+    """Where one diary keeps its files; nothing is opened or created"""
+
+    def __init__(self, name, root):
+        self.name = name
+        self.root = Path(root)
+        self.entries_file = self.root / ENTRIES_FILE.name
+        self.key_file = self.root / KEY_FILE.name
+        self.passkey_file = self.root / PASSKEY_FILE.name
+        self.goals_file = self.root / GOALS_FILE.name
+        self.exports_dir = self.root / EXPORTS_DIR.name
+
+    def __repr__(self):
+        return f"Workspace({self.name!r}, {str(self.root)!r})"
+
+    def exists(self):
+        """True once the diary has been created with a passkey"""
+        return self.passkey_file.exists()
+
+    def create(self, passkey):
+        """Set up the store, key and passkey; ``FileExistsError`` if the diary exists"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Exclusive create: two people picking the same name cannot both get it
+        with open(self.passkey_file, "x") as f:
+            f.write(hash_passkey(passkey))
+        init_store(self.root)
+        get_encryption_key(self.key_file)
+        return self
+
+    def verify(self, passkey):
+        return verify_passkey(passkey, self.passkey_file)
+
+
+def workspace_for(name=None, workspaces_dir=None):
+    """The ``Workspace`` called ``name``
+
+    Without ``workspaces_dir`` there is only the default workspace in
+    ``diary_entries/``.
+    """
+    if workspaces_dir is None:
+        if name not in (None, DEFAULT_WORKSPACE):
+            raise ValueError("Only the default diary exists unless DIARY_WORKSPACES_DIR is set")
+        return Workspace(DEFAULT_WORKSPACE, DIARY_DIR)
+    name = check_workspace_name(name)
+    return Workspace(name, Path(workspaces_dir) / name)
+
+
+def list_workspaces(workspaces_dir):
+    """Workspaces created under ``workspaces_dir``, by name"""
+    workspaces_dir = Path(workspaces_dir)
+    if not workspaces_dir.is_dir():
+        return []
+    workspaces = []
+    for path in sorted(workspaces_dir.iterdir()):
+        if path.is_dir() and WORKSPACE_NAME_RE.fullmatch(path.name):
+            workspace = Workspace(path.name, path)
+            if workspace.exists():
+                workspaces.append(workspace)
+    return workspaces
+
+
+class OpenWorkspace:
+    """A workspace's writer, export queue, maintenance and cached read views"""
+
+    def __init__(self, workspace, export_executor=None, maintenance_interval=None):
+        self.workspace = workspace
+        init_store(workspace.root)
+        get_encryption_key(workspace.key_file)
+        self.writer = EntryWriter(workspace.entries_file)
+        self.exports = ExportQueue(workspace.exports_dir, executor=export_executor)
+        self.maintenance = MaintenanceScheduler(maintenance_interval, entries_file=workspace.entries_file,
+                                                writer=self.writer).start()
+        self.last_used = time.monotonic()
+        self._views = {}
+        self._building = {}
+        self._footprint = (None, 0)
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.workspace.name
+
+    # --- Read views ---
+    def _view(self, name, opener):
+        """The ``name`` view of the entry file, reopened only when the file changed"""
+        # Saves still being written are included
+        self.writer.flush()
+        signature = file_signature(self.workspace.entries_file)
+        with self._lock:
+            cached = self._views.get(name)
+            building = self._building.setdefault(name, threading.Lock())
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        # One session rebuilds a stale view; the others wait for it rather than
+        # writing the same index files at the same time
+        with building:
+            with self._lock:
+                cached = self._views.get(name)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+            view = opener(signature)
+            with self._lock:
+                # Replaced, not closed: another session may still be reading the old view
+                self._views[name] = (signature, view)
+        return view
+
+    def mapped_entries(self):
+        return self._view("mapped", lambda signature: open_mapped_entries(self.workspace.entries_file))
+
+    def related_index(self):
+        return self._view("vectors", lambda signature: open_vector_index(self.workspace.entries_file, signature))
+
+    def activity_index(self):
+        return self._view("activity", lambda signature: open_activity_index(self.workspace.entries_file, signature))
+
+    # --- Lifetime ---
+    def nbytes(self):
+        """Estimated memory held, mostly the writer's copy of the entries"""
+        signature = file_signature(self.workspace.entries_file)
+        if self._footprint[0] != signature:
+            self._footprint = (signature, store_size(self.workspace.entries_file))
+        size = self._footprint[1]
+        vectors = self._views.get("vectors")
+        if vectors is not None:
+            size += vectors[1].vectors.nbytes
+        return size
+
+    def busy(self):
+        """True while an export of this workspace is queued or running"""
+        return any(job.active for job in self.exports.jobs())
+
+    def close(self):
+        self.maintenance.stop()
+        self.writer.close()
+        self.exports.shutdown(wait=False)
+        with self._lock:
+            self._views.clear()
+
+
+class WorkspacePool:
+    """The open workspaces of a process, least recently used closed first"""
+
+    def __init__(self, workspaces_dir=None, max_bytes=DEFAULT_MAX_BYTES, max_open=DEFAULT_MAX_OPEN,
+                 export_workers=DEFAULT_WORKERS, maintenance_interval=None):
+        self.workspaces_dir = Path(workspaces_dir) if workspaces_dir else None
+        self.max_bytes = max_bytes
+        self.max_open = max_open
+        self.maintenance_interval = maintenance_interval
+        self._export_executor = ThreadPoolExecutor(max_workers=export_workers, thread_name_prefix="diary-export")
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        """A pool configured from the ``DIARY_*`` environment variables"""
+        hours = float(os.environ.get("DIARY_MAINTENANCE_HOURS", "24"))
+        max_mb = float(os.environ.get("DIARY_WORKSPACE_CACHE_MB", DEFAULT_MAX_BYTES / 2**20))
+        return cls(
+            workspaces_dir=os.environ.get("DIARY_WORKSPACES_DIR") or None,
+            max_bytes=int(max_mb * 2**20),
+            max_open=int(os.environ.get("DIARY_MAX_OPEN_WORKSPACES", DEFAULT_MAX_OPEN)),
+            export_workers=int(os.environ.get("DIARY_EXPORT_WORKERS", DEFAULT_WORKERS)),
+            maintenance_interval=hours * 3600 if hours > 0 else None,
+        )
+
+    @property
+    def multi(self):
+        """True when the pool serves a folder of workspaces rather than the default diary"""
+        return self.workspaces_dir is not None
+
+    def __len__(self):
+        return len(self._open)
+
+    def workspace(self, name=None):
+        return workspace_for(name, self.workspaces_dir)
+
+    def open(self, name=None):
+        """The ``OpenWorkspace`` for ``name``, opening it and closing idle ones as needed"""
+        workspace = self.workspace(name)
+        if self.multi and not workspace.exists():
+            raise FileNotFoundError(f"No diary called {workspace.name}")
+        with self._lock:
+            opened = self._open.get(workspace.name)
+            if opened is None:
+                opened = OpenWorkspace(workspace, self._export_executor, self.maintenance_interval)
+                self._open[workspace.name] = opened
+            else:
+                self._open.move_to_end(workspace.name)
+            opened.last_used = time.monotonic()
+            evicted = self._evict()
+        # Closing flushes pending saves, which must not hold up other sessions
+        for closing in evicted:
+            closing.close()
+        return opened
+
+    def nbytes(self):
+        with self._lock:
+            return sum(opened.nbytes() for opened in self._open.values())
+
+    def close(self):
+        with self._lock:
+            closing = list(self._open.values())
+            self._open.clear()
+        for opened in closing:
+            opened.close()
+        self._export_executor.shutdown(wait=False)
+
+    def _evict(self):
+        sizes = {name: opened.nbytes() for name, opened in self._open.items()}
+        total = sum(sizes.values())
+        now = time.monotonic()
+        evicted = []
+        for name, opened in list(self._open.items()):
+            if total <= self.max_bytes and len(self._open) <= self.max_open:
+                break
+            if now - opened.last_used < MIN_IDLE or opened.busy():
+                continue
+            del self._open[name]
+            total -= sizes[name]
+            evicted.append(opened)
+        return evicted
@@ -0,0 +1,217 @@
+"""Background writer that applies entry mutations off the UI thread.
+
+The Streamlit pages hand new, updated and deleted entries to an
+``EntryWriter`` and return immediately. A single worker thread applies
+queued mutations in order to an in-memory copy of the entry file and
+writes it once per batch, rewriting only the month shards the batch
+touched, so a save no longer costs the caller a full
+``load_entries`` + ``save_entries`` round trip. The in-memory copy is
+reloaded only when the file was changed by someone else (e.g. the CLI).
+After each write the ``entries.mmap`` read path is rebuilt from the same
+in-memory copy, so readers never have to parse the JSON file themselves.
+Each write also appends its create/update/delete events to the change
+feed, and only the entries those events name are applied to the
+related-entries vector index, the daily activity index, the revision
+history and any other subscriber.
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+from diary.activity import open_activity_index
+from diary.changefeed import ChangeFeed, entry_event
+from diary.maintenance import compact_entries
+from diary.model import Entry
+from diary.mmapstore import build_mapped_store, file_signature, mapped_path_for
+from diary.profiling import timed
+from diary.revisions import RevisionStore
+from diary.similarity import open_vector_index
+from diary.storage import ENTRIES_FILE, load_entries, save_entries, shard_key
+
+# Derived indexes kept in step with every write, by name
+INDEX_OPENERS = {
+    "vectors": open_vector_index,
+    "activity": open_activity_index,
+}
+
+
+class EntryWriter:
+    """Serialises entry mutations for one entry file through a worker thread"""
+
+    def __init__(self, entries_file=None):
+        self.entries_file = entries_file or ENTRIES_FILE
+        self._queue = queue.Queue()
+        self._entries = None
+        self._signature = None
+        self._indexes = {}
+        self.feed = ChangeFeed(self.entries_file)
+        # Every saved version is kept as a delta; see diary.revisions
+        self.revisions = RevisionStore(self.entries_file)
+        self.feed.subscribe(self.revisions.apply_events)
+        self._closed = False
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, name="diary-entry-writer", daemon=True)
+        self._thread.start()
+
+    # --- Public API ---
+    def add(self, entry):
+        """Queue a new entry; returns a Future resolved once it is on disk"""
+        return self._submit("add", entry)
+
+    def update(self, entry):
+        """Queue a replacement for the entry with the same ``id``"""
+        return self._submit("update", entry)
+
+    def delete(self, entry_id):
+        """Queue removal of the entry with ``entry_id``"""
+        return self._submit("delete", entry_id)
+
+    def compact(self):
+        """Queue a compaction; the Future resolves to the number of entries changed"""
+        return self._submit("compact", None)
+
+    def subscribe(self, hook):
+        """Call ``hook(events)`` on the worker thread after every write; see ``diary.changefeed``"""
+        return self.feed.subscribe(hook)
+
+    def flush(self, timeout=None):
+        """Block until every mutation queued so far has been written or has failed"""
+        self._submit("flush", None).result(timeout)
+
+    def close(self, timeout=None):
+        """Write everything queued so far and stop the worker thread"""
+        if self._closed:
+            return
+        self._closed = True
+        future = Future()
+        self._queue.put(("close", None, future))
+        future.result(timeout)
+
+    def snapshot(self):
+        """Entries as of the last write, loading the file if needed"""
+        self.flush()
+        return [dict(entry) for entry in self._entries or []]
+
+    # --- Worker ---
+    def _submit(self, op, payload):
+        if self._closed:
+            raise RuntimeError("The entry writer is closed")
+        future = Future()
+        self._queue.put((op, payload, future))
+        return future
+
+    def _current_entries(self):
+        signature = file_signature(self.entries_file)
+        if self._entries is None or signature != self._signature:
+            # A store that cannot be read fails the batch; saving on top of it would lose entries
+            self._entries = load_entries(self.entries_file, raise_errors=True) if signature != (0, -1) else []
+            self._signature = signature
+            # Changed by someone else since the last event: subscribers rebuild
+            self.feed.sync(signature)
+        return self._entries
+
+    def _apply(self, entries, op, payload):
+        """Apply one mutation
+
+        Returns ``(result, change events, touched shards)``; touched shards is
+        None when the whole store may have changed.
+        """
+        if op == "compact":
+            cleaned = {entry['id'] for entry in entries if 'image' in entry and not entry['image']}
+            changed, removed_ids = compact_entries(entries)
+            # Dropped duplicates leave the last copy of their id behind, so that is an update
+            touched = cleaned | set(removed_ids)
+            return changed, [entry_event("update", entry) for entry in entries if entry['id'] in touched], None
+        if op == "add":
+            entry = Entry(payload)
+            entries.append(entry)
+            return None, [entry_event("create", entry)], {shard_key(entry)}
+        elif op == "update":
+            for i, entry in enumerate(entries):
+                if entry['id'] == payload['id']:
+                    entries[i] = Entry(payload)
+                    # A changed date moves the entry to another month
+                    event = entry_event("update", entries[i], entry)
+                    return None, [event], {shard_key(entry), shard_key(entries[i])}
+            raise KeyError(f"Entry {payload['id']} not found")
+        elif op == "delete":
+            removed = [entry for entry in entries if entry['id'] == payload]
+            entries[:] = [entry for entry in entries if entry['id'] != payload]
+            events = [entry_event("delete", entry) for entry in removed[-1:]]
+            return None, events, {shard_key(entry) for entry in removed}
+
+    def _update_indexes(self, events, previous_signature):
+        """Apply only the changed entries to each derived index, then persist for readers"""
+        for name, opener in INDEX_OPENERS.items():
+            index = self._indexes.get(name)
+            try:
+                if index is None or index.source_signature != tuple(previous_signature):
+                    index = opener(self.entries_file, previous_signature)
+                for event in events:
+                    if event["op"] == "delete":
+                        index.remove(event["id"])
+                    else:
+                        index.upsert(event["entry"])
+                index.save(self.entries_file, self._signature)
+                self._indexes[name] = index
+            except Exception:
+                # The entries are saved; a stale index is rebuilt by the next reader
+                self._indexes.pop(name, None)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else is waiting so it lands in the same write
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            if any(op == "close" for op, _, _ in batch):
+                return
+
+    def _write_batch(self, batch):
+        try:
+            entries = self._current_entries()
+            previous_signature = self._signature
+            events = []
+            months = set()
+            changed = False
+            results = []
+            for op, payload, future in batch:
+                if op in ("flush", "close"):
+                    results.append((future, None, None))
+                    continue
+                try:
+                    result, op_events, op_months = self._apply(entries, op, payload)
+                    events.extend(op_events)
+                    months = None if months is None or op_months is None else months | op_months
+                    # A delete of an unknown id changes nothing
+                    changed = changed or bool(op_events)
+                    results.append((future, None, result))
+                except Exception as e:
+                    results.append((future, e, None))
+            if changed:
+                with timed("writer.save_entries", batch=len(batch)):
+                    # Only the months touched by this batch are rewritten
+                    save_entries(entries, self.entries_file, months=months, raise_errors=True)
+                self._signature = file_signature(self.entries_file)
+                # Keep the memory-mapped read path in step with the file
+                build_mapped_store(entries, mapped_path_for(self.entries_file), self._signature)
+                # Numbered and logged before the indexes see them, so a subscriber can resume from the log
+                self.feed.append(events, self._signature)
+                with timed("writer.indexes", changes=len(events)):
+                    self._update_indexes(events, previous_signature)
+        except Exception as e:
+            # Nothing of the batch was saved: its mutations fail, and the
+            # cached copy is dropped so the next batch starts from disk
+            self._entries = None
+            self.last_error = e
+            results = [(future, None if op in ("flush", "close") else e, None) for op, _, future in batch]
+        for future, error, result in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                self.last_error = error
+                future.set_exception(error)
@@ -1,38 +1,31 @@
 import streamlit as st
 from datetime import datetime
-import json
 import os
-from pathlib import Path
 import pandas as pd
-from textblob import TextBlob
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
 import plotly.express as px
+import plotly.graph_objects as go
 import base64
-from PIL import Image
-import io
 import time
-import hashlib
 import uuid
 from st_aggrid import AgGrid, GridOptionsBuilder
-import numpy as np
-from collections import Counter
-import re
-import tempfile
-import plotly.io as pio
-import markdown
-from bs4 import BeautifulSoup
-import html2text
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, PageBreak
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import emoji
-import requests
-import shutil
+from diary.reporting import set_error_reporter
+from diary.storage import (
+    hash_passkey,
+    check_passkey,
+    needs_rehash,
+)
+from diary.credentials import VerifiedKeyCache
+from diary.analysis import extract_keywords
+from diary.arcs import arc_points, update_arc
+from diary.profiling import configure_perf_log, start_run, run_timings, timed, profile_call
+from diary.frames import GRID_COLUMNS, mapped_dataframe
+from diary.activity import WEEKDAYS, load_goals, save_goals
+from diary.exports import FORMATS
+from diary.rendercache import DEFAULT_MAX_BYTES, RenderCache
+from diary.facets import facet_counts, select_rows
+from diary.workspaces import WorkspacePool
 
 # --- App Config ---
 st.set_page_config(
@@ -42,68 +35,17 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# --- Path Setup ---
-DIARY_DIR = Path("diary_entries")
-DIARY_DIR.mkdir(exist_ok=True)
-ENTRIES_FILE = DIARY_DIR / "entries.json"
-KEY_FILE = DIARY_DIR / ".encryption_key"
-PASSKEY_FILE = DIARY_DIR / ".passkey"
-
-# --- Encryption Setup ---
-def get_encryption_key():
-    """Generate or load encryption key"""
-    if not KEY_FILE.exists():
-        key = base64.urlsafe_b64encode(os.urandom(32))
-        with open(KEY_FILE, "wb") as f:
-            f.write(key)
-        return key
-    else:
-        with open(KEY_FILE, "rb") as f:
-            return f.read()
+# Surface errors from the diary package in the UI
+set_error_reporter(st.error)
 
-ENCRYPTION_KEY = get_encryption_key()
-
-def encrypt_data(data):
-    """Simple encryption for diary content"""
-    if not data:
-        return data
-    try:
-        # First encode as UTF-8, then base64
-        data_bytes = data.encode('utf-8')
-        return base64.urlsafe_b64encode(data_bytes).decode('utf-8')
-    except Exception:
-        # If encryption fails, return original data
-        return data
-
-def decrypt_data(encrypted_data):
-    """Decrypt diary content"""
-    if not encrypted_data:
-        return encrypted_data
-    try:
-        # Try to decode as base64 first
-        return base64.urlsafe_b64decode(encrypted_data.encode('utf-8')).decode('utf-8')
-    except Exception:
-        # If decryption fails, return original data
-        return encrypted_data
+# Structured timing log, enabled by pointing DIARY_PERF_LOG at a file
+configure_perf_log(os.environ.get("DIARY_PERF_LOG"))
 
 # --- Passkey Setup ---
-def hash_passkey(passkey):
-    """Hash the passkey for secure storage"""
-    return hashlib.sha256(passkey.encode()).hexdigest()
-
-def verify_passkey(passkey):
-    """Verify if the provided passkey is correct"""
-    if not PASSKEY_FILE.exists():
-        return False
-    
-    with open(PASSKEY_FILE, "r") as f:
-        stored_hash = f.read().strip()
-    
-    return hash_passkey(passkey) == stored_hash
-
 def setup_passkey():
     """Set up the passkey for the diary"""
-    if PASSKEY_FILE.exists():
+    passkey_file = get_workspace_pool().workspace().passkey_file
+    if passkey_file.exists():
         return True
     
     st.title("🔒 Set Up Your Diary Passkey")
@@ -124,7 +66,8 @@ def setup_passkey():
                 return False
             
             # Save the hashed passkey
-            with open(PASSKEY_FILE, "w") as f:
+            passkey_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(passkey_file, "w") as f:
                 f.write(hash_passkey(passkey))
             
             st.success("Passkey set successfully!")
@@ -140,7 +83,7 @@ def verify_passkey_input():
         submit = st.form_submit_button("Verify")
         
         if submit:
-            if verify_passkey(passkey):
+            if current_workspace().workspace.verify(passkey):
                 st.session_state['passkey_verified'] = True
                 st.success("Passkey verified!")
                 time.sleep(1)
@@ -151,54 +94,7 @@ def verify_passkey_input():
     
     return False
 
-# --- Initialize JSON File ---
-if not ENTRIES_FILE.exists():
-    with open(ENTRIES_FILE, "w") as f:
-        json.dump([], f)
-
-# --- Helper Functions ---
-def load_entries():
-    """Load all entries from JSON file with decryption"""
-    try:
-        with open(ENTRIES_FILE, "r") as f:
-            entries = json.load(f)
-            if not isinstance(entries, list):
-                entries = []
-            for entry in entries:
-                entry['content'] = decrypt_data(entry['content'])
-            return entries
-    except Exception as e:
-        st.error(f"Error loading entries: {str(e)}")
-        return []
-
-def save_entries(entries):
-    """Save entries to JSON file with encryption"""
-    if not isinstance(entries, list):
-        entries = []
-    entries_to_save = []
-    for entry in entries:
-        entry_copy = entry.copy()
-        entry_copy['content'] = encrypt_data(entry['content'])
-        entries_to_save.append(entry_copy)
-    
-    try:
-        with open(ENTRIES_FILE, "w") as f:
-            json.dump(entries_to_save, f, indent=2)
-    except Exception as e:
-        st.error(f"Error saving entries: {str(e)}")
-
-def analyze_sentiment(text):
-    """Get sentiment score (-1 to 1) with enhanced analysis"""
-    analysis = TextBlob(text)
-    # Additional metrics
-    subjectivity = analysis.sentiment.subjectivity
-    word_count = len(text.split())
-    return {
-        'polarity': analysis.sentiment.polarity,
-        'subjectivity': subjectivity,
-        'word_count': word_count
-    }
-
+# --- Chart Helpers ---
 def create_wordcloud(text):
     """Generate a word cloud with custom styling"""
     wordcloud = WordCloud(
@@ -233,478 +129,540 @@ def mood_timeline(df):
     )
     return fig
 
-def analyze_writing_habits(df):
-    """Analyze writing patterns"""
-    df['day_of_week'] = df['date'].dt.day_name()
-    df['hour'] = df['date'].dt.hour
-    df['month'] = df['date'].dt.month_name()
-    
-    # Most active days
-    day_counts = df['day_of_week'].value_counts().reset_index()
-    day_counts.columns = ['Day', 'Entries']
-    
-    # Most active hours
-    hour_counts = df['hour'].value_counts().reset_index()
-    hour_counts.columns = ['Hour', 'Entries']
-    
-    return day_counts, hour_counts
+# --- Form Helpers ---
+MOOD_OPTIONS = ["😭", "😔", "😐", "🙂", "😊", "😄"]
+TAG_OPTIONS = ["Personal", "Work", "Ideas", "Goals",
+               "Reflections", "Gratitude", "Challenges"]
+MARKDOWN_HELP = """
+                ### Markdown Formatting
+                You can use Markdown to format your diary entries:
+                
+                - **Bold text**: `**bold**`
+                - *Italic text*: `*italic*`
+                - # Heading 1: `# Heading`
+                - ## Heading 2: `## Subheading`
+                - ### Heading 3: `### Minor heading`
+                - Bullet points: `* item` or `- item`
+                - Numbered lists: `1. First item`
+                - [Links](https://example.com): `[Link text](URL)`
+                - `Code`: `` `code` ``
+                
+                Your formatting will be preserved in the PDF when you download it.
+                """
 
-def extract_keywords(text, n=10):
-    """Extract most common keywords (excluding stopwords)"""
-    words = re.findall(r'\b\w{3,}\b', text.lower())
-    stopwords = set(['the', 'and', 'that', 'have', 'for', 'not', 'with', 'this', 'but', 'just'])
-    words = [word for word in words if word not in stopwords]
-    return Counter(words).most_common(n)
+# Forms rerun only themselves when submitted. st.fragment is the stable
+# name from Streamlit 1.37; older releases only have the experimental one.
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
 
-def convert_markdown_to_text(markdown_text):
-    """Convert markdown to plain text for PDF"""
-    # First convert markdown to HTML
-    html = markdown.markdown(markdown_text, extensions=['tables', 'fenced_code'])
-    
-    # Then convert HTML to plain text while preserving some formatting
-    h = html2text.HTML2Text()
-    h.ignore_links = True
-    h.ignore_images = True
-    h.body_width = 0  # No wrapping
-    text = h.handle(html)
-    
-    # Clean up any remaining HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
-    
-    return text
+@st.cache_resource
+def get_workspace_pool():
+    """Open diaries of this process; see diary.workspaces for the DIARY_* settings"""
+    return WorkspacePool.from_environment()
 
-def convert_markdown_to_pdf_content(text):
-    """Convert markdown text to properly formatted PDF content"""
-    # Remove any existing HTML-like tags
-    text = re.sub(r'<[^>]+>', '', text)
-    
-    # Handle basic markdown formatting
-    formatted_text = text
-    
-    # Handle code blocks first (save them to preserve from other formatting)
-    code_blocks = []
-    def save_code(match):
-        code_blocks.append(match.group(1))
-        return f"CODE_BLOCK_{len(code_blocks)-1}"
-    
-    formatted_text = re.sub(r'`([^`]+)`', save_code, formatted_text)
-    
-    # Handle bold text (handle both ** and __ syntax)
-    bold_blocks = []
-    def save_bold(match):
-        bold_blocks.append(match.group(1))
-        return f"BOLD_BLOCK_{len(bold_blocks)-1}"
-    
-    formatted_text = re.sub(r'\*\*([^\*]+)\*\*', save_bold, formatted_text)
-    formatted_text = re.sub(r'__([^_]+)__', save_bold, formatted_text)
-    
-    # Handle italic text (handle both * and _ syntax)
-    italic_blocks = []
-    def save_italic(match):
-        italic_blocks.append(match.group(1))
-        return f"ITALIC_BLOCK_{len(italic_blocks)-1}"
-    
-    formatted_text = re.sub(r'\*([^\*]+)\*', save_italic, formatted_text)
-    formatted_text = re.sub(r'_([^_]+)_', save_italic, formatted_text)
-    
-    # Handle lists
-    formatted_text = re.sub(r'^\s*[\-\*]\s+(.+)$', r'• \1', formatted_text, flags=re.MULTILINE)
-    formatted_text = re.sub(r'^\s*(\d+)\.\s+(.+)$', r'\1. \2', formatted_text, flags=re.MULTILINE)
-    
-    # Clean up any remaining special characters
-    formatted_text = (formatted_text
-        .replace('&lt;', '<')
-        .replace('&gt;', '>')
-        .replace('&amp;', '&')
-        .replace('&quot;', '"')
-        .replace('&apos;', "'")
-        .replace('\\', '')
-    )
-    
-    # Restore code blocks
-    for i, code in enumerate(code_blocks):
-        formatted_text = formatted_text.replace(
-            f"CODE_BLOCK_{i}",
-            f'<font face="Courier">{code}</font>'
-        )
-    
-    # Restore bold blocks
-    for i, bold in enumerate(bold_blocks):
-        formatted_text = formatted_text.replace(
-            f"BOLD_BLOCK_{i}",
-            f'<b>{bold}</b>'
+def current_workspace():
+    """The diary this session signed in to, or the only one"""
+    return get_workspace_pool().open(st.session_state.get('workspace'))
+
+def get_entry_writer():
+    """Background entry writer of the current diary, shared by its sessions"""
+    return current_workspace().writer
+
+def mapped_entries():
+    """Memory-mapped entries, including saves that are still being written"""
+    return current_workspace().mapped_entries()
+
+def related_index():
+    """Vector index of the entries, including saves still being written"""
+    return current_workspace().related_index()
+
+def activity_index():
+    """Streaks and daily totals, including saves still being written"""
+    return current_workspace().activity_index()
+
+def choose_workspace():
+    """Sign in to a diary, or create one, when the app hosts several"""
+    pool = get_workspace_pool()
+    st.title("📔 Open Your Diary")
+    open_tab, create_tab = st.tabs(["Open", "Create"])
+    with open_tab, st.form("open_workspace_form"):
+        name = st.text_input("Diary name")
+        passkey = st.text_input("Passkey", type="password")
+        if st.form_submit_button("Open"):
+            try:
+                workspace = pool.workspace(name)
+            except ValueError:
+                workspace = None
+            if workspace is not None and workspace.exists() and workspace.verify(passkey):
+                st.session_state['workspace'] = workspace.name
+                st.rerun()
+            else:
+                st.error("Unknown diary or incorrect passkey")
+    with create_tab, st.form("create_workspace_form"):
+        name = st.text_input("Diary name", help="Letters, digits, '-' and '_'")
+        passkey = st.text_input("Passkey", type="password")
+        confirm_passkey = st.text_input("Confirm Passkey", type="password")
+        if st.form_submit_button("Create Diary"):
+            try:
+                workspace = pool.workspace(name)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            if not passkey:
+                st.error("Passkey cannot be empty")
+            elif passkey != confirm_passkey:
+                st.error("Passkeys do not match")
+            else:
+                try:
+                    workspace.create(passkey)
+                except FileExistsError:
+                    st.error("That name is taken")
+                    return
+                st.session_state['workspace'] = workspace.name
+                st.rerun()
+
+def switch_workspace():
+    """Sign out of the current diary, forgetting everything this session held for it"""
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    st.rerun()
+
+def show_streaks_and_goals(activity):
+    """Streak metrics, goal progress and the calendar heatmap"""
+    goals_file = current_workspace().workspace.goals_file
+    goals = load_goals(goals_file)
+    col1, col2, col3, col4 = st.columns(4)
+    progress = activity.goal_progress(goals)
+    with col1:
+        st.metric("Current Streak", f"{activity.current_streak()} days")
+    with col2:
+        st.metric("Longest Streak", f"{activity.longest_streak} days")
+    with col3:
+        done, target = progress["daily_words"]
+        st.metric("Words Today", f"{done} / {target}")
+        st.progress(min(done / target, 1.0) if target else 1.0)
+    with col4:
+        done, target = progress["weekly_entries"]
+        st.metric("Entries This Week", f"{done} / {target}")
+        st.progress(min(done / target, 1.0) if target else 1.0)
+
+    with st.expander("🎯 Goals"):
+        with st.form("goals_form"):
+            daily_words = st.number_input("Words per day", min_value=0, step=50,
+                                          value=int(goals["daily_words"]))
+            weekly_entries = st.number_input("Entries per week", min_value=0, max_value=50,
+                                             value=int(goals["weekly_entries"]))
+            if st.form_submit_button("Save Goals"):
+                save_goals({**goals, "daily_words": int(daily_words), "weekly_entries": int(weekly_entries)},
+                           goals_file)
+                st.rerun()
+
+    years = activity.years()
+    if not years:
+        return
+    col1, col2 = st.columns(2)
+    with col1:
+        year = st.selectbox("Year", years, key="heatmap_year")
+    with col2:
+        metric = st.radio("Show", ["entries", "words"], horizontal=True, key="heatmap_metric")
+    with timed("stats.calendar_heatmap"):
+        values, dates = activity.calendar(year, metric)
+        fig = go.Figure(go.Heatmap(
+            z=values, customdata=dates, y=list(WEEKDAYS), colorscale='Greens',
+            xgap=2, ygap=2, hoverongaps=False,
+            hovertemplate=f"%{{customdata}}: %{{z}} {metric}<extra></extra>",
+        ))
+        fig.update_layout(title=f'Writing Calendar {year}', height=260, yaxis_autorange='reversed',
+                          xaxis_showticklabels=False, margin=dict(t=40, b=10))
+        st.plotly_chart(fig, use_container_width=True)
+
+def show_entry_image(rendered, caption=None, width=400):
+    """The cached thumbnail of an entry's image"""
+    if rendered.thumbnail is None:
+        st.warning("The attached image could not be displayed")
+    else:
+        st.image(rendered.thumbnail, caption=caption, width=width)
+
+def show_emotional_arc(entry):
+    """Sentence and paragraph sentiment through the entry"""
+    with timed("view.arc"):
+        points = pd.DataFrame(arc_points(entry))
+    if len(points) < 2:
+        return
+    with st.expander("🎢 Emotional Arc"):
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=points['position'], y=points['polarity'], mode='lines+markers', name='Sentence',
+            customdata=points[['paragraph', 'sentence']],
+            hovertemplate="Paragraph %{customdata[0]}, sentence %{customdata[1]}: %{y:.2f}<extra></extra>",
+        ))
+        fig.add_trace(go.Scatter(
+            x=points['position'], y=points['paragraph_polarity'], mode='lines', name='Paragraph',
+            line=dict(shape='hv', dash='dash'), hoverinfo='skip',
+        ))
+        fig.update_layout(title='Sentiment by Sentence', xaxis_title='Sentence', yaxis_title='Polarity',
+                          yaxis_range=[-1.05, 1.05], height=300, margin=dict(t=40, b=10))
+        st.plotly_chart(fig, use_container_width=True)
+
+def show_entry_history(entry):
+    """Earlier saved versions of the entry and a diff between any two"""
+    with st.expander("🕘 History"):
+        revisions = get_entry_writer().revisions
+        with timed("view.history"):
+            history = revisions.history(entry['id'])
+        if len(history) < 2:
+            st.caption("No earlier versions yet.")
+            return
+        st.dataframe(
+            pd.DataFrame([
+                {"Revision": r['rev'], "Saved": r['at'][:16].replace("T", " "), "Title": r['title'], "Words": r['words']}
+                for r in reversed(history)
+            ]),
+            hide_index=True,
+            use_container_width=True
         )
-    
-    # Restore italic blocks
-    for i, italic in enumerate(italic_blocks):
-        formatted_text = formatted_text.replace(
-            f"ITALIC_BLOCK_{i}",
-            f'<i>{italic}</i>'
+        revs = [r['rev'] for r in history]
+        col1, col2 = st.columns(2)
+        with col1:
+            old_rev = st.selectbox("Compare revision", revs, index=len(revs) - 2, key=f"history_old_{entry['id']}")
+        with col2:
+            new_rev = st.selectbox("with revision", revs, index=len(revs) - 1, key=f"history_new_{entry['id']}")
+        with timed("view.history_diff"):
+            diff = revisions.diff(entry['id'], old_rev, new_rev)
+        st.code(diff or "No differences", language="diff")
+
+def show_related_entries(entry, df, mapped, k=5):
+    """List the entries whose wording is closest to ``entry``"""
+    with st.expander("🔗 Related Entries"):
+        with timed("view.related"):
+            related = related_index().similar(entry['id'], k)
+        if not related:
+            st.caption("No related entries yet.")
+        for related_id, score in related:
+            rows = df.index[df['id'] == related_id]
+            if len(rows):
+                row = df.loc[rows[0]]
+                st.write(f"**{row['date']:%Y-%m-%d}** - {row['title']} ({score:.0%} similar)")
+                # Rendering here also readies the entries most likely to be opened next
+                with timed("view.related_snippet"):
+                    st.caption(rendered_entry(mapped.entry(int(rows[0]))).snippet)
+
+def entry_filters(mapped):
+    """Sidebar tag/mood/month filters; returns the matching row numbers"""
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("🔎 Filter Entries")
+    facets = [
+        ("tag", "Tags", sorted(mapped.facets['tag'])),
+        ("mood", "Mood", sorted(mapped.facets['mood'], key=lambda m: MOOD_OPTIONS.index(m) if m in MOOD_OPTIONS else len(MOOD_OPTIONS))),
+        ("month", "Month", sorted(mapped.facets['month'], reverse=True)),
+    ]
+    # Drop selections that no longer exist (e.g. the last entry with a tag was deleted)
+    for facet, _, values in facets:
+        key = f"filter_{facet}"
+        st.session_state[key] = [v for v in st.session_state.get(key, []) if v in values]
+    
+    selection = {facet: st.session_state[f"filter_{facet}"] for facet, _, _ in facets}
+    with timed("view.facets"):
+        rows = select_rows(mapped, tags=selection['tag'], moods=selection['mood'], months=selection['month'])
+        counts = facet_counts(mapped, rows if any(selection.values()) else None)
+    
+    for facet, label, values in facets:
+        st.sidebar.multiselect(
+            label,
+            options=values,
+            key=f"filter_{facet}",
+            format_func=lambda v, c=counts[facet]: f"{v} ({c.get(v, 0)})"
         )
-    
-    return formatted_text
+    st.sidebar.caption(f"Showing {len(rows)} of {len(mapped)} entries")
+    return rows
 
-def setup_fonts():
-    """Download and setup DejaVu fonts for PDF generation"""
-    fonts_dir = Path("fonts")
-    fonts_dir.mkdir(exist_ok=True)
-    
-    # Updated URLs to the correct DejaVu font repository
-    font_files = {
-        'DejaVuSansCondensed.ttf': 'https://raw.githubusercontent.com/dejavu-fonts/dejavu-fonts/master/ttf/DejaVuSansCondensed.ttf',
-        'DejaVuSansCondensed-Bold.ttf': 'https://raw.githubusercontent.com/dejavu-fonts/dejavu-fonts/master/ttf/DejaVuSansCondensed-Bold.ttf',
-        'DejaVuSansCondensed-Oblique.ttf': 'https://raw.githubusercontent.com/dejavu-fonts/dejavu-fonts/master/ttf/DejaVuSansCondensed-Oblique.ttf'
-    }
-    
-    for font_file, url in font_files.items():
-        font_path = fonts_dir / font_file
-        if not font_path.exists():
-            try:
-                response = requests.get(url, stream=True)
-                response.raise_for_status()
-                with open(font_path, 'wb') as f:
-                    shutil.copyfileobj(response.raw, f)
-            except Exception as e:
-                st.error(f"Error downloading font {font_file}: {str(e)}")
-                return False
-    return True
+EXPORT_FORMATS = {
+    "pdf": "PDF",
+    "html": "HTML site (zip)",
+    "epub": "EPUB",
+    "markdown": "Markdown (zip)",
+}
+
+def mapped_rows(mapped, rows):
+    """Entries ``rows`` of ``mapped``, read lazily by an export job
+
+    Row numbers only mean something in the view they were taken from, so
+    the job reads from that view rather than the current file: a save
+    while the export is queued or running does not change what it reads.
+    """
+    def read():
+        for i in rows:
+            yield mapped.entry(i)
+    return read()
+
+@st.cache_resource
+def get_render_cache():
+    """Rendered entry views shared by every session; DIARY_RENDER_CACHE_MB bounds its size"""
+    max_mb = float(os.environ.get("DIARY_RENDER_CACHE_MB", DEFAULT_MAX_BYTES / 2**20))
+    return RenderCache(int(max_mb * 2**20))
+
+def rendered_entry(entry):
+    """The cached view of an entry of the current diary"""
+    return get_render_cache().get(entry, current_workspace().name)
+
+def get_export_queue():
+    """Background export jobs of the current diary; DIARY_EXPORT_WORKERS bounds them all"""
+    return current_workspace().exports
 
-def generate_pdf(selected_entries):
-    """Generate a beautiful PDF of selected diary entries using reportlab"""
-    # Create a temporary file for the PDF
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-        pdf_path = tmp.name
+def _polling_fragment(func, seconds=2):
+    """``func`` as a fragment that reruns itself every ``seconds``, where supported"""
+    decorator = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    return decorator(run_every=seconds)(func) if decorator else func
+
+EXPORTS_SHOWN = 5
+
+def prepare_download(job):
+    """Button callback: read one finished export for its download button
+
+    Only the export being downloaded is read, once, rather than every
+    finished one on every rerun.
+    """
+    try:
+        with open(job.path, "rb") as f:
+            st.session_state['export_download'] = (job.id, f.read())
+    except OSError as e:
+        st.session_state.pop('export_download', None)
+        st.session_state['export_download_error'] = f"{job.label}: {e}"
+
+def export_jobs_panel(polling=False):
+    """Progress of running exports and download buttons for finished ones"""
+    jobs = get_export_queue().jobs()
+    if polling and not any(job.active for job in jobs):
+        # Everything finished: a full rerun switches back to the static panel
+        st.rerun()
+    if not jobs:
+        st.caption("No exports yet.")
+        return
+    download_error = st.session_state.pop('export_download_error', None)
+    if download_error:
+        st.error(download_error)
+    for job in jobs[:EXPORTS_SHOWN]:
+        if job.active:
+            st.progress(job.progress, text=f"{job.label} ({job.status})")
+        elif job.status == "done":
+            prepared = st.session_state.get('export_download')
+            if prepared and prepared[0] == job.id:
+                st.download_button(
+                    label=f"⬇️ {job.label}",
+                    data=prepared[1],
+                    file_name=job.file_name,
+                    mime=job.mime,
+                    key=f"export_{job.id}"
+                )
+            else:
+                st.button(f"📦 {job.label}", key=f"prepare_{job.id}", help="Prepare the download",
+                          on_click=prepare_download, args=(job,))
+        else:
+            st.error(f"{job.label}: {job.error}")
+    if len(jobs) > EXPORTS_SHOWN:
+        st.caption(f"{len(jobs) - EXPORTS_SHOWN} older exports not shown.")
+    if any(not job.active for job in jobs) and st.button("Clear finished exports"):
+        get_export_queue().clear_finished()
+        st.session_state.pop('export_download', None)
+        st.rerun()
+
+@_polling_fragment
+def live_export_jobs_panel():
+    """The export panel, refreshed until every running export has finished"""
+    export_jobs_panel(polling=True)
+
+def show_export_jobs():
+    """Sidebar export list; refreshes itself while an export is running"""
+    if any(job.active for job in get_export_queue().jobs()):
+        live_export_jobs_panel()
+    else:
+        export_jobs_panel()
+
+def get_maintenance_scheduler():
+    """Background compaction/cleanup; DIARY_MAINTENANCE_HOURS=0 turns the schedule off"""
+    return current_workspace().maintenance
+
+def show_maintenance():
+    """Sidebar status of the last maintenance run with a manual trigger"""
+    scheduler = get_maintenance_scheduler()
+    if st.button("🧹 Run maintenance now"):
+        scheduler.run_soon()
+        st.caption("Maintenance started in the background.")
+    report = scheduler.last_report
+    if scheduler.last_error is not None:
+        st.error(f"Maintenance failed: {scheduler.last_error}")
+    elif report is not None:
+        st.caption(f"Last run {report.finished:%Y-%m-%d %H:%M}")
+        st.text("\n".join(report.lines()))
+    else:
+        st.caption("No maintenance run yet in this process.")
+
+def validate_entry_fields(title, content, tags, entry_passkey=None, require_passkey=False):
+    """Return the list of validation errors for an entry form"""
+    validation_errors = []
     
-    # Create the PDF document
-    doc = SimpleDocTemplate(
-        pdf_path,
-        pagesize=A4,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72
-    )
+    if not title:
+        validation_errors.append("Title is required")
     
-    # Get styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=1  # Center alignment
-    )
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=20,
-        alignment=1
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading3'],
-        fontSize=14,
-        spaceAfter=12
-    )
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=8,
-        allowWidows=0,
-        allowOrphans=0
-    )
-    code_style = ParagraphStyle(
-        'CustomCode',
-        parent=styles['Code'],
-        fontSize=10,
-        fontName='Courier',
-        spaceAfter=8,
-        allowWidows=0,
-        allowOrphans=0,
-        backColor=colors.lightgrey,
-        borderPadding=5
-    )
+    if not content:
+        validation_errors.append("Content is required")
     
-    # Prepare the story (content) for the PDF
-    story = []
-    temp_files = []  # Keep track of temporary files
+    if not tags:
+        validation_errors.append("At least one tag is required")
+        
+    if require_passkey and not entry_passkey:
+        validation_errors.append("Entry passkey is required")
     
-    try:
-        # Add cover page
-        story.append(Paragraph("My Personal Diary", title_style))
-        story.append(Spacer(1, 30))
-        story.append(Paragraph(f"Generated on: {datetime.now().strftime('%B %d, %Y')}", subtitle_style))
-        story.append(Paragraph(f"Selected Entries: {len(selected_entries)}", subtitle_style))
-        story.append(Spacer(1, 50))
+    return validation_errors
+
+def show_writer_error():
+    """Surface a failed background save on the next form run"""
+    writer = get_entry_writer()
+    if writer.last_error is not None:
+        st.error(f"Error saving entries: {writer.last_error}")
+        writer.last_error = None
+
+def verified_entries():
+    """This session's cache of recently verified entry passkeys"""
+    if 'verified_entries' not in st.session_state:
+        st.session_state['verified_entries'] = VerifiedKeyCache()
+    return st.session_state['verified_entries']
+
+def entry_is_verified(entry):
+    """True if this session verified the entry's passkey in the last few minutes"""
+    return verified_entries().is_verified(entry['id'], entry.get('passkey_hash'))
+
+def check_entry_passkey(entry, passkey):
+    """Run the KDF check once, remember the result and upgrade a legacy hash"""
+    if not check_passkey(passkey, entry.get('passkey_hash')):
+        return False
+    if needs_rehash(entry['passkey_hash']):
+        entry['passkey_hash'] = hash_passkey(passkey)
+        get_entry_writer().update(dict(entry))
+    verified_entries().add(entry['id'], entry['passkey_hash'])
+    return True
+
+# --- Main App Functions ---
+def reset_write_form():
+    """Put the new-entry form back to its defaults"""
+    st.session_state['write_title'] = ''
+    st.session_state['write_content'] = ''
+    st.session_state['write_passkey'] = ''
+    st.session_state['write_date'] = datetime.now().date()
+    st.session_state['write_mood'] = '🙂'
+    st.session_state['write_tags'] = []
+    # File uploaders cannot be cleared, so the next one gets a fresh key
+    st.session_state['write_image_key'] = st.session_state.get('write_image_key', 0) + 1
+
+def save_new_entry():
+    """Form callback: validate, analyse and hand the new entry to the writer"""
+    state = st.session_state
+    started = time.perf_counter()
+    with timed("write.save"):
+        title = state['write_title']
+        content = state['write_content']
+        tags = state['write_tags']
+        entry_passkey = state['write_passkey']
         
-        # Add entries
-        for entry in selected_entries:
-            # Add page break between entries
-            if len(story) > 0:
-                story.append(PageBreak())
-            
-            # Entry title
-            title = convert_markdown_to_pdf_content(entry['title'])
-            story.append(Paragraph(title, title_style))
-            story.append(Spacer(1, 12))
-            
-            # Date and mood
-            mood_text = emoji.demojize(entry['mood'], delimiters=('(', ')'))
-            story.append(Paragraph(f"Date: {entry['date']} | Mood: {mood_text}", normal_style))
-            
-            # Tags
-            tags = [tag for tag in entry['tags']]  # No need to convert tags
-            tags_text = ", ".join(tags)
-            story.append(Paragraph(f"Tags: {tags_text}", normal_style))
-            story.append(Spacer(1, 12))
-            
-            # Content
-            content = entry['content']
-            paragraphs = content.split('\n')
-            
-            in_code_block = False
-            code_block_content = []
-            
-            for para in paragraphs:
-                if para.strip():
-                    if para.startswith('```'):
-                        if in_code_block:
-                            # End of code block
-                            code_text = '\n'.join(code_block_content)
-                            story.append(Paragraph(code_text, code_style))
-                            code_block_content = []
-                            in_code_block = False
-                        else:
-                            # Start of code block
-                            in_code_block = True
-                    elif in_code_block:
-                        code_block_content.append(para)
-                    elif para.startswith('# '):
-                        story.append(Paragraph(para[2:].strip(), title_style))
-                    elif para.startswith('## '):
-                        story.append(Paragraph(para[3:].strip(), subtitle_style))
-                    elif para.startswith('### '):
-                        story.append(Paragraph(para[4:].strip(), heading_style))
-                    else:
-                        formatted_para = convert_markdown_to_pdf_content(para)
-                        story.append(Paragraph(formatted_para, normal_style))
-                    
-                    if not in_code_block:
-                        story.append(Spacer(1, 6))
-            
-            # Handle any remaining code block
-            if code_block_content:
-                code_text = '\n'.join(code_block_content)
-                story.append(Paragraph(code_text, code_style))
-            
-            # Add image if available
-            if entry.get('image'):
-                try:
-                    # Create a temporary file for the image
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as img_tmp:
-                        img_path = img_tmp.name
-                        temp_files.append(img_path)  # Add to list of temp files
-                        img_bytes = base64.b64decode(entry['image'])
-                        with open(img_path, 'wb') as f:
-                            f.write(img_bytes)
-                    
-                    # Add image to PDF
-                    if os.path.exists(img_path) and os.path.getsize(img_path) > 0:
-                        img = RLImage(img_path, width=6*inch, height=4*inch)
-                        story.append(Spacer(1, 12))
-                        story.append(img)
-                        story.append(Paragraph("Attached Image", normal_style))
-                except Exception as e:
-                    story.append(Paragraph(f"Image could not be included: {str(e)}", normal_style))
+        validation_errors = validate_entry_fields(title, content, tags, entry_passkey, require_passkey=True)
+        if validation_errors:
+            state['write_errors'] = validation_errors
+            return
         
-        # Build the PDF
-        doc.build(story)
-        return pdf_path
+        # Analyze content
+        analysed = {'content': content}
+        sentiment = update_arc(analysed)
+        keywords = extract_keywords(content)
         
-    except Exception as e:
-        st.error(f"Error generating PDF: {str(e)}")
-        if os.path.exists(pdf_path):
-            os.unlink(pdf_path)
-        return None
+        # Handle image
+        image_data = None
+        uploaded_image = state.get(f"write_image_{state['write_image_key']}")
+        if uploaded_image:
+            image_data = base64.b64encode(uploaded_image.read()).decode("utf-8")
         
-    finally:
-        # Clean up temporary files
-        for temp_file in temp_files:
-            try:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
-            except Exception as e:
-                print(f"Warning: Could not delete temporary file {temp_file}: {e}")
+        # Create entry
+        new_entry = {
+            "id": str(uuid.uuid4()),
+            "date": str(state['write_date']),
+            "timestamp": datetime.now().isoformat(),
+            "title": title,
+            "content": content,
+            "mood": state['write_mood'],
+            "tags": tags,
+            "sentiment": sentiment['polarity'],
+            "subjectivity": sentiment['subjectivity'],
+            "word_count": sentiment['word_count'],
+            "keywords": [kw[0] for kw in keywords],
+            "arc": analysed['arc'],
+            "image": image_data,
+            "passkey_hash": hash_passkey(entry_passkey)
+        }
+        
+        # Written in the background; the form does not wait for the disk
+        get_entry_writer().add(new_entry)
+        
+        # Store analysis in session state to persist after rerun
+        state['last_entry_analysis'] = {
+            'word_count': sentiment['word_count'],
+            'sentiment': sentiment['polarity'],
+            'subjectivity': sentiment['subjectivity'],
+            'keywords': keywords
+        }
+        state['write_saved_ms'] = (time.perf_counter() - started) * 1000
+        reset_write_form()
 
-# --- Main App Functions ---
 def write_entry():
     """Enhanced entry writing with writing analysis"""
     st.title("✍️ New Entry")
+    entry_form()
+
+@fragment
+def entry_form():
+    """New-entry form; submitting reruns only this fragment"""
+    if 'write_title' not in st.session_state:
+        reset_write_form()
     
-    # Initialize session state for form submission
-    if 'form_submitted' not in st.session_state:
-        st.session_state['form_submitted'] = False
-    
-    # Initialize session state for form values
-    if 'form_values' not in st.session_state:
-        st.session_state['form_values'] = {
-            'title': '',
-            'content': '',
-            'date': datetime.now(),
-            'mood': '🙂',
-            'tags': [],
-            'image': None,
-            'entry_passkey': ''
-        }
-    
-    with st.form("entry_form", clear_on_submit=True):
+    with st.form("entry_form"):
         col1, col2 = st.columns([3, 1])
         
         with col1:
-            title = st.text_input("Title", 
-                                value=st.session_state['form_values']['title'],
-                                placeholder="Entry title...")
-            content = st.text_area("Your Thoughts", 
-                                 value=st.session_state['form_values']['content'],
-                                 height=300, 
-                                 placeholder="Write freely...",
-                                 help="Your private space for reflection. Supports Markdown formatting!")
+            st.text_input("Title", key="write_title", placeholder="Entry title...")
+            st.text_area("Your Thoughts", 
+                         key="write_content",
+                         height=300, 
+                         placeholder="Write freely...",
+                         help="Your private space for reflection. Supports Markdown formatting!")
             
             # Add entry passkey field
-            entry_passkey = st.text_input("Entry Passkey", 
-                                        type="password",
-                                        value=st.session_state['form_values']['entry_passkey'],
-                                        help="Create a unique passkey for this entry. You'll need this to edit or delete this entry later.")
+            st.text_input("Entry Passkey", 
+                          type="password",
+                          key="write_passkey",
+                          help="Create a unique passkey for this entry. You'll need this to edit or delete this entry later.")
             
             # Add Markdown help
             with st.expander("Markdown Help"):
-                st.markdown("""
-                ### Markdown Formatting
-                You can use Markdown to format your diary entries:
-                
-                - **Bold text**: `**bold**`
-                - *Italic text*: `*italic*`
-                - # Heading 1: `# Heading`
-                - ## Heading 2: `## Subheading`
-                - ### Heading 3: `### Minor heading`
-                - Bullet points: `* item` or `- item`
-                - Numbered lists: `1. First item`
-                - [Links](https://example.com): `[Link text](URL)`
-                - `Code`: `` `code` ``
-                
-                Your formatting will be preserved in the PDF when you download it.
-                """)
+                st.markdown(MARKDOWN_HELP)
             
         with col2:
-            date = st.date_input("Date", value=st.session_state['form_values']['date'])
-            mood = st.select_slider("Mood", 
-                                  options=["😭", "😔", "😐", "🙂", "😊", "😄"],
-                                  value=st.session_state['form_values']['mood'])
-            tags = st.multiselect("Tags", 
-                                ["Personal", "Work", "Ideas", "Goals", 
-                                 "Reflections", "Gratitude", "Challenges"],
-                                default=st.session_state['form_values']['tags'])
+            st.date_input("Date", key="write_date")
+            st.select_slider("Mood", options=MOOD_OPTIONS, key="write_mood")
+            st.multiselect("Tags", TAG_OPTIONS, key="write_tags")
             
             # Image upload with preview
-            uploaded_image = st.file_uploader("Add Image", 
-                                            type=["jpg", "png", "jpeg"],
-                                            accept_multiple_files=False)
+            st.file_uploader("Add Image", 
+                             type=["jpg", "png", "jpeg"],
+                             accept_multiple_files=False,
+                             key=f"write_image_{st.session_state['write_image_key']}")
         
-        submitted = st.form_submit_button("Save Entry", use_container_width=True)
-        
-        if submitted:
-            # Validate required fields
-            validation_errors = []
-            
-            if not title:
-                validation_errors.append("Title is required")
-            
-            if not content:
-                validation_errors.append("Content is required")
-            
-            if not tags:
-                validation_errors.append("At least one tag is required")
-                
-            if not entry_passkey:
-                validation_errors.append("Entry passkey is required")
-            
-            # Display validation errors if any
-            if validation_errors:
-                st.error("\n".join(validation_errors))
-                st.session_state['form_submitted'] = False
-                
-                # Save current form values to session state
-                st.session_state['form_values'] = {
-                    'title': title,
-                    'content': content,
-                    'date': date,
-                    'mood': mood,
-                    'tags': tags,
-                    'image': uploaded_image,
-                    'entry_passkey': entry_passkey
-                }
-                return
-            
-            # If validation passes, set form_submitted to True
-            st.session_state['form_submitted'] = True
-            
-            # Analyze content
-            sentiment = analyze_sentiment(content)
-            keywords = extract_keywords(content)
-            
-            # Handle image
-            image_data = None
-            if uploaded_image:
-                image_data = base64.b64encode(uploaded_image.read()).decode("utf-8")
-            
-            # Create entry
-            new_entry = {
-                "id": str(uuid.uuid4()),
-                "date": str(date),
-                "timestamp": datetime.now().isoformat(),
-                "title": title,
-                "content": content,
-                "mood": mood,
-                "tags": tags,
-                "sentiment": sentiment['polarity'],
-                "subjectivity": sentiment['subjectivity'],
-                "word_count": sentiment['word_count'],
-                "keywords": [kw[0] for kw in keywords],
-                "image": image_data,
-                "passkey_hash": hash_passkey(entry_passkey)
-            }
-            
-            # Save entry
-            entries = load_entries()
-            entries.append(new_entry)
-            save_entries(entries)
-            
-            # Store analysis in session state to persist after rerun
-            st.session_state['last_entry_analysis'] = {
-                'word_count': sentiment['word_count'],
-                'sentiment': sentiment['polarity'],
-                'subjectivity': sentiment['subjectivity'],
-                'keywords': keywords
-            }
-            
-            # Reset form values
-            st.session_state['form_values'] = {
-                'title': '',
-                'content': '',
-                'date': datetime.now(),
-                'mood': '🙂',
-                'tags': [],
-                'image': None,
-                'entry_passkey': ''
-            }
-            
-            st.success("Entry saved successfully!")
+        st.form_submit_button("Save Entry", use_container_width=True, on_click=save_new_entry)
     
-    # Show success message if form was submitted successfully
-    if st.session_state['form_submitted']:
-        st.session_state['form_submitted'] = False
+    # Display validation errors or the save confirmation from the callback
+    validation_errors = st.session_state.pop('write_errors', None)
+    saved_ms = st.session_state.pop('write_saved_ms', None)
+    if validation_errors:
+        st.error("\n".join(validation_errors))
+    elif saved_ms is not None:
+        st.success(f"Entry saved successfully! ({saved_ms:.0f} ms)")
+    show_writer_error()
     
     # Show analysis from last entry if available
     if 'last_entry_analysis' in st.session_state:
@@ -729,52 +687,100 @@ def verify_entry_passkey(entry):
         submit = st.form_submit_button("Verify")
         
         if submit:
-            if hash_passkey(passkey) == entry['passkey_hash']:
-                st.session_state['passkey_verified'] = True
-                st.success("Passkey verified!")
-                time.sleep(1)
+            if check_entry_passkey(entry, passkey):
                 st.rerun()
             else:
                 st.error("Incorrect passkey")
                 return False
     return False
 
+def load_edit_form(entry):
+    """Fill the edit form's widget state from ``entry``"""
+    st.session_state['edit_entry_id'] = entry['id']
+    st.session_state['edit_title'] = entry['title']
+    st.session_state['edit_content'] = entry['content']
+    st.session_state['edit_date'] = datetime.strptime(entry['date'], '%Y-%m-%d').date()
+    st.session_state['edit_mood'] = entry['mood']
+    st.session_state['edit_tags'] = list(entry['tags'])
+    st.session_state['edit_image_key'] = st.session_state.get('edit_image_key', 0) + 1
+
+def remove_entry_image(entry):
+    """Button callback: drop the image; it is saved with the next Save Changes"""
+    entry['image'] = None
+
+def save_edited_entry(entry):
+    """Form callback: validate, analyse and hand the updated entry to the writer"""
+    state = st.session_state
+    started = time.perf_counter()
+    with timed("edit.save"):
+        title = state['edit_title']
+        content = state['edit_content']
+        tags = state['edit_tags']
+        
+        validation_errors = validate_entry_fields(title, content, tags)
+        if validation_errors:
+            state['edit_errors'] = validation_errors
+            return
+        
+        # Analyze content; only paragraphs changed since the last save are rescored
+        analysed = {'content': content, 'arc': entry.get('arc')}
+        sentiment = update_arc(analysed)
+        keywords = extract_keywords(content)
+        
+        # Handle image
+        image_data = entry.get('image')
+        uploaded_image = state.get(f"edit_image_{state['edit_image_key']}")
+        if uploaded_image:
+            image_data = base64.b64encode(uploaded_image.read()).decode("utf-8")
+        
+        # Update entry
+        entry['date'] = str(state['edit_date'])
+        entry['title'] = title
+        entry['content'] = content
+        entry['mood'] = state['edit_mood']
+        entry['tags'] = tags
+        entry['sentiment'] = sentiment['polarity']
+        entry['subjectivity'] = sentiment['subjectivity']
+        entry['word_count'] = sentiment['word_count']
+        entry['keywords'] = [kw[0] for kw in keywords]
+        entry['arc'] = analysed['arc']
+        entry['image'] = image_data
+        entry['last_edited'] = datetime.now().isoformat()
+        
+        # Written in the background; no reload of the whole diary here
+        get_entry_writer().update(dict(entry))
+        
+        # Set flag to redirect to view entries
+        state['redirect_to_view'] = True
+        state['edit_saved_ms'] = (time.perf_counter() - started) * 1000
+
+def cancel_edit():
+    """Form callback: leave the editor without saving"""
+    st.session_state['edit_cancelled'] = True
+
 def edit_entry(entry):
     """Edit an existing diary entry"""
     st.title("✏️ Edit Entry")
     
-    # Initialize session state for form submission
-    if 'edit_form_submitted' not in st.session_state:
-        st.session_state['edit_form_submitted'] = False
-    
-    # Initialize session state for form values
-    if 'edit_form_values' not in st.session_state:
-        st.session_state['edit_form_values'] = {
-            'title': entry['title'],
-            'content': entry['content'],
-            'date': datetime.strptime(entry['date'], '%Y-%m-%d'),
-            'mood': entry['mood'],
-            'tags': entry['tags'],
-            'image': None
-        }
-    
     # Check if passkey is verified
-    if 'passkey_verified' not in st.session_state or not st.session_state['passkey_verified']:
+    if not entry_is_verified(entry):
         st.warning("🔒 Please enter the entry passkey to edit this entry")
-        if verify_entry_passkey(entry):
-            return
+        verify_entry_passkey(entry)
         return
     
+    edit_form(entry)
+
+@fragment
+def edit_form(entry):
+    """Edit form; saving reruns only this fragment"""
+    if st.session_state.get('edit_entry_id') != entry['id'] or 'edit_title' not in st.session_state:
+        load_edit_form(entry)
+    
     # Handle image removal outside the form
     if entry.get('image'):
         st.write("Current Image:")
-        img_bytes = base64.b64decode(entry['image'])
-        st.image(Image.open(io.BytesIO(img_bytes)), width=200)
-        if st.button("Remove Image"):
-            entry['image'] = None
-            st.success("Image removed!")
-            time.sleep(1)
-            st.rerun()
+        show_entry_image(rendered_entry(entry), width=200)
+        st.button("Remove Image", on_click=remove_entry_image, args=(entry,))
     else:
         st.info("No image attached")
     
@@ -782,213 +788,127 @@ def edit_entry(entry):
         col1, col2 = st.columns([3, 1])
         
         with col1:
-            title = st.text_input("Title", value=st.session_state['edit_form_values']['title'])
-            content = st.text_area("Your Thoughts", 
-                                 value=st.session_state['edit_form_values']['content'], 
-                                 height=300)
+            st.text_input("Title", key="edit_title")
+            st.text_area("Your Thoughts", key="edit_content", height=300)
             
             # Add Markdown help
             with st.expander("Markdown Help"):
-                st.markdown("""
-                ### Markdown Formatting
-                You can use Markdown to format your diary entries:
-                
-                - **Bold text**: `**bold**`
-                - *Italic text*: `*italic*`
-                - # Heading 1: `# Heading`
-                - ## Heading 2: `## Subheading`
-                - ### Heading 3: `### Minor heading`
-                - Bullet points: `* item` or `- item`
-                - Numbered lists: `1. First item`
-                - [Links](https://example.com): `[Link text](URL)`
-                - `Code`: `` `code` ``
-                
-                Your formatting will be preserved in the PDF when you download it.
-                """)
+                st.markdown(MARKDOWN_HELP)
         
         with col2:
-            date = st.date_input("Date", value=st.session_state['edit_form_values']['date'])
-            mood = st.select_slider("Mood", 
-                                  options=["😭", "😔", "😐", "🙂", "😊", "😄"],
-                                  value=st.session_state['edit_form_values']['mood'])
-            tags = st.multiselect("Tags", 
-                                ["Personal", "Work", "Ideas", "Goals", 
-                                 "Reflections", "Gratitude", "Challenges"],
-                                default=st.session_state['edit_form_values']['tags'])
+            st.date_input("Date", key="edit_date")
+            st.select_slider("Mood", options=MOOD_OPTIONS, key="edit_mood")
+            st.multiselect("Tags", TAG_OPTIONS, key="edit_tags")
             
             # Image upload with preview
-            uploaded_image = st.file_uploader("Upload New Image", 
-                                            type=["jpg", "png", "jpeg"],
-                                            accept_multiple_files=False)
+            st.file_uploader("Upload New Image", 
+                             type=["jpg", "png", "jpeg"],
+                             accept_multiple_files=False,
+                             key=f"edit_image_{st.session_state['edit_image_key']}")
         
         # Form submit buttons
         col1, col2, col3 = st.columns([1, 1, 1])
         with col1:
-            save_button = st.form_submit_button("Save Changes", use_container_width=True)
+            st.form_submit_button("Save Changes", use_container_width=True,
+                                  on_click=save_edited_entry, args=(entry,))
         with col2:
-            cancel_button = st.form_submit_button("Cancel", use_container_width=True)
-        
-        if save_button:
-            # Validate required fields
-            validation_errors = []
-            
-            if not title:
-                validation_errors.append("Title is required")
-            
-            if not content:
-                validation_errors.append("Content is required")
-            
-            if not tags:
-                validation_errors.append("At least one tag is required")
-            
-            # Display validation errors if any
-            if validation_errors:
-                for error in validation_errors:
-                    st.error(error)
-                st.session_state['edit_form_submitted'] = False
-                
-                # Save current form values to session state
-                st.session_state['edit_form_values'] = {
-                    'title': title,
-                    'content': content,
-                    'date': date,
-                    'mood': mood,
-                    'tags': tags,
-                    'image': uploaded_image
-                }
-                return
-            
-            # If validation passes, set edit_form_submitted to True
-            st.session_state['edit_form_submitted'] = True
-            
-            # Analyze content
-            sentiment = analyze_sentiment(content)
-            keywords = extract_keywords(content)
-            
-            # Handle image
-            image_data = entry.get('image')
-            if uploaded_image:
-                image_data = base64.b64encode(uploaded_image.read()).decode("utf-8")
-            
-            # Update entry
-            entry['date'] = str(date)
-            entry['title'] = title
-            entry['content'] = content
-            entry['mood'] = mood
-            entry['tags'] = tags
-            entry['sentiment'] = sentiment['polarity']
-            entry['subjectivity'] = sentiment['subjectivity']
-            entry['word_count'] = sentiment['word_count']
-            entry['keywords'] = [kw[0] for kw in keywords]
-            entry['image'] = image_data
-            entry['last_edited'] = datetime.now().isoformat()
-            
-            # Save updated entries
-            entries = load_entries()
-            for i, e in enumerate(entries):
-                if e['id'] == entry['id']:
-                    entries[i] = entry
-                    break
-            save_entries(entries)
-            
-            # Set flag to redirect to view entries
-            st.session_state['redirect_to_view'] = True
-            
-            time.sleep(1)
-            st.rerun()
-        
-        elif cancel_button:
-            st.info("Editing cancelled")
-            time.sleep(1)
-            st.rerun()
-    
-    # Show success message if form was submitted successfully
-    if st.session_state['edit_form_submitted']:
-        st.success("Entry updated successfully!")
-        st.session_state['edit_form_submitted'] = False
+            st.form_submit_button("Cancel", use_container_width=True, on_click=cancel_edit)
+    
+    if st.session_state.pop('edit_cancelled', False):
+        del st.session_state['editing_entry']
+        st.session_state.pop('edit_entry_id', None)
+        st.rerun()
+    
+    # Display validation errors or the save confirmation from the callback
+    validation_errors = st.session_state.pop('edit_errors', None)
+    saved_ms = st.session_state.pop('edit_saved_ms', None)
+    if validation_errors:
+        for error in validation_errors:
+            st.error(error)
+    elif saved_ms is not None:
+        st.success(f"Entry updated successfully! ({saved_ms:.0f} ms)")
+    show_writer_error()
 
 def view_entries():
     """Advanced entry viewer with interactive table"""
     st.title("📖 Diary Entries")
     
-    entries = load_entries()
-    if not entries:
+    mapped = mapped_entries()
+    if not len(mapped):
         st.info("No entries found. Start writing!")
         return
     
-    # Convert to DataFrame for AgGrid
-    df = pd.DataFrame(entries)
-    df['date'] = pd.to_datetime(df['date'])
+    # Convert metadata to a DataFrame for AgGrid; bodies stay in the map
+    with timed("view.dataframe"):
+        all_df = mapped_dataframe(mapped)
     
-    # Ensure all required columns exist
-    required_columns = ['date', 'title', 'mood', 'tags', 'word_count', 'sentiment']
-    for col in required_columns:
-        if col not in df.columns:
-            if col == 'word_count':
-                df[col] = df['content'].apply(lambda x: len(str(x).split()))
-            elif col == 'sentiment':
-                df[col] = 0.0  # Default sentiment value
-            else:
-                df[col] = ''  # Default empty value for other columns
+    # Filtered rows keep their mapped row number as the index
+    df = all_df.iloc[entry_filters(mapped)]
+    if df.empty:
+        st.info("No entries match the selected filters.")
+        return
     
-    # Add selection for PDF download - single entry only
-    st.subheader("Download Entry as PDF")
-    selected_index = st.selectbox(
-        "Select an entry to download",
-        options=range(len(entries)),
-        format_func=lambda x: f"{entries[x]['date']} - {entries[x]['title']}"
-    )
+    # Exports run in the background; finished files wait under 📦 Exports
+    st.subheader("Export Entries")
+    col1, col2 = st.columns(2)
+    with col1:
+        export_format = st.selectbox(
+            "Format",
+            list(EXPORT_FORMATS),
+            format_func=EXPORT_FORMATS.get,
+            key="export_format"
+        )
+    with col2:
+        scope = st.radio(
+            "Entries",
+            ["Selected entry", f"All {len(df)} shown entries"],
+            horizontal=True,
+            key="export_scope"
+        )
+    if scope == "Selected entry":
+        selected_index = st.selectbox(
+            "Select an entry to download",
+            options=list(df.index),
+            format_func=lambda x: f"{df['date'].loc[x]:%Y-%m-%d} - {df['title'].loc[x]}"
+        )
     
-    if st.button("📥 Generate PDF"):
-        selected_entry = [entries[selected_index]]  # Create a list with just the selected entry
-        with st.spinner("Generating PDF..."):
-            pdf_path = generate_pdf(selected_entry)
-            
-            if pdf_path is None:
-                st.error("Failed to generate PDF. Please try again.")
-                return
-                
-            try:
-                # Read the PDF file
-                with open(pdf_path, "rb") as f:
-                    pdf_bytes = f.read()
-                
-                # Create download button
-                st.download_button(
-                    label="Click to Download PDF",
-                    data=pdf_bytes,
-                    file_name=f"diary_entry_{entries[selected_index]['date']}_{datetime.now().strftime('%Y%m%d')}.pdf",
-                    mime="application/pdf"
-                )
-                
-                # Clean up the temporary file
-                os.unlink(pdf_path)
-            except Exception as e:
-                st.error(f"Error processing PDF: {str(e)}")
-                if pdf_path and os.path.exists(pdf_path):
-                    try:
-                        os.unlink(pdf_path)
-                    except:
-                        pass
+    if st.button(f"📥 Generate {EXPORT_FORMATS[export_format]}"):
+        today = datetime.now().strftime('%Y%m%d')
+        extension = FORMATS[export_format][0]
+        if scope == "Selected entry":
+            rows = [selected_index]
+            label = df['title'].loc[selected_index]
+            file_name = f"diary_entry_{df['date'].loc[selected_index]:%Y-%m-%d}_{today}{extension}"
+        else:
+            rows = list(df.sort_values('date', kind='stable').index)
+            label = f"{len(rows)} entries"
+            file_name = f"diary_{today}{extension}"
+        try:
+            get_export_queue().submit(mapped_rows(mapped, rows), f"{label} ({export_format.upper()})", file_name,
+                                      export_format, total=len(rows))
+            st.success("Export started. Download it from 📦 Exports in the sidebar when it is ready.")
+        except RuntimeError as e:
+            st.warning(str(e))
     
     # Interactive table
-    gb = GridOptionsBuilder.from_dataframe(df[required_columns])
+    gb = GridOptionsBuilder.from_dataframe(df[GRID_COLUMNS])
     gb.configure_pagination(paginationAutoPageSize=False, paginationPageSize=10)
     gb.configure_selection('single', use_checkbox=True)
     gb.configure_columns(['date'], type=["customDateTimeFormat"], custom_format_string='yyyy-MM-dd')
     gb.configure_columns(['sentiment'], type=["numericColumn"], precision=2)
     grid_options = gb.build()
     
-    grid_response = AgGrid(
-        df,
-        gridOptions=grid_options,
-        height=400,
-        width='100%',
-        data_return_mode='FILTERED',
-        update_mode='MODEL_CHANGED',
-        fit_columns_on_grid_load=True,
-        theme='streamlit'
-    )
+    with timed("view.aggrid"):
+        grid_response = AgGrid(
+            df,
+            gridOptions=grid_options,
+            height=400,
+            width='100%',
+            data_return_mode='FILTERED',
+            update_mode='MODEL_CHANGED',
+            fit_columns_on_grid_load=True,
+            theme='streamlit'
+        )
     
     # Get selected rows and ensure it's a list
     selected_rows = grid_response.get('selected_rows', [])
@@ -998,7 +918,8 @@ def view_entries():
     # Show selected entry details
     if selected_rows and len(selected_rows) > 0:
         entry_id = selected_rows[0]['id']
-        entry = next((e for e in entries if e['id'] == entry_id), None)
+        matches = df.index[df['id'] == entry_id]
+        entry = mapped.entry(int(matches[0])) if len(matches) else None
         
         if entry:
             st.subheader(entry['title'])
@@ -1010,6 +931,8 @@ def view_entries():
             word_count = entry.get('word_count', len(entry['content'].split()))
             
             st.write(f"**Sentiment:** {sentiment:.2f} | **Words:** {word_count}")
+            show_emotional_arc(entry)
+            show_entry_history(entry)
             
             # Add edit button
             if st.button("✏️ Edit Entry"):
@@ -1017,15 +940,18 @@ def view_entries():
                 st.rerun()
             
             st.markdown("---")
-            # Display content with Markdown rendering
-            st.markdown(entry['content'])
+            # Content and image are rendered once per entry version
+            with timed("view.render"):
+                rendered = rendered_entry(entry)
+            st.markdown(rendered.html, unsafe_allow_html=True)
             
             if entry.get('image'):
                 st.markdown("---")
-                img_bytes = base64.b64decode(entry['image'])
-                st.image(Image.open(io.BytesIO(img_bytes)), caption="Attached Image", width=400)
+                show_entry_image(rendered, caption="Attached Image", width=400)
             
             st.markdown("---")
+            show_related_entries(entry, all_df, mapped)
+            
             
             # Initialize session state for delete confirmation
             if 'delete_confirmed' not in st.session_state:
@@ -1038,22 +964,27 @@ def view_entries():
                 
             # Show passkey verification if delete is confirmed
             if st.session_state.get('delete_confirmed', False) and st.session_state.get('entry_to_delete') == entry['id']:
-                st.warning("🔒 Please enter the entry passkey to delete this entry")
+                # A passkey verified in the last few minutes is not asked for again
+                verified = entry_is_verified(entry)
+                if verified:
+                    st.warning("🔒 Passkey verified recently - confirm to delete this entry")
+                else:
+                    st.warning("🔒 Please enter the entry passkey to delete this entry")
                 
                 with st.form("delete_entry_form"):
-                    passkey = st.text_input("Enter Entry Passkey", type="password")
+                    passkey = None if verified else st.text_input("Enter Entry Passkey", type="password")
                     submit = st.form_submit_button("Delete")
                     
                     if submit:
-                        if hash_passkey(passkey) == entry['passkey_hash']:
-                            entries = [e for e in entries if e['id'] != entry['id']]
-                            save_entries(entries)
+                        if verified or check_entry_passkey(entry, passkey):
+                            get_entry_writer().delete(entry['id'])
+                            get_render_cache().discard(entry['id'], current_workspace().name)
                             st.success("Entry deleted!")
                             
                             # Reset session state
                             st.session_state['delete_confirmed'] = False
                             st.session_state['entry_to_delete'] = None
-                            st.session_state['passkey_verified'] = False
+                            verified_entries().discard(entry['id'])
                             
                             time.sleep(1)
                             st.rerun()
@@ -1064,13 +995,13 @@ def show_stats():
     """Enhanced statistics dashboard"""
     st.title("📊 Diary Analytics")
     
-    entries = load_entries()
-    if not entries:
+    mapped = mapped_entries()
+    if not len(mapped):
         st.info("No data to analyze yet")
         return
     
-    df = pd.DataFrame(entries)
-    df['date'] = pd.to_datetime(df['date'])
+    with timed("stats.dataframe"):
+        df = mapped_dataframe(mapped)
     
     # KPI Cards
     st.subheader("Writing Summary")
@@ -1091,17 +1022,17 @@ def show_stats():
     
     tab1, tab2, tab3 = st.tabs(["Distribution", "Timeline", "Relationships"])
     
-    with tab1:
+    with tab1, timed("stats.mood_distribution"):
         mood_counts = df['mood'].value_counts().reset_index()
         fig1 = px.pie(mood_counts, values='count', names='mood', 
                      title='Mood Distribution', hole=0.3)
         st.plotly_chart(fig1, use_container_width=True)
     
-    with tab2:
+    with tab2, timed("stats.mood_timeline"):
         fig2 = mood_timeline(df)
         st.plotly_chart(fig2, use_container_width=True)
     
-    with tab3:
+    with tab3, timed("stats.word_count_vs_sentiment"):
         fig3 = px.scatter(df, x='word_count', y='sentiment', color='mood',
                          title='Word Count vs. Sentiment by Mood',
                          hover_data=['date', 'title'])
@@ -1111,17 +1042,23 @@ def show_stats():
     st.markdown("---")
     st.subheader("Writing Habits")
     
-    day_counts, hour_counts = analyze_writing_habits(df)
+    with timed("stats.activity"):
+        activity = activity_index()
+    show_streaks_and_goals(activity)
+    
+    # Days and hours from when each entry was written, not its diary date
+    day_counts = pd.DataFrame({'Day': list(WEEKDAYS), 'Entries': activity.weekday_counts()})
+    hour_counts = pd.DataFrame({'Hour': range(24), 'Entries': activity.hour_counts()})
     
     col1, col2 = st.columns(2)
     
-    with col1:
+    with col1, timed("stats.entries_by_day"):
         fig4 = px.bar(day_counts, x='Day', y='Entries', 
                       title='Entries by Day of Week',
                       color='Entries', color_continuous_scale='Blues')
         st.plotly_chart(fig4, use_container_width=True)
     
-    with col2:
+    with col2, timed("stats.entries_by_hour"):
         fig5 = px.bar(hour_counts, x='Hour', y='Entries',
                      title='Entries by Hour of Day',
                      color='Entries', color_continuous_scale='Greens')
@@ -1131,15 +1068,15 @@ def show_stats():
     st.markdown("---")
     st.subheader("Content Analysis")
     
-    all_text = " ".join(df['content'])
+    all_text = " ".join(mapped.iter_contents())
     
     if all_text.strip():
         tab1, tab2 = st.tabs(["Word Cloud", "Top Keywords"])
         
-        with tab1:
+        with tab1, timed("stats.wordcloud"):
             st.pyplot(create_wordcloud(all_text))
         
-        with tab2:
+        with tab2, timed("stats.top_keywords"):
             keywords = extract_keywords(all_text, 20)
             keywords_df = pd.DataFrame(keywords, columns=['Keyword', 'Count'])
             st.dataframe(keywords_df.sort_values('Count', ascending=False), 
@@ -1149,13 +1086,23 @@ def show_stats():
 
 # --- Main App ---
 def main():
+    start_run()
     st.sidebar.title("My Diary")
     st.sidebar.image("https://cdn-icons-png.flaticon.com/512/3281/3281289.png", width=100)
     
-    # Check if passkey is set up
-    if not PASSKEY_FILE.exists():
-        if not setup_passkey():
+    # Several diaries: sign in to one first. One diary: make sure it has a passkey
+    pool = get_workspace_pool()
+    if pool.multi:
+        # A diary removed on disk signs its sessions out
+        if 'workspace' not in st.session_state or not pool.workspace(st.session_state['workspace']).exists():
+            st.session_state.pop('workspace', None)
+            choose_workspace()
             return
+        st.sidebar.caption(f"Diary: **{st.session_state['workspace']}**")
+        if st.sidebar.button("Switch diary"):
+            switch_workspace()
+    elif not setup_passkey():
+        return
     
     # Check if we need to redirect to view entries
     if 'redirect_to_view' in st.session_state and st.session_state['redirect_to_view']:
@@ -1187,6 +1134,30 @@ def main():
     - Passkey protection
     """)
     
+    with st.sidebar.expander("📦 Exports"):
+        show_export_jobs()
+    
+    with st.sidebar.expander("🧹 Maintenance"):
+        show_maintenance()
+    
+    # Optional profiling panel, filled in after the page has rendered
+    profiling_panel = st.sidebar.expander("⏱️ Profiling")
+    with profiling_panel:
+        show_timings = st.checkbox("Show hot-path timings", key="profiling_timings")
+        capture_profile = st.checkbox("Capture cProfile per rerun", key="profiling_cprofile")
+    
+    profile_report = None
+    if capture_profile:
+        _, profile_report, _ = profile_call(render_page, page)
+    else:
+        render_page(page)
+    
+    if show_timings or profile_report:
+        with profiling_panel:
+            show_profiling(run_timings(), profile_report)
+
+def render_page(page):
+    """Render the selected page, or the editor when an entry is being edited"""
     # Check if we're editing an entry
     if 'editing_entry' in st.session_state:
         edit_entry(st.session_state['editing_entry'])
@@ -1201,5 +1172,21 @@ def main():
         elif page == "Statistics":
             show_stats()
 
+def show_profiling(timings, profile_report=None):
+    """Show this rerun's timings and, if captured, the cProfile report"""
+    if timings:
+        st.dataframe(
+            pd.DataFrame([
+                {"Step": "\u2003" * t['depth'] + t['name'], "ms": round(t['ms'], 1)}
+                for t in timings
+            ]),
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.caption("No instrumented steps ran on this rerun")
+    if profile_report:
+        st.code(profile_report, language=None)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
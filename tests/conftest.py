@@ -0,0 +1,26 @@
+import pytest
+
+from diary.storage import init_store
+
+
+@pytest.fixture
+def entries_file(tmp_path):
+    """An empty sharded store in a temporary diary folder"""
+    return init_store(tmp_path / "diary_entries")
+
+
+@pytest.fixture
+def new_entry():
+    """Build a minimal entry in the on-disk layout"""
+    def build(entry_id, date="2025-01-02", content=None, title=None):
+        return {
+            "id": entry_id,
+            "date": date,
+            "timestamp": f"{date}T10:00:00",
+            "title": title or entry_id,
+            "content": content if content is not None else f"Content of {entry_id}",
+            "mood": "🙂",
+            "tags": ["Personal"],
+            "passkey_hash": "hash",
+        }
+    return build
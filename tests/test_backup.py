@@ -0,0 +1,56 @@
+from diary.backup import create_snapshot, list_snapshots, restore_snapshot
+from diary.revisions import RevisionStore, revisions_dir_for
+from diary.storage import load_entries, shard_dir_for
+from diary.writer import EntryWriter
+
+
+def write(entries_file, *changes):
+    writer = EntryWriter(entries_file)
+    try:
+        for method, value in changes:
+            getattr(writer, method)(value).result()
+    finally:
+        writer.close()
+
+
+def files_in(folder, pattern):
+    return sorted(path.name for path in folder.glob(pattern))
+
+
+def test_restore_leaves_nothing_newer_than_the_snapshot(tmp_path, entries_file, new_entry):
+    diary_dir = entries_file.parent
+    target = tmp_path / "backups"
+    write(entries_file, ("add", new_entry("a", date="2025-01-02", content="Old text.")))
+    snapshot = create_snapshot(target, diary_dir)
+    shards = files_in(shard_dir_for(entries_file), "*.json")
+    logs = files_in(revisions_dir_for(entries_file), "*.jsonl")
+    assert shards and logs
+
+    write(entries_file,
+          ("update", new_entry("a", date="2025-01-02", content="Newer text.")),
+          ("add", new_entry("b", date="2025-03-04")))
+    assert files_in(shard_dir_for(entries_file), "*.json") != shards
+    assert files_in(revisions_dir_for(entries_file), "*.jsonl") != logs
+
+    restored = restore_snapshot(target, diary_dir)
+    assert restored["id"] == snapshot["id"]
+    assert files_in(shard_dir_for(entries_file), "*.json") == shards
+    assert files_in(revisions_dir_for(entries_file), "*.jsonl") == logs
+    assert [(e['id'], e['content']) for e in load_entries(entries_file)] == [("a", "Old text.")]
+    revisions = RevisionStore(entries_file)
+    assert [r['rev'] for r in revisions.history("a")] == [1]
+    assert revisions.revision("a")['content'] == "Old text."
+
+
+def test_restore_picks_the_snapshot_by_id(tmp_path, entries_file, new_entry):
+    diary_dir = entries_file.parent
+    target = tmp_path / "backups"
+    write(entries_file, ("add", new_entry("a")))
+    first = create_snapshot(target, diary_dir)
+    write(entries_file, ("add", new_entry("b")))
+    create_snapshot(target, diary_dir)
+    assert len(list_snapshots(target)) == 2
+
+    restore_snapshot(target, diary_dir, snapshot_id=first["id"])
+    assert [e['id'] for e in load_entries(entries_file)] == ["a"]
+    assert RevisionStore(entries_file).records("b") == []
@@ -0,0 +1,71 @@
+import pytest
+
+from diary.changefeed import ChangeFeed
+from diary.storage import load_entries
+from diary.writer import EntryWriter
+
+
+class IdIndex:
+    """A consumer keeping the set of entry ids, rebuilt from the store on a reset"""
+
+    def __init__(self, entries_file):
+        self.entries_file = entries_file
+        self.ids = set()
+        self.seen = []
+
+    def __call__(self, events):
+        for event in events:
+            self.seen.append(event["op"])
+            if event["op"] == "reset":
+                self.ids = {entry['id'] for entry in load_entries(self.entries_file)}
+            elif event["op"] == "delete":
+                self.ids.discard(event["id"])
+            else:
+                self.ids.add(event["id"])
+
+
+@pytest.fixture
+def writer(entries_file):
+    writer = EntryWriter(entries_file)
+    writer.feed.keep = 3
+    yield writer
+    writer.close()
+
+
+def test_consumer_inside_the_window_gets_only_new_events(entries_file, new_entry, writer):
+    writer.add(new_entry("a")).result()
+    index = IdIndex(entries_file)
+    ChangeFeed(entries_file).catch_up("index", index)
+
+    writer.add(new_entry("b")).result()
+    writer.delete("a").result()
+    index.seen.clear()
+    assert ChangeFeed(entries_file).catch_up("index", index) == 2
+    assert index.seen == ["create", "delete"]
+    assert index.ids == {"b"}
+
+
+def test_truncating_past_a_checkpoint_resets_the_consumer(entries_file, new_entry, writer):
+    writer.add(new_entry("a")).result()
+    writer.add(new_entry("b")).result()
+    feed = ChangeFeed(entries_file)
+    index = IdIndex(entries_file)
+    feed.catch_up("index", index)
+    checkpoint = feed.checkpoint("index")
+    assert index.ids == {"a", "b"}
+
+    # Enough writes for the log to drop the events right after the checkpoint
+    writer.delete("a").result()
+    for entry_id in "cdefgh":
+        writer.add(new_entry(entry_id)).result()
+    writer.delete("c").result()
+
+    events = list(feed.read(checkpoint))
+    assert events[1]["seq"] > checkpoint + 1
+    assert events[0] == {"op": "reset", "seq": events[1]["seq"] - 1}
+    # Applying only the events that are left would keep "a" and miss "d" to "f"
+    index.seen.clear()
+    feed.catch_up("index", index)
+    assert index.seen[0] == "reset"
+    assert index.ids == {entry['id'] for entry in load_entries(entries_file)} == set("bdefgh")
+    assert feed.checkpoint("index") == feed.last_seq
@@ -0,0 +1,56 @@
+import json
+
+from diary.cli import main
+from diary.storage import load_entries, read_manifest, save_entries, shard_dir_for
+
+
+def test_reindex_stops_on_an_unreadable_shard(entries_file, new_entry, capsys):
+    save_entries([new_entry("a", "2025-01-02"), new_entry("b", "2025-02-03")], entries_file)
+    (shard_dir_for(entries_file) / "2025-01.json").write_text('[{"id": "a"')
+    manifest = read_manifest(entries_file)
+
+    assert main(["--entries-file", str(entries_file), "reindex", "--engine", "lexicon"]) == 1
+
+    assert "Reindex failed" in capsys.readouterr().err
+    assert read_manifest(entries_file) == manifest
+    assert [e['id'] for e in load_entries(entries_file, since="2025-02-01")] == ["b"]
+
+
+def test_reindex_rewrites_every_entry(entries_file, new_entry):
+    save_entries([new_entry("a", "2025-01-02", content="A happy day"), new_entry("b", "2025-02-03")], entries_file)
+
+    assert main(["--entries-file", str(entries_file), "reindex", "--engine", "lexicon"]) == 0
+
+    assert all('sentiment' in e and 'arc' in e for e in load_entries(entries_file, raise_errors=True))
+
+
+def import_file(tmp_path, records):
+    path = tmp_path / "import.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    return str(path)
+
+
+def test_import_stops_on_an_unreadable_shard(tmp_path, entries_file, new_entry, capsys):
+    save_entries([new_entry("a", "2025-01-02"), new_entry("b", "2025-02-03")], entries_file)
+    (shard_dir_for(entries_file) / "2025-02.json").write_text('[{"id": "b"')
+    january = (shard_dir_for(entries_file) / "2025-01.json").read_text()
+    source = import_file(tmp_path, [{"title": "New", "content": "Imported", "date": "2025-01-20"}])
+
+    assert main(["--entries-file", str(entries_file), "import", source, "--workers", "1", "--engine", "lexicon"]) == 1
+
+    assert "Import failed" in capsys.readouterr().err
+    assert (shard_dir_for(entries_file) / "2025-01.json").read_text() == january
+
+
+def test_import_skips_records_with_invalid_dates(tmp_path, entries_file, new_entry, capsys):
+    save_entries([new_entry("a", "2025-01-02")], entries_file)
+    source = import_file(tmp_path, [
+        {"content": "Not a day", "date": "2025-02-30"},
+        {"content": "Not a date", "date": "yesterday"},
+        {"content": "A Day One timestamp", "date": "2025-01-20T08:30:00Z"},
+    ])
+
+    assert main(["--entries-file", str(entries_file), "import", source, "--workers", "1", "--engine", "lexicon"]) == 0
+
+    assert "Imported 1 entries (2 skipped)" in capsys.readouterr().out
+    assert sorted(e['date'] for e in load_entries(entries_file)) == ["2025-01-02", "2025-01-20"]
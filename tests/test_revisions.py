@@ -0,0 +1,88 @@
+import random
+
+from diary.revisions import KEYFRAME_INTERVAL, RevisionStore, apply_delta, make_delta
+from diary.writer import EntryWriter
+
+
+def edit(text, rng):
+    """``text`` with a word changed, a sentence added or a line removed"""
+    lines = text.split("\n")
+    i = rng.randrange(len(lines))
+    choice = rng.random()
+    if choice < 0.5:
+        words = lines[i].split(" ")
+        words[rng.randrange(len(words))] = f"word{rng.randrange(1000)}"
+        lines[i] = " ".join(words)
+    elif choice < 0.8 or len(lines) < 3:
+        lines.insert(i, f"A new sentence {rng.randrange(1000)} here.")
+    else:
+        del lines[i]
+    return "\n".join(lines)
+
+
+def test_delta_round_trips_edits():
+    rng = random.Random(1)
+    text = "\n".join(f"Line {i} of a fairly long entry with several words." for i in range(200))
+    for _ in range(50):
+        changed = edit(text, rng)
+        assert apply_delta(text, make_delta(text, changed)) == changed
+        text = changed
+    assert apply_delta("", make_delta("", "all new")) == "all new"
+    assert apply_delta("all gone", make_delta("all gone", "")) == ""
+
+
+def test_every_revision_rebuilds_from_its_delta_chain(entries_file, new_entry):
+    store = RevisionStore(entries_file)
+    rng = random.Random(2)
+    content = "\n".join(f"Paragraph {i} about the day and what happened." for i in range(100))
+    versions = []
+    for _ in range(3 * KEYFRAME_INTERVAL + 4):
+        content = edit(content, rng)
+        versions.append(content)
+        store.record(new_entry("a", content=content))
+
+    records = store.records("a")
+    assert [record['rev'] for record in records] == list(range(1, len(versions) + 1))
+    # Small edits are stored as deltas, with a keyframe every KEYFRAME_INTERVAL revisions
+    assert [i for i, record in enumerate(records) if 'full' in record] == list(range(0, len(versions), KEYFRAME_INTERVAL))
+    for rev, content in enumerate(versions, start=1):
+        assert store.revision("a", rev)['content'] == content
+    assert store.revision("a")['content'] == versions[-1]
+
+
+def test_unchanged_entry_records_nothing_and_fields_are_versioned(entries_file, new_entry):
+    store = RevisionStore(entries_file)
+    store.record(new_entry("a"))
+    assert store.record(new_entry("a")) is None
+
+    store.record(new_entry("a", title="Renamed"))
+    assert [r['title'] for r in store.history("a")] == ["a", "Renamed"]
+    assert "-title: a\n+title: Renamed" in store.diff("a", 1, 2)
+
+
+def test_writer_keeps_history_and_drops_it_on_delete(entries_file, new_entry):
+    writer = EntryWriter(entries_file)
+    try:
+        writer.add(new_entry("a", content="First draft.")).result()
+        writer.update(new_entry("a", content="First draft. Then more.")).result()
+        assert [r['rev'] for r in writer.revisions.history("a")] == [1, 2]
+        assert "+Then more." in writer.revisions.diff("a", 1, 2)
+
+        writer.delete("a").result()
+        assert writer.revisions.records("a") == []
+    finally:
+        writer.close()
+
+
+def test_first_edit_of_an_entry_without_history_keeps_the_old_version(entries_file, new_entry):
+    from diary.storage import save_entries
+    # Saved without the writer, e.g. by an import, so no revision exists yet
+    save_entries([new_entry("a", content="Imported text.")], entries_file)
+    writer = EntryWriter(entries_file)
+    try:
+        writer.update(new_entry("a", content="Edited text.")).result()
+    finally:
+        writer.close()
+
+    store = RevisionStore(entries_file)
+    assert [store.revision("a", rev)['content'] for rev in (1, 2)] == ["Imported text.", "Edited text."]
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from diary.storage import load_entries, read_manifest, save_entries, shard_dir_for
+
+
+def shard_path(entries_file, month):
+    return shard_dir_for(entries_file) / f"{month}.json"
+
+
+def test_round_trip_keeps_entries_and_shards_by_month(entries_file, new_entry):
+    entries = [new_entry("a", "2025-01-02"), new_entry("b", "2025-02-03", content="Ünïcode ✍️")]
+    save_entries(entries, entries_file)
+
+    loaded = load_entries(entries_file)
+    assert [(e['id'], e['date'], e['content']) for e in loaded] == [
+        ("a", "2025-01-02", "Content of a"), ("b", "2025-02-03", "Ünïcode ✍️")]
+    assert sorted(read_manifest(entries_file)["shards"]) == ["2025-01", "2025-02"]
+    # Content is stored encrypted, not as typed
+    assert "Content of a" not in shard_path(entries_file, "2025-01").read_text()
+
+
+def test_load_range_reads_only_overlapping_months(entries_file, new_entry):
+    save_entries([new_entry("a", "2025-01-02"), new_entry("b", "2025-03-04")], entries_file)
+    shard_path(entries_file, "2025-01").write_text("not json")
+
+    assert [e['id'] for e in load_entries(entries_file, since="2025-03-01", raise_errors=True)] == ["b"]
+
+
+def test_partial_save_rewrites_only_the_given_months(entries_file, new_entry):
+    save_entries([new_entry("a", "2025-01-02"), new_entry("b", "2025-02-03")], entries_file)
+    february = shard_path(entries_file, "2025-02").read_bytes()
+
+    # A stale copy of February must not be written when only January is saved
+    entries = [new_entry("a", "2025-01-02", content="edited"), new_entry("c", "2025-01-05")]
+    save_entries(entries, entries_file, months={"2025-01"})
+
+    assert shard_path(entries_file, "2025-02").read_bytes() == february
+    assert {e['id']: e['content'] for e in load_entries(entries_file)} == {
+        "a": "edited", "c": "Content of c", "b": "Content of b"}
+    assert read_manifest(entries_file)["shards"]["2025-01"]["count"] == 2
+
+
+def test_partial_save_drops_a_month_left_without_entries(entries_file, new_entry):
+    save_entries([new_entry("a", "2025-01-02"), new_entry("b", "2025-02-03")], entries_file)
+
+    save_entries([new_entry("b", "2025-02-03")], entries_file, months={"2025-01"})
+
+    assert not shard_path(entries_file, "2025-01").exists()
+    assert list(read_manifest(entries_file)["shards"]) == ["2025-02"]
+
+
+def test_corrupt_shard_is_reported_or_raised(entries_file, new_entry, capsys):
+    save_entries([new_entry("a", "2025-01-02"), new_entry("b", "2025-02-03")], entries_file)
+    shard_path(entries_file, "2025-01").write_text('[{"id": "a"')
+
+    assert load_entries(entries_file) == []
+    assert "Error loading entries" in capsys.readouterr().err
+    with pytest.raises(ValueError):
+        load_entries(entries_file, raise_errors=True)
+
+
+def test_shard_that_is_not_a_list_is_unreadable(entries_file, new_entry):
+    save_entries([new_entry("a", "2025-01-02")], entries_file)
+    shard_path(entries_file, "2025-01").write_text(json.dumps({"id": "a"}))
+
+    with pytest.raises(ValueError):
+        load_entries(entries_file, raise_errors=True)
+
+
+def test_full_rewrite_never_removes_an_unreadable_shard(entries_file, new_entry):
+    save_entries([new_entry("a", "2025-01-02"), new_entry("b", "2025-02-03")], entries_file)
+    shard_path(entries_file, "2025-01").write_text('[{"id": "a"')
+    manifest = entries_file.read_text()
+
+    # What a caller that ignored the load error would save
+    with pytest.raises(ValueError):
+        save_entries([], entries_file, raise_errors=True)
+
+    assert entries_file.read_text() == manifest
+    assert shard_path(entries_file, "2025-01").read_text() == '[{"id": "a"'
+    assert shard_path(entries_file, "2025-02").exists()
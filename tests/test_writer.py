@@ -0,0 +1,63 @@
+import pytest
+
+from diary import storage
+from diary.changefeed import ChangeFeed
+from diary.mmapstore import mapped_path_for, open_mapped_entries
+from diary.storage import load_entries, shard_dir_for
+from diary.writer import EntryWriter
+
+
+@pytest.fixture
+def writer(entries_file):
+    writer = EntryWriter(entries_file)
+    yield writer
+    writer.close()
+
+
+def test_mutations_reach_the_store_feed_and_mapped_view(writer, entries_file, new_entry):
+    writer.add(new_entry("a", "2025-01-02")).result()
+    writer.add(new_entry("b", "2025-02-03")).result()
+    writer.update(new_entry("a", "2025-03-04", content="moved")).result()
+    writer.delete("b").result()
+
+    assert [(e['id'], e['date'], e['content']) for e in load_entries(entries_file)] == [("a", "2025-03-04", "moved")]
+    # The store was created before the feed, so the feed starts with a reset
+    assert [e["op"] for e in ChangeFeed(entries_file).read()] == ["reset", "create", "create", "update", "delete"]
+    with open_mapped_entries(entries_file) as mapped:
+        assert [mapped.entry(i)['id'] for i in range(len(mapped))] == ["a"]
+    # The moved entry's old month is gone with the last entry in it
+    assert sorted(p.name for p in shard_dir_for(entries_file).iterdir()) == ["2025-03.json"]
+
+
+def test_failed_save_fails_the_batch_and_records_nothing(writer, entries_file, new_entry, monkeypatch):
+    writer.add(new_entry("a")).result()
+    mapped = mapped_path_for(entries_file).read_bytes()
+    last_seq = ChangeFeed(entries_file).last_seq
+
+    def disk_full(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(storage, "_save_shards", disk_full)
+    with pytest.raises(OSError):
+        writer.add(new_entry("b")).result()
+    monkeypatch.undo()
+
+    assert isinstance(writer.last_error, OSError)
+    assert ChangeFeed(entries_file).last_seq == last_seq
+    assert mapped_path_for(entries_file).read_bytes() == mapped
+    # The next batch starts from disk, without the entry that failed
+    writer.add(new_entry("c")).result()
+    assert [e['id'] for e in load_entries(entries_file)] == ["a", "c"]
+
+
+def test_unreadable_shard_fails_the_batch_without_overwriting(writer, entries_file, new_entry):
+    writer.add(new_entry("a", "2025-01-02")).result()
+    shard = shard_dir_for(entries_file) / "2025-01.json"
+    shard.write_text('[{"id": "a"')
+    # Written by someone else, so the writer reloads
+    entries_file.touch()
+
+    future = writer.add(new_entry("b", "2025-01-05"))
+    writer.flush()
+
+    assert isinstance(future.exception(), ValueError)
+    assert shard.read_text() == '[{"id": "a"'